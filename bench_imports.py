@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Benchmark the startup of the command-line entry points (`<script> --help`).
+
+For each entry point, report the best time over several runs (minus the
+startup time of the bare interpreter), and the heavy modules that it loaded.
+Exit with status 1 if an entry point exceeds its time budget, or loads a heavy
+module (these should be imported lazily, see `objectools.lazy_import`).
+
+USAGE:
+
+./bench_imports.py [-r <repeat>] [-b <budget>] [<module> ...]
+"""
+
+
+import sys
+import os
+import os.path as op
+import subprocess
+from time import perf_counter
+import argparse as ap
+import logging
+logger = logging.getLogger(__name__)
+
+
+ROOT = op.dirname(op.abspath(__file__))
+
+# Modules that the entry points must not import just to start.
+HEAVY_MODULES = ('ete3', 'Bio', 'matplotlib', 'pandas', 'scipy', 'statsmodels',
+                 'seaborn', 'sklearn', 'LibsDyogen', 'datasci.graphs')
+
+# module: budget (seconds on top of the interpreter startup)
+BUDGET = 0.5
+ENTRY_POINTS = {'genetree_drawer': BUDGET,
+                'genchron.analyse.generate_dNdStable': BUDGET,
+                'genchron.subtrees_stats': BUDGET,
+                'genchron.prune2family': BUDGET,
+                'genchron.find_non_overlapping_codeml_results': BUDGET,
+                'dendro.reconciledtree2paralogytree': BUDGET,
+                'seqtools.compo_freq': BUDGET,
+                'seqtools.fasta_translate': BUDGET,
+                'seqtools.fillpositions': BUDGET,
+                'seqtools.plot_al_conservation': BUDGET,
+                'seqtools.printal': BUDGET,
+                'seqtools.seqconv': BUDGET,
+                'seqtools.seqname_grep': BUDGET,
+                'seqtools.specify': BUDGET,
+                'seqtools.ungap': BUDGET,
+                'cmdserver': BUDGET}
+
+# Run the module like `python -m <module> --help`, then list the heavy modules.
+HELP_SNIPPET = """
+import sys, runpy
+sys.argv = [%(module)r, '--help']
+sys.stdout = open(%(devnull)r, 'w')
+try:
+    runpy.run_module(%(module)r, run_name='__main__', alter_sys=True)
+except SystemExit:
+    pass
+sys.stdout = sys.__stdout__
+heavy = %(heavy)r
+print(' '.join(sorted(name for name in sys.modules
+                      if name in heavy or name.split('.')[0] in heavy)))
+"""
+
+
+def run_python(code, env=None):
+    """Return the wall time and the completed process of `python -c code`."""
+    start = perf_counter()
+    proc = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    return perf_counter() - start, proc
+
+
+def python_env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT] + [p for p in
+                            env.get('PYTHONPATH', '').split(os.pathsep) if p])
+    return env
+
+
+def interpreter_startup(repeat=5, env=None):
+    return min(run_python('pass', env)[0] for _ in range(repeat))
+
+
+def bench_entry_point(module, repeat=5, env=None):
+    """Return (best time, loaded heavy modules, error message or None)."""
+    code = HELP_SNIPPET % {'module': module, 'devnull': os.devnull,
+                           'heavy': HEAVY_MODULES}
+    times = []
+    for _ in range(repeat):
+        elapsed, proc = run_python(code, env)
+        if proc.returncode != 0:
+            return None, [], (proc.stderr.strip().splitlines() or ['?'])[-1]
+        times.append(elapsed)
+    return min(times), proc.stdout.split(), None
+
+
+def main(modules=None, repeat=5, budget=None):
+    env = python_env()
+    base = interpreter_startup(repeat, env)
+    print('# interpreter startup: %.3f s' % base)
+    print('module\tstartup\tbudget\theavy_modules\tstatus')
+    failed = 0
+    for module in (modules or ENTRY_POINTS):
+        limit = budget or ENTRY_POINTS.get(module, BUDGET)
+        elapsed, heavy, error = bench_entry_point(module, repeat, env)
+        if error is not None:
+            # Missing dependency in this environment: not a startup regression.
+            status = 'ERROR ' + error
+            print('%s\t-\t%.2f\t-\t%s' % (module, limit, status))
+            continue
+        elapsed -= base
+        status = 'ok'
+        if elapsed > limit:
+            status = 'SLOW'
+        elif heavy:
+            status = 'HEAVY'
+        failed += status != 'ok'
+        print('%s\t%.3f\t%.2f\t%s\t%s' % (module, elapsed, limit,
+                                          ','.join(heavy) or '-', status))
+    return failed
+
+
+if __name__ == '__main__':
+    parser = ap.ArgumentParser(description=__doc__,
+                               formatter_class=ap.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*',
+                        help='entry points as module names [all known]')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='number of runs, the best time is kept [%(default)s]')
+    parser.add_argument('-b', '--budget', type=float,
+                        help='time budget in seconds for all modules '
+                             '[%.2f, or per module]' % BUDGET)
+    args = parser.parse_args()
+    sys.exit(1 if main(**vars(args)) else 0)
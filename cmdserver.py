@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Run Organon commands through a persistent local server (Unix socket).
+
+The server imports the command modules once and keeps their data loaded
+(species trees, identifier conversion tables). Each request is run in a
+forked child, in the working directory and with the stdin/stdout/stderr of
+the client, so that the client behaves like the script itself:
+
+    ./cmdserver.py serve &
+    ./cmdserver.py specify in.mfa out.mfa   # same as seqtools/specify.py in.mfa out.mfa
+    ./cmdserver.py stop
+
+Without a running server, the client runs the command locally.
+Environment variables of the client are not transmitted to the server.
+"""
+
+
+# Only the standard library at the top: the client must start fast.
+import sys
+import os
+import os.path as op
+import json
+import socket
+import struct
+import argparse as ap
+import logging
+logger = logging.getLogger(__name__)
+
+
+# command: module providing `make_parser()`, `main(argv=None)` and optionally
+# `preload(args)`, which loads the shared data in the server before forking.
+COMMANDS = {'fasta_translate':      'seqtools.fasta_translate',
+            'specify':              'seqtools.specify',
+            'treebest2genomicus':   'dendro.treebest2genomicus',
+            'time_fromspeciestree': 'dendro.time_fromspeciestree',
+            'prot2gene':            'ensembltools.prot2gene'}
+
+STOP = '_stop'
+STATUS = struct.Struct('!i')  # Exit status sent back to the client.
+HEADER = struct.Struct('!I')  # Length of the request.
+CREDENTIALS = struct.Struct('3i')  # pid, uid, gid of SO_PEERCRED.
+
+
+def default_socket_path():
+    rundir = os.environ.get('XDG_RUNTIME_DIR')
+    if rundir:
+        return op.join(rundir, 'organon-cmdserver-%d.sock' % os.getuid())
+    # /tmp is shared: use a directory only accessible by the user (see `serve`).
+    return op.join('/tmp', 'organon-cmdserver-%d' % os.getuid(), 'server.sock')
+
+SOCKET_PATH = os.environ.get('ORGANON_SOCKET') or default_socket_path()
+
+
+def import_command(command):
+    import importlib
+    return importlib.import_module(COMMANDS[command])
+
+
+def exit_status(err):
+    """Convert the code of a SystemExit to an integer, like the interpreter."""
+    if err.code is None:
+        return 0
+    if isinstance(err.code, int):
+        return err.code
+    print(err.code, file=sys.stderr)
+    return 1
+
+
+def run_local(command, argv):
+    """Run the command in this process. Return the exit status."""
+    module = import_command(command)
+    sys.argv = [op.basename(module.__file__)] + list(argv)
+    try:
+        return module.main(argv) or 0
+    except SystemExit as err:
+        return exit_status(err)
+
+
+### Client
+
+def _usable_fds(fds):
+    """Replace closed file descriptors by /dev/null"""
+    usable = []
+    for fd in fds:
+        try:
+            os.fstat(fd)
+        except OSError:
+            fd = os.open(os.devnull, os.O_RDWR)
+        usable.append(fd)
+    return usable
+
+
+def check_server_owner(sock, socket_path):
+    """Raise PermissionError unless the server runs as the current user, since
+    it receives our file descriptors."""
+    uid = os.getuid()
+    if os.lstat(socket_path).st_uid != uid:
+        raise PermissionError('Socket %s not owned by the current user.' % socket_path)
+    if hasattr(socket, 'SO_PEERCRED'):
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                CREDENTIALS.size)
+        _, peer_uid, _ = CREDENTIALS.unpack(creds)
+        if peer_uid != uid:
+            raise PermissionError('Server at %s run by another user.' % socket_path)
+
+
+def send_request(command, argv=(), cwd=None, fds=(0, 1, 2),
+                 socket_path=SOCKET_PATH):
+    """Run the command in the server, with the given stdin/stdout/stderr file
+    descriptors. Return the exit status.
+
+    Raise OSError (FileNotFoundError, ConnectionRefusedError) if no server,
+    and PermissionError if the server belongs to another user."""
+    request = json.dumps({'command': command, 'argv': list(argv),
+                          'cwd': cwd or os.getcwd()}).encode()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        check_server_owner(sock, socket_path)
+        socket.send_fds(sock, [HEADER.pack(len(request)) + request],
+                        _usable_fds(fds))
+        reply = b''
+        while len(reply) < STATUS.size:
+            chunk = sock.recv(STATUS.size - len(reply))
+            if not chunk:
+                logger.error('Connection closed by the server without status.')
+                return 1
+            reply += chunk
+    return STATUS.unpack(reply)[0]
+
+
+def run_command(command, argv=(), socket_path=SOCKET_PATH):
+    """Run through the server if it is running, otherwise locally."""
+    try:
+        return send_request(command, argv, socket_path=socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        logger.debug('No server at %s: running locally.', socket_path)
+    except PermissionError as err:
+        logger.warning('%s Running locally.', err)
+    return run_local(command, argv)
+
+
+### Server
+
+def recv_request(conn):
+    """Return the request dict and the file descriptors of the client."""
+    data, fds, _, _ = socket.recv_fds(conn, 4096, 3)
+    while len(data) < HEADER.size:
+        chunk = conn.recv(4096)
+        if not chunk:
+            raise ConnectionError('Incomplete request')
+        data += chunk
+    length, = HEADER.unpack_from(data)
+    data = data[HEADER.size:]
+    while len(data) < length:
+        chunk = conn.recv(max(4096, length - len(data)))
+        if not chunk:
+            raise ConnectionError('Incomplete request')
+        data += chunk
+    return json.loads(data.decode()), fds
+
+
+def preload_command(module, argv):
+    """Load the data needed by the command into the server process, so that it
+    is inherited by all the next requests. Errors are reported by the child."""
+    preload = getattr(module, 'preload', None)
+    if preload is None:
+        return
+    import io
+    from contextlib import redirect_stdout, redirect_stderr
+    try:
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            preload(module.make_parser().parse_args(argv))
+    except SystemExit:
+        pass
+    except Exception as err:
+        logger.debug('Preloading %s failed: %r', module.__name__, err)
+
+
+def run_child(conn, module, argv, fds):
+    """In the forked process: take the client's stdin/stdout/stderr, run the
+    command and send its exit status. Never returns."""
+    import signal
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    status = 1
+    try:
+        for target, fd in enumerate(fds):
+            if fd != target:
+                os.dup2(fd, target)
+                os.close(fd)
+        sys.argv = [op.basename(module.__file__)] + argv
+        try:
+            status = module.main(argv) or 0
+        except SystemExit as err:
+            status = exit_status(err)
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            status = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        conn.sendall(STATUS.pack(status))
+    finally:
+        os._exit(status)
+
+
+def handle(conn):
+    """Return False to stop the server."""
+    try:
+        request, fds = recv_request(conn)
+    except (ConnectionError, ValueError) as err:
+        logger.error('Invalid request: %s', err)
+        return True
+    try:
+        command = request['command']
+        if command == STOP:
+            conn.sendall(STATUS.pack(0))
+            return False
+        if command not in COMMANDS or len(fds) != 3:
+            logger.error('Invalid command %r (%d file descriptors)',
+                         command, len(fds))
+            conn.sendall(STATUS.pack(2))
+            return True
+        try:
+            os.chdir(request['cwd'])
+        except OSError as err:
+            logger.error('Cannot change to the client directory: %s', err)
+            conn.sendall(STATUS.pack(1))
+            return True
+        try:
+            module = import_command(command)
+        except ImportError as err:
+            logger.error('Command %s unavailable: %s', command, err)
+            conn.sendall(STATUS.pack(1))
+            return True
+        preload_command(module, request['argv'])
+        logger.info('%s %s', command, ' '.join(request['argv']))
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if os.fork() == 0:
+            run_child(conn, module, request['argv'], fds)
+    finally:
+        for fd in fds:
+            os.close(fd)
+    return True
+
+
+def serve(socket_path=SOCKET_PATH, preload_all=True):
+    """Accept requests until a stop request (or SIGTERM, SIGINT)."""
+    import signal
+    import gc
+    rundir = op.dirname(op.abspath(socket_path))
+    if not op.isdir(rundir):
+        os.makedirs(rundir, mode=0o700)
+    if op.exists(socket_path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(socket_path)
+            raise RuntimeError('A server is already running at %s' % socket_path)
+        except ConnectionRefusedError:
+            os.unlink(socket_path)  # Stale socket file.
+    # The lazy imports (objectools.lazy_import) must happen here, not in
+    # each forked child.
+    import objectools
+    objectools.EAGER_IMPORTS = True
+    if preload_all:
+        for command in COMMANDS:
+            try:
+                import_command(command)
+            except ImportError as err:
+                logger.warning('Command %s unavailable: %s', command, err)
+
+    gc.freeze()  # Avoid copying the preloaded objects in each child, at collection.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # Children are reaped automatically.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)  # Only accessible by the current user.
+    try:
+        listener.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+    listener.listen(64)
+    logger.info('Listening on %s', socket_path)
+    try:
+        running = True
+        while running:
+            conn, _ = listener.accept()
+            with conn:
+                running = handle(conn)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        os.unlink(socket_path)
+        logger.info('Stopped.')
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        logging.basicConfig(format='%(levelname)s:%(name)s:%(message)s')
+        return run_command(argv[0], argv[1:])
+
+    parser = ap.ArgumentParser(description=__doc__,
+                               formatter_class=ap.RawDescriptionHelpFormatter,
+                               epilog='Commands: ' + ', '.join(COMMANDS))
+    parser.add_argument('action', choices=['serve', 'stop'])
+    parser.add_argument('-s', '--socket', default=SOCKET_PATH,
+                        help='[%(default)s, or $ORGANON_SOCKET]')
+    parser.add_argument('-l', '--lazy', action='store_true',
+                        help='import the command modules at their first request')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='log each request')
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(levelname)s:%(name)s:%(message)s')
+    if args.verbose:
+        logger.setLevel(logging.INFO)
+    if args.action == 'serve':
+        serve(args.socket, not args.lazy)
+    else:
+        try:
+            return send_request(STOP, socket_path=args.socket)
+        except (FileNotFoundError, ConnectionRefusedError):
+            logger.error('No server at %s', args.socket)
+            return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1332,6 +1332,236 @@ def plottree_set_xlim(lines, xroot, xleaf=None, age_from_root=False):
     lines.axes.set_xbound((xroot, xleaf) if age_from_root else (xleaf, xroot))
 
 
+### Array-based tree layout, for very large trees ###
+
+class TreeLayout(object):
+    """Tree nodes in preorder with their parent index (-1 at the root), branch
+    length, and plotting coordinates, as arrays.
+
+    Indexing by node returns a `Coord`, like the `child_coords` of `plottree`.
+    """
+    def __init__(self, nodes, parent, dist):
+        self.nodes = nodes
+        self.parent = parent
+        self.dist = dist
+        self.x = None
+        self.y = None
+        self._index = None
+
+    @classmethod
+    def from_tree(cls, tree, get_items, root):
+        """Iterative preorder walk, keeping the children order of `get_items`."""
+        nodes, parent, dist = [], [], []
+        stack = [(root, -1, 0)]
+        while stack:
+            node, p, d = stack.pop()
+            parent.append(p)
+            dist.append(d)
+            stack.extend((ch, len(nodes), chdist)
+                         for ch, chdist in reversed(get_items(tree, (node, d))))
+            nodes.append(node)
+        return cls(nodes, np.array(parent, dtype=np.intp),
+                   np.array(dist, dtype=float))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getitem__(self, node):
+        if self._index is None:
+            self._index = {n: i for i, n in enumerate(self.nodes)}
+        i = self._index[node]
+        return Coord(self.x[i], self.y[i])
+
+    @property
+    def is_leaf(self):
+        return np.bincount(self.parent[self.parent >= 0],
+                           minlength=len(self.parent)) == 0
+
+    def sum_from_root(self, values):
+        """Sum `values` along the path from the root (excluded) to each node,
+        by pointer jumping (log2(depth) vectorized steps)."""
+        total = np.where(self.parent >= 0, values, 0).astype(float)
+        anc = self.parent.copy()
+        jumping = np.flatnonzero(anc >= 0)
+        while jumping.size:
+            total[jumping] += total[anc[jumping]]
+            anc[jumping] = anc[anc[jumping]]
+            jumping = jumping[anc[jumping] >= 0]
+        return total
+
+    def compute_coords(self, invert=True, yscale=1, age_from_root=False):
+        """x: age (or distance from the root); y: leaf rank, and the middle of
+        the extreme children for internal nodes."""
+        is_leaf = self.is_leaf
+        rootdists = self.sum_from_root(self.dist)
+        depth = rootdists[is_leaf].max()
+        self.x = rootdists if age_from_root else depth - rootdists
+
+        nleaves = is_leaf.sum()
+        rank = np.arange(nleaves) if invert else np.arange(nleaves-1, -1, -1)
+        y = np.full(len(self), np.NaN)
+        y[is_leaf] = rank * yscale
+
+        # Postorder pass, one vectorized step per depth level.
+        level = self.sum_from_root(np.ones(len(self))).astype(int)
+        order = np.argsort(level, kind='stable')
+        bounds = np.searchsorted(level[order], np.arange(level.max() + 2))
+        ymin = np.full(len(self), np.inf)
+        ymax = np.full(len(self), -np.inf)
+        for lvl in range(level.max(), 0, -1):
+            children = order[bounds[lvl]:bounds[lvl+1]]
+            np.minimum.at(ymin, self.parent[children], y[children])
+            np.maximum.at(ymax, self.parent[children], y[children])
+            parents = order[bounds[lvl-1]:bounds[lvl]]
+            parents = parents[~is_leaf[parents]]
+            y[parents] = (ymin[parents] + ymax[parents]) / 2.
+        self.y = y
+        return self.x, self.y
+
+    def segments(self, style='squared'):
+        """Array of the edge lines (one per non-root node, in preorder), to be
+        given to a `LineCollection`."""
+        child = np.flatnonzero(self.parent >= 0)
+        par = self.parent[child]
+        if style == 'squared':
+            return np.stack([np.column_stack((self.x[child], self.y[child])),
+                             np.column_stack((self.x[par], self.y[child])),
+                             np.column_stack((self.x[par], self.y[par]))], axis=1)
+        elif style == 'V':
+            return np.stack([np.column_stack((self.x[child], self.y[child])),
+                             np.column_stack((self.x[par], self.y[par]))], axis=1)
+        raise NotImplementedError('Edge style %r' % style)
+
+
+def decimate_labels(ax, nlabels, fontsize=None, max_labels=None):
+    """Step between displayed labels so that they don't overlap on the y axis."""
+    if max_labels is None:
+        if fontsize is None:
+            fontsize = mpl.rcParams['ytick.labelsize']
+        size_px = mpl.font_manager.FontProperties(size=fontsize).get_size_in_points() \
+                  * ax.get_figure().dpi / 72.
+        max_labels = max(1, int(ax.get_window_extent().height / size_px))
+    return max(1, int(np.ceil(nlabels / max_labels)))
+
+
+def plottree_vectorized(tree, get_items, get_label, root=None, rootdist=None,
+                        ax=None, invert=True, age_from_root=False,
+                        topology_only=False, label_params=None,
+                        label_nodes=False, edge_colors=None, edge_cmap='afmhot',
+                        style='squared', yscale=1, leftleaves=False,
+                        edge_styles=None, max_labels=None, **kwargs):
+    """Same as `plottree`, with the layout computed on arrays (`TreeLayout`).
+
+    Leaf labels are decimated to fit the axes height (or `max_labels`).
+    Not supported: constant_anc_space, collapsed, zero_weight_children,
+    add_edge_axes.
+
+    Return the LineCollection, the TreeLayout, and an empty dict of subaxes.
+    """
+    if root is None:
+        try:
+            root = tree.clade  # .root
+        except AttributeError:
+            try:
+                root = tree.root
+            except AttributeError:
+                root = tree
+
+    if topology_only:
+        get_items_withdist = get_items
+        def get_items(tree, nodedist):
+            return [(child, 1) for child, _ in get_items_withdist(tree, nodedist)]
+
+    if rootdist is None:
+        try:
+            rootdist = tree.dist  # ete3 instance
+        except AttributeError:
+            try:
+                rootdist = tree.clade.branch_length  # Bio.Phylo
+            except AttributeError:
+                rootdist = getattr(tree, 'rootdist', None)  # myPhylTree
+        if rootdist is None: rootdist = 0
+
+    layout = TreeLayout.from_tree(tree, get_items, root)
+    x, y = layout.compute_coords(invert, yscale, age_from_root)
+    is_leaf = layout.is_leaf
+    time_dir = 1 if age_from_root else -1
+    root_age = x[0]
+    present = x[is_leaf].max() if age_from_root else 0
+    logger.debug('%d nodes; root_age = %g; present = %g', len(layout), root_age, present)
+
+    if ax is None:
+        fig, ax = plt.subplots()
+
+    segments = layout.segments(style)
+    edge_nodes = layout.nodes[1:]
+    if rootdist > 0:
+        # Same number of points as the other segments, for a single array.
+        rootseg = [(root_age, y[0])] \
+                  + [(root_age - time_dir*rootdist, y[0])] * (segments.shape[1] - 1)
+        segments = np.concatenate((segments, [rootseg]))
+        edge_nodes = edge_nodes + [root]
+
+    line_color = kwargs.pop('color', mpl.rcParams['text.color'])
+    if edge_colors is not None:
+        edge_cmap = plt.get_cmap(edge_cmap)
+        edge_labels = [get_label(tree, node) for node in layout.nodes[1:]]
+        values = pd.Series(edge_colors, dtype=float).loc[edge_labels].values
+        if rootdist > 0:
+            values = np.append(values, edge_colors.get(root, np.NaN))
+        line_color = edge_cmap(values)  # NaN -> "bad" color
+    linestyles = 'solid'
+    if edge_styles is not None:
+        linestyles = [edge_styles[get_label(tree, node)] for node in layout.nodes[1:]]
+        if rootdist > 0:
+            linestyles.append(edge_styles.get(root, 'solid'))
+
+    lines = mc.LineCollection(segments, colors=line_color, cmap=edge_cmap,
+                              linestyles=linestyles, **kwargs)
+    lines.set_clip_on(False)
+    ax.add_collection(lines)
+
+    # Dashed lines to the present for non-ultrametric trees.
+    ancient = np.flatnonzero(is_leaf & (x != present))
+    if ancient.size:
+        extension_kwargs = {k:v for k,v in kwargs.items() if k not in ('norm','linestyles','linewidths', 'colors', 'facecolors')}
+        nans = np.full(ancient.size, np.NaN)
+        ax.plot(np.column_stack((np.full(ancient.size, present), x[ancient], nans)).ravel(),
+                np.column_stack((y[ancient], y[ancient], nans)).ravel(),
+                'k--',
+                alpha=extension_kwargs.pop('alpha', 1)/2.,
+                linewidth=extension_kwargs.pop('linewidth', mpl.rcParams['lines.linewidth'])/2.,
+                **extension_kwargs)
+
+    if label_params is None: label_params = {}
+    if label_nodes:
+        plottree_label_nodes(ax, layout, tree, get_items, get_label, root, rootdist, leftleaves, time_dir, **label_params)
+
+    if not age_from_root: ax.invert_xaxis()
+    ax.set_xlim(left=root_age-time_dir*rootdist, right=present)
+    nleaves = is_leaf.sum()
+    ax.set_ylim(-0.5*yscale, (nleaves - 0.5)*yscale)
+
+    ax.spines['top'].set_visible(False)
+    ax.spines['left'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    if leftleaves:  # *after* set_xlim
+        ax.invert_xaxis()
+        ax.tick_params('y', left=False, labelleft=True, right=False, labelright=False)
+    else:
+        ax.yaxis.tick_right()
+        ax.tick_params('y', which='both', right=False)
+
+    leaves = np.flatnonzero(is_leaf)
+    step = decimate_labels(ax, nleaves, label_params.get('fontsize',
+                                            label_params.get('size')), max_labels)
+    leaves = leaves[::step]
+    ax.set_yticks(y[leaves])
+    ax.set_yticklabels([get_label(tree, layout.nodes[i]) for i in leaves],
+                       **label_params)
+    return lines, layout, {}
+
+
 
 ### Derivates of the violin plot
 def splitviolin(x, y, hue, data=None, order=None, hue_order=None, cut=0):
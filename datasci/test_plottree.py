@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
+from datasci.graphs import plottree, plottree_vectorized
+
+
+TREE = {'r': [('a', 1), ('b', 2)],
+        'a': [('l1', 1), ('l2', 1), ('c', 0.5)],
+        'c': [('l3', 0.5), ('l4', 1.5)],
+        'b': [('l5', 1)]}
+
+def get_items(tree, nodedist):
+    return tree.get(nodedist[0], [])
+
+def get_label(tree, node):
+    return node
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'invert': False},
+                                    {'age_from_root': True, 'rootdist': 0.5},
+                                    {'style': 'V', 'yscale': 2}])
+def test_same_coords_as_plottree(kwargs):
+    _, child_coords, _ = plottree(TREE, get_items, get_label, root='r', **kwargs)
+    lines, layout, _ = plottree_vectorized(TREE, get_items, get_label, root='r', **kwargs)
+    plt.close('all')
+    assert len(layout) == len(child_coords)
+    for node, coord in child_coords.items():
+        assert (layout[node].x, layout[node].y) == pytest.approx((coord.x, coord.y))
+    assert len(lines.get_segments()) == len(child_coords) - 1 + bool(kwargs.get('rootdist'))
+
+
+def test_decimated_labels():
+    _, layout, _ = plottree_vectorized(TREE, get_items, get_label, root='r', max_labels=2)
+    ax = plt.gca()
+    labels = [t.get_text() for t in ax.get_yticklabels()]
+    plt.close('all')
+    assert labels == ['l1', 'l4']
@@ -4,6 +4,7 @@
 from sys import stdout, stdin, setrecursionlimit
 import argparse as ap
 from LibsDyogen import myPhylTree, myProteinTree
+from dendro.bates import rev_dfw_descendants
 from dendro.trimmer import thin_prottree
 import logging
 logger = logging.getLogger(__name__)
@@ -11,22 +12,33 @@ logger = logging.getLogger(__name__)
 
 def fix_thinned_dups(phyltree, tree, node):
     logger.debug('Entering fix_thinned_dup at %d', node)
-    for child,_ in tree.data.get(node, []):
-        fix_thinned_dups(phyltree, tree, child)
+    # Children before parents.
+    for node, children in rev_dfw_descendants(tree,
+                                    lambda tree, n: [ch for ch,_ in tree.data.get(n, [])],
+                                    include_leaves=True, queue=[node]):
+        nodeinfo = tree.info[node]
+        if nodeinfo['Duplication'] != 0 and nodeinfo['taxon_name'] not in phyltree.allNames:
+            child_taxa = [tree.info[ch]['taxon_name'] for ch in children]
+            #child_taxa = [t for t in child_taxa if t in phyltree.allNames]
+            #assert len(set(child_taxa)) == 1, '%s:%s' % (nodeinfo['taxon_name'],
+            #                                             set(child_taxa))
+            #nodeinfo['taxon_name'] = child_taxa[0]
+            logger.info('Reset taxon: %s -> %s (%s)',
+                        nodeinfo['taxon_name'],
+                        phyltree.lastCommonAncestor(child_taxa),
+                        child_taxa)
+            nodeinfo['taxon_name'] = phyltree.lastCommonAncestor(child_taxa)
 
-    nodeinfo = tree.info[node]
-    if nodeinfo['Duplication'] != 0 and nodeinfo['taxon_name'] not in phyltree.allNames:
-        child_taxa = [tree.info[ch]['taxon_name'] for ch,_ in tree.data.get(node,[])]
-        #child_taxa = [t for t in child_taxa if t in phyltree.allNames]
-        #assert len(set(child_taxa)) == 1, '%s:%s' % (nodeinfo['taxon_name'],
-        #                                             set(child_taxa))
-        #nodeinfo['taxon_name'] = child_taxa[0]
-        logger.info('Reset taxon: %s -> %s (%s)',
-                    nodeinfo['taxon_name'],
-                    phyltree.lastCommonAncestor(child_taxa),
-                    child_taxa)
-        nodeinfo['taxon_name'] = phyltree.lastCommonAncestor(child_taxa)
 
+def prune_tree_species(phyltree, tree):
+    """Keep the leaves from the species of `phyltree`. Return the new root,
+    or None if no leaf is kept."""
+    keptleaves = set((leaf for leaf in set(tree.info).difference(tree.data)
+                      if tree.info[leaf]['taxon_name'] in phyltree.allNames))
+    newroot, _ = thin_prottree(tree, tree.root, 0, keptleaves)
+    if newroot is not None:
+        fix_thinned_dups(phyltree, tree, newroot)
+    return newroot
 
 
 def main(phyltreefile, forestfile=None):
@@ -37,14 +49,8 @@ def main(phyltreefile, forestfile=None):
     if forestfile is None:
         forestfile = stdin
     for tree in myProteinTree.loadTree(forestfile):
-        keptleaves = set((leaf for leaf in set(tree.info).difference(tree.data)
-                          if tree.info[leaf]['taxon_name'] in phyltree.allNames))
-        newroot, _ = thin_prottree(tree, tree.root, 0, keptleaves)
-        #print('DEBUG: newroot =', newroot)
-        #print('DEBUG: newdata =', tree.data)
-        #print('DEBUG: newinfo =', ' '.join(str(x) for x in tree.info.keys()))
+        newroot = prune_tree_species(phyltree, tree)
         if newroot is not None:
-            fix_thinned_dups(phyltree, tree, newroot)
             tree.printTree(stdout, newroot)
         else:
             logger.warning('Discard tree %d', tree.root)
@@ -33,6 +33,11 @@ class TreeMethod(object):
         return [(child, cls.get_dist(tree, child))
                 for child in cls.get_children(tree, nodedist[0])]
 
+    @classmethod
+    def set_child_dists(cls, tree, nodedist, children, dists):
+        """Set the branch lengths of the given children of nodedist[0]."""
+        cls.set_items(tree, nodedist, list(zip(children, dists)))
+
 
 class nodebased(TreeMethod):
     @staticmethod
@@ -88,6 +93,11 @@ class ete3(nodebased):
     def set_dist(cls, tree, node, dist):
         node.dist = dist
 
+    @staticmethod
+    def set_child_dists(tree, nodedist, children, dists):
+        for child, dist in zip(children, dists):
+            child.dist = dist
+
 class BioPhylo(nodebased):
     
     @staticmethod
@@ -2,6 +2,7 @@
 
 
 #import queue
+from collections import deque
 import logging
 #logging.basicConfig(format='%(levelname)s:%(funcName)s:%(message)s')
 logger = logging.getLogger(__name__)
@@ -14,25 +15,20 @@ def bfw_pairs(phyltree, queue=None, closest_first=True):
 
     if queue is None:  # initialize
         queue = [(None, phyltree.root)]
+    queue = deque(queue)
 
-    if len(queue) == 0:  # terminate
-        raise StopIteration
-
-    # iterate
-    parent, node = queue.pop(0)
-    if parent is not None:  # do not yield root
-        yield parent, node
-
-    children = phyltree.items.get(node, [])
     sort_coeff = 1 if closest_first else -1
-    children.sort(key=lambda x: sort_coeff * x[1])
+    while queue:
+        parent, node = queue.popleft()
+        if parent is not None:  # do not yield root
+            yield parent, node
 
-    for child, _ in children:
-        # append pair (parent, child)
-        queue.append((node, child))
+        children = phyltree.items.get(node, [])
+        children.sort(key=lambda x: sort_coeff * x[1])
 
-    for nextnode, nextchild in bfw_pairs(phyltree, queue, closest_first):
-        yield nextnode, nextchild
+        for child, _ in children:
+            # append pair (parent, child)
+            queue.append((node, child))
 
 
 def dfw_pairs(phyltree, queue=None, closest_first=False, nosinglechild=False):
@@ -40,35 +36,28 @@ def dfw_pairs(phyltree, queue=None, closest_first=False, nosinglechild=False):
     if queue is None:  # initialize
         queue = [(None, phyltree.root)]
 
-    if len(queue) == 0:  # terminate
-        raise StopIteration
-
-    # iterate
-    parent, node = queue.pop()  # != bfw
-    if parent is not None:
-        yield parent, node
-
-    children = phyltree.items.get(node, [])
-    if nosinglechild:
-        # Skip children that have only one child (update to next child)
-        for i, (ch, dist) in enumerate(children):
-            nextch = phyltree.items.get(ch, [])
-            while len(nextch) == 1:
-                #print(".", end='')
-                dist += nextch[0][1]
-                children[i] = (nextch[0][0], dist)
-                nextch = phyltree.items.get(nextch[0][0], [])
-
     sort_coeff = 1 if closest_first else -1
-    children.sort(key=lambda x: sort_coeff * x[1])
+    while queue:
+        parent, node = queue.pop()  # != bfw
+        if parent is not None:
+            yield parent, node
+
+        children = phyltree.items.get(node, [])
+        if nosinglechild:
+            # Skip children that have only one child (update to next child)
+            for i, (ch, dist) in enumerate(children):
+                nextch = phyltree.items.get(ch, [])
+                while len(nextch) == 1:
+                    #print(".", end='')
+                    dist += nextch[0][1]
+                    children[i] = (nextch[0][0], dist)
+                    nextch = phyltree.items.get(nextch[0][0], [])
 
-    for child, _ in children:
-        # append pair (parent, child)
-        queue.append((node, child))
+        children.sort(key=lambda x: sort_coeff * x[1])
 
-    for nextnode, nextchild in dfw_pairs(phyltree, queue, closest_first,
-                                         nosinglechild):
-        yield nextnode, nextchild
+        for child, _ in children:
+            # append pair (parent, child)
+            queue.append((node, child))
 
 
 def dfw_pairs_generalized(tree, get_children, queue=None, include_root=False):
@@ -80,27 +69,19 @@ def dfw_pairs_generalized(tree, get_children, queue=None, include_root=False):
         except AttributeError as e:
             logger.error("No root attribute found. Please initialize "
                           "the queue with the root: queue=[(None, root)]")
-            queue = []  # will raise Stop iteration
-
-    if len(queue) == 0:  # terminate
-        raise StopIteration
+            queue = []  # will stop the iteration
 
-    # iterate
-    parent, node = queue.pop()  # != bfw
-    if parent is not None or include_root:
-        yield parent, node
-
-    children = get_children(tree, node)
+    while queue:
+        parent, node = queue.pop()  # != bfw
+        if parent is not None or include_root:
+            yield parent, node
 
-    # reverse the append so that the iteration follows the order of the children
-    for child in reversed(children):
-        # append pair (parent, child)
-        queue.append((node, child))
+        children = get_children(tree, node)
 
-    for nextnode, nextchild in dfw_pairs_generalized(tree, get_children, queue,
-                                                     include_root):
-        #print("yield %s, %s" % (nextnode, nextchild))
-        yield nextnode, nextchild
+        # reverse the append so that the iteration follows the order of the children
+        for child in reversed(children):
+            # append pair (parent, child)
+            queue.append((node, child))
 
 
 def bfw_descendants(phyltree, include_leaves=False, queue=None):
@@ -129,25 +110,19 @@ def bfw_descendants(phyltree, include_leaves=False, queue=None):
 
     if queue is None:  # initialize
         queue = [phyltree.root]
+    queue = deque(queue)
 
-    if len(queue) == 0:  # terminate
-        raise StopIteration
+    while queue:
+        parent = queue.popleft()
 
-    # iterate
-    parent = queue.pop(0)
-
-    children = phyltree.items.get(parent, [])
-    if include_leaves or children:
-        children.sort(key=lambda x: x[1])
-        descendants = [ch[0] for ch in children]
+        children = phyltree.items.get(parent, [])
+        if include_leaves or children:
+            children.sort(key=lambda x: x[1])
+            descendants = [ch[0] for ch in children]
 
-        queue.extend(descendants)
+            queue.extend(descendants)
 
-        yield parent, descendants
-
-    for nextparent, nextdescendants in bfw_descendants(phyltree,include_leaves,
-                                                       queue):
-        yield nextparent, nextdescendants
+            yield parent, descendants
 
 
 def bfw_descendants_generalized(tree, get_children, include_leaves=False,
@@ -176,24 +151,18 @@ def bfw_descendants_generalized(tree, get_children, include_leaves=False,
         except AttributeError as e:
             logger.error("No root attribute found. Please initialize "
                           "the queue with the root: queue=[root]")
-            queue = []  # will raise Stop iteration
-
-    if len(queue) == 0:  # terminate
-        raise StopIteration
-
-    # iterate
-    parent = queue.pop(0)
+            queue = []  # will stop the iteration
+    queue = deque(queue)
 
-    children = list(get_children(tree, parent))
-    if include_leaves or children:
-        queue.extend(children)
-        #queue.append(descendants)
+    while queue:
+        parent = queue.popleft()
 
-        yield parent, children
+        children = list(get_children(tree, parent))
+        if include_leaves or children:
+            queue.extend(children)
+            #queue.append(descendants)
 
-    for nextparent, nextchildren in bfw_descendants_generalized(tree,
-                                        get_children, include_leaves, queue):
-        yield nextparent, nextchildren
+            yield parent, children
 
 
 def dfw_descendants(phyltree, closest_first=False,
@@ -203,42 +172,29 @@ def dfw_descendants(phyltree, closest_first=False,
     if queue is None:  # initialize
         queue = [phyltree.root]
 
-    if len(queue) == 0:  # terminate
-        raise StopIteration
-
-    # iterate
-    parent = queue.pop()  # != bfw
+    sort_coeff = 1 if closest_first else -1
+    while queue:
+        parent = queue.pop()  # != bfw
 
-    children = phyltree.items.get(parent, [])
+        children = phyltree.items.get(parent, [])
 
-    if nosinglechild:
-        # Skip children that have only one child (update to next child)
-        for i, (ch, dist) in enumerate(children):
-            nextch = phyltree.items.get(ch, [])
-            try:
+        if nosinglechild:
+            # Skip children that have only one child (update to next child)
+            for i, (ch, dist) in enumerate(children):
+                nextch = phyltree.items.get(ch, [])
                 while len(nextch) == 1:
                     #print(".", end='')
                     dist += nextch[0][1]
                     children[i] = (nextch[0][0], dist)
                     nextch = phyltree.items.get(nextch[0][0], [])
-            except:
-                raise
-            #finally:
-            #    print(parent, children, nextch, file=sys.stderr)
 
-    if include_leaves or children:
-        sort_coeff = 1 if closest_first else -1
-        children.sort(key=lambda x: sort_coeff * x[1])
-        descendants = [ch[0] for ch in children]
+        if include_leaves or children:
+            children.sort(key=lambda x: sort_coeff * x[1])
+            descendants = [ch[0] for ch in children]
 
-        queue.extend(descendants)
+            queue.extend(descendants)
 
-        yield parent, descendants
-
-    for nextnode, nextdescendants in dfw_descendants(phyltree, closest_first,
-                                                     include_leaves, queue,
-                                                     nosinglechild):
-        yield nextnode, nextdescendants
+            yield parent, descendants
 
 
 def dfw_descendants_generalized(tree, get_children, include_leaves=False,
@@ -275,24 +231,17 @@ def dfw_descendants_generalized(tree, get_children, include_leaves=False,
         except AttributeError as e:
             logger.error("No root attribute found. Please initialize "
                           "the queue with the root: queue=[root]")
-            queue = []  # will raise Stop iteration
+            queue = []  # will stop the iteration
 
-    if len(queue) == 0:  # terminate
-        raise StopIteration
+    while queue:
+        parent = queue.pop()  # != bfw
 
-    # iterate
-    parent = queue.pop()  # != bfw
-
-    descendants = get_children(tree, parent)
-    if copy:
-        descendants = list(descendants)  # copying is important!
-    if include_leaves or descendants:
-        yield parent, descendants
-        queue.extend(reversed(descendants))
-
-    for nextnode, nextdescendants in \
-            dfw_descendants_generalized(tree, get_children,include_leaves, queue, copy):
-        yield nextnode, nextdescendants
+        descendants = get_children(tree, parent)
+        if copy:
+            descendants = list(descendants)  # copying is important!
+        if include_leaves or descendants:
+            yield parent, descendants
+            queue.extend(reversed(descendants))
 
 
 def dfw_lineage_generalized(tree, get_children, queue=None):
@@ -371,23 +320,25 @@ def iter_all_ancestor_descendant_pairs(tree, get_children, root=None):
 def iter_all_paths_fromroot(tree, get_children, path):
     """path should be initialized by [root]"""
     assert isinstance(path, list)
-    for child in get_children(tree, path[-1]):
-        nextpath = path + [child]
+    # Explicit stack of paths, in reverse order of the children.
+    stack = [path + [child] for child in reversed(get_children(tree, path[-1]))]
+    while stack:
+        nextpath = stack.pop()
         yield nextpath
-        for nnextpath in iter_all_paths_fromroot(tree, get_children, nextpath):
-            yield nnextpath
+        stack.extend(nextpath + [child]
+                     for child in reversed(get_children(tree, nextpath[-1])))
 
 
 def iter_leaf_paths(tree, get_children, path):
     assert isinstance(path, list)
-    children = get_children(tree, path[-1])
-    if not children:
-        yield path
-    else:
-        for child in children:
-            nextpath = path + [child]
-            for leafpath in iter_leaf_paths(tree, get_children, path=nextpath):
-                yield leafpath
+    stack = [path]
+    while stack:
+        path = stack.pop()
+        children = get_children(tree, path[-1])
+        if not children:
+            yield path
+        else:
+            stack.extend(path + [child] for child in reversed(children))
 
 
 def iter_all_paths(tree, get_children, root):
@@ -42,6 +42,52 @@ def ProtTree_to_ete3(prottree):
     return tree
 
 
+def ProtTree_to_newick(prottree, root=None, withDist=True, withTags=True):
+    """Format a LibsDyogen ProteinTree as Newick (with NHX tags S, D and ID).
+
+    Iterative (explicit stack), so that very deep trees do not need a
+    `setrecursionlimit`."""
+    def format_node(node, dist):
+        info = prottree.info[node]
+        if node in prottree.data:
+            label = info.get('family_name', str(node))
+        else:
+            label = info.get('gene_name', str(node)).split('/')[0]
+        if withDist and dist is not None:
+            label += ':' + repr(float(dist))  # Exact, unlike '%g'
+        if withTags:
+            tags = ['ID=%s' % (node,)]
+            if 'taxon_name' in info:
+                tags.append('S=%s' % info['taxon_name'].replace(' ', '.'))
+            if 'Duplication' in info:
+                tags.append('D=%s' % ('Y' if info['Duplication'] >= 2 else 'N'))
+            label += '[&&NHX:%s]' % ':'.join(tags)
+        return label
+
+    if root is None:
+        root = prottree.root
+    tokens = []
+    # Contains either a (node, dist) to expand, or a string to output.
+    stack = [(root, None)]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            tokens.append(item)
+            continue
+        node, dist = item
+        children = prottree.data.get(node, [])
+        if children:
+            tokens.append('(')
+            stack.append(')' + format_node(node, dist))
+            for i, child_dist in enumerate(reversed(children)):
+                if i:
+                    stack.append(',')
+                stack.append(child_dist)
+        else:
+            tokens.append(format_node(node, dist))
+    return ''.join(tokens) + ';'
+
+
 def PhylTree_to_ete3(phyltree, nosinglechild=False):
     # TODO: do not import ete3 here, just try to use it and raise error
     import ete3
@@ -13,8 +13,7 @@ not be lost."""
 import itertools as it
 from copy import deepcopy
 import numpy as np
-from dendro.bates import rev_dfw_descendants
-from LibsDyogen import myPhylTree
+from dendro.bates import rev_dfw_descendants, dfw_pairs_generalized
 
 import logging
 logger = logging.getLogger(__name__)
@@ -216,7 +215,98 @@ def update_all_combinations(chcounts, maxn, init_count):
 get_phylchildren = lambda tree,node: [x for x,_ in tree.items.get(node,[])]
 #from dendro.any.phyltree import get_children as get_phylchildren
 
-#@myTools.memoize
+class SingleEventCounter(object):
+    """Count the ways of placing n single events in a tree (Maddison method),
+    like the original `place_single_events`, but:
+
+    - the counts of a node are the convolution of its children counts (one
+      `np.convolve` per child);
+    - the counts are exact python integers (no int64 overflow);
+    - the subtree counts are cached by (node, n), and reused by later calls,
+      as long as the subtree contains no constrained node (`leaf_counts`).
+    """
+    def __init__(self, tree, get_children=get_phylchildren, root=None):
+        self.tree = tree
+        self.get_children = get_children
+        self.root = tree.root if root is None else root
+        self.parent = {child: parent for parent, child in
+                       dfw_pairs_generalized(tree, get_children,
+                                             queue=[(None, self.root)])}
+        self.cache = {}  # (node, n) -> counts array
+
+    def _init_counts(self, n):
+        """1 way to place 0 event on a single branch, and 1 way to place 1
+        event on this branch."""
+        counts = np.zeros(n+1, dtype=object)
+        counts[:2] = 1
+        return counts
+
+    def _as_counts(self, counts, n):
+        """Convert to an object array of length n+1 (pad with zeros)."""
+        converted = np.zeros(n+1, dtype=object)
+        counts = np.asarray(counts, dtype=object)[:(n+1)]
+        converted[:len(counts)] = counts
+        return converted
+
+    def subtree_counts(self, node, n, leaf_counts=None):
+        """Counts of 0..n events in the subtree *and* the leading branch of
+        `node`. The nodes in `leaf_counts` are not traversed, and their
+        given counts are used instead."""
+        if leaf_counts is None:
+            leaf_counts = {}
+        # Nodes whose subtree contains a constrained node, can't be cached.
+        constrained = set()
+        for anc in leaf_counts:
+            while anc is not None and anc not in constrained:
+                constrained.add(anc)
+                anc = self.parent.get(anc)
+
+        node_counts = {}
+        stack = [(node, False)]
+        while stack:
+            current, children_done = stack.pop()
+            if current in leaf_counts:
+                node_counts[current] = self._as_counts(leaf_counts[current], n)
+                continue
+            cacheable = current not in constrained
+            if not children_done:
+                if cacheable and (current, n) in self.cache:
+                    node_counts[current] = self.cache[(current, n)]
+                    continue
+                children = self.get_children(self.tree, current)
+                if not children:
+                    node_counts[current] = self._init_counts(n)
+                else:
+                    stack.append((current, True))
+                    stack.extend((ch, False) for ch in children)
+                continue
+
+            chcounts = [node_counts.pop(ch)
+                        for ch in self.get_children(self.tree, current)]
+            counts = chcounts[0].copy()
+            for other in chcounts[1:]:
+                counts = np.convolve(counts, other)[:(n+1)]
+            # Proba that 1 event occurs on the *leading* branch:
+            # Allowed only if zero events are allowed below!!
+            if n >= 1 and all(c[0] for c in chcounts):
+                counts[1] += 1
+            logger.debug("Counts at %r: %s", current, counts)
+            if cacheable:
+                self.cache[(current, n)] = counts
+            node_counts[current] = counts
+
+        return node_counts[node]
+
+    def counts(self, n, root=None, leaf_counts=None):
+        """Counts of 0..n events in the tree at `root` (without leading branch)."""
+        if root is None:
+            root = self.root
+        counts = self.subtree_counts(root, n, leaf_counts).copy()
+        if n >= 1:
+            counts[1] -= 1  # Consider the root has no leading branch.
+        return counts
+
+
 def place_single_events(n:int, phyltree, get_phylchildren=get_phylchildren,
                         root=None, leaf_counts=None):
     """Dynamic programming approach to place n events in a Maddison manner on a
@@ -225,87 +315,14 @@ def place_single_events(n:int, phyltree, get_phylchildren=get_phylchildren,
     Briefly, those events are considered unique/irreversible, so if it happened
     *once* in the ancestry, it can't happen again in any descendant.
 
-    The tree must be a strictly dichotomic tree."""
-    if root is None:
-        root = phyltree.root
-
-    # Store intermediate results for each node.
-    node_counts = {}
-    if leaf_counts is not None:
-        node_counts.update(leaf_counts)
-
-    #seen_nodes = {k: 1 for k in leaf_counts}
-
-    #TODO: if n is None:
-    # There can't be more single events than there are leaves.
-    maxn = min(n, len(phyltree.species[root]))
-
-    # There is exactly:
-    # - 1 way to place 0 event on a single branch,
-    # - 1 way to place 1 event on this single branch (on the branch itself)
-    # and we initialize 0 ways for all other numbers of events (because there is no subtree).
-    if maxn == 0:
-        return np.ones(1, dtype=int)
-
-    init_count = np.array([1, 1] + [0]*(n-1), dtype=int)
-
-    #node_counts[root] = init_count.copy()  # In case the tree has 0 branches...
-    # Iterate from the leaves to the root.
-    for parent, children in rev_dfw_descendants(phyltree, get_phylchildren,
-                                                include_leaves=False,
-                                                queue=[root]):
-        ## Check that this node name is unique, or make it so.
-        ## Reminder: with myPhylTree, it is necessary unique.
-        #try:
-        #    # Assuming it is a string
-        #    parent += '.%d' % seen_nodes[parent]
-        #    seen_nodes[parent] += 1
-        #except KeyError:
-        #    seen_nodes[parent] = 1
-
-        logger.debug('* %r -> %s', parent, children)
-        #assert len(children) == 2, "Not implemented for non dichotomic trees."\
-        #        " (node %s)" % parent
-
-        #nch = len(children)
-        chcounts = np.array([init_count]*len(children))
-        for i, ch in enumerate(children):
-            try:
-                # The data is not a leaf, or was initialized via `leaf_counts`.
-                chcounts[i] = node_counts.pop(ch)
-            except KeyError:
-                pass
-
-        logger.debug('children counts: %s',
-                     '; '.join('%s:%s' % t for t in zip(children, chcounts)))
-
-        pcount = init_count.copy()
-
-        try:
-            for k in range(maxn+1):
-                pcount[k] = combinations_of_2_children_summing_to_k(chcounts, k)
-        except ValueError:
-            #err.args = ("Not implemented for non dichotomic trees."\
-            #            " (node %s)" % parent,)
-            logger.info("Non dichotomic fork.")
-            for k in range(maxn+1):
-                pcount[k] = combinations_of_children_summing_to_k(chcounts, k)
-
-        logger.debug("Counts at %r: %s", parent, pcount)
-        # Proba that 1 event occurs on the *leading* branch:
-        # Allowed only if zero events are allowed below!!
-        if chcounts[:,0].all():
-            pcount[1] += 1
-
-        node_counts[parent] = pcount
-
-    root_counts = node_counts.setdefault(root, init_count)
-    root_counts[1] -= 1  # Consider the root has no leading branch.
-    return root_counts
+    Return an array of length n+1 of python integers.
+    See `SingleEventCounter` to reuse the subtree counts between calls."""
+    return SingleEventCounter(phyltree, get_phylchildren).counts(n, root, leaf_counts)
 
 
 def detachAfter(phyltree, nodes):
     """Transform the given nodes into leaves (remove their subtrees)."""
+    from LibsDyogen import myPhylTree
     items = deepcopy(phyltree.items)
     officialname = deepcopy(phyltree.officialName)
 
@@ -336,7 +353,7 @@ def update_subtree_combinations(n, tot, roots_1_counts, tree_0):
 
 
 def maddison_test(observed_1, tot, tree, roots_1, root=None, roots_0=None,
-                  alternative='>=', check=False):
+                  alternative='>=', check=False, counter=None):
     """
     :param: `tree`:       The complete tree. Needed to compute possibilities
                           regardless of the branch background states.
@@ -345,6 +362,8 @@ def maddison_test(observed_1, tot, tree, roots_1, root=None, roots_0=None,
     :param: `observed_0`: Observed state changes in branches with background state 0
     :param: `tot`:        All observed state changes.
     :param: `roots_0`:    nodes where the background state reverted from 1 to 0.
+    :param: `counter`:    SingleEventCounter of `tree`, to reuse its cached
+                          subtree counts between tests.
 
     Return the probability of at least observed_1 changes in branches_1.
     """
@@ -359,24 +378,22 @@ def maddison_test(observed_1, tot, tree, roots_1, root=None, roots_0=None,
     n0 = len(roots_0)
     assert set(roots_0) <= set().union(*(tree.allDescendants[r] for r in roots_1))
     
-    # Tree whose leaves end after the subtrees_1 (before the given roots_0)
-    tree_1 = detachAfter(tree, roots_0) if roots_0 else tree
-    tree_0 = detachAfter(tree_1, roots_1)
+    # Instead of detaching the subtrees (`detachAfter`), the roots_1 and roots_0
+    # are given as constrained leaves to the counter.
+    if counter is None:
+        counter = SingleEventCounter(tree)
 
     # 1. Count all possibilities to get more than `observed_1` events below roots_1.
 
-    # 1 row: counts of possibilities
+    # 1 row: counts of possibilities (including the leading branches).
     if roots_0:
-        roots_0_counts = np.array([place_single_events(tot, tree, root=r)
+        roots_0_counts = np.array([counter.subtree_counts(r, tot)
                                    for r in roots_0])  #ndmin=2
-        roots_0_counts[:,1] += 1  # One possibility of 1 event on the leading branches.
-        init_leaf0_counts = np.zeros((n0, tot+1), dtype=int)
+        init_leaf0_counts = np.zeros((n0, tot+1), dtype=object)
     else:
-        roots_1_counts = np.array([place_single_events(tot, tree, root=r)
+        roots_1_counts = np.array([counter.subtree_counts(r, tot)
                                    for r in roots_1])
-        if tot:
-            roots_1_counts[:,1] += 1  # One possibility of 1 event on the leading branches.
-    init_leaf1_counts = np.zeros((n1, tot+1), dtype=int)
+    init_leaf1_counts = np.zeros((n1, tot+1), dtype=object)
 
     #if tree.root not in roots_1:
     #    p_leading_branch_events[1] += 1
@@ -406,10 +423,9 @@ def maddison_test(observed_1, tot, tree, roots_1, root=None, roots_0=None,
                 # Select the n1 terms. ('term' column for each row).
                 detached_leaf0_counts[range(n0), terms0[:-1]] = selected_roots_0_counts
                 detached_leaf0_counts = dict(zip(roots_0, detached_leaf0_counts))
-                roots_1_counts = np.array([place_single_events(tot, tree_1, root=r,
+                roots_1_counts = np.array([counter.subtree_counts(r, tot,
                                                    leaf_counts=detached_leaf0_counts)
                                            for r in roots_1])
-                roots_1_counts[:,1] += 1  # One possibility of 1 event on the leading branches.
 
             # All possible unordered ways to sum to `n` using n1 terms.
             for terms in integer_n_partition(n+terms0[:-1].sum(), n1):
@@ -424,13 +440,13 @@ def maddison_test(observed_1, tot, tree, roots_1, root=None, roots_0=None,
                     detached_leaf1_counts = dict(zip(roots_1, detached_leaf1_counts))
 
                     # Possibilities of `tot` events constrained on `n` events after roots_1
-                    ptot_n = place_single_events(tot, tree_0, root=root,
-                                                 leaf_counts=detached_leaf1_counts)
+                    ptot_n = counter.counts(tot, root,
+                                            leaf_counts=detached_leaf1_counts)
                     logger.debug('+ %d', ptot_n[tot])
 
                     p1_more_than_obs += ptot_n[tot]
 
-    ptot = place_single_events(tot, tree, root=root)[tot]
+    ptot = counter.counts(tot, root)[tot]
 
     return p1_more_than_obs, ptot
 
@@ -16,66 +16,214 @@ The Bio.Phylo.convert doesn't properly convert the comments from BEAST Nexus fil
 
 import re
 from collections import OrderedDict
+import numpy as np
 from Bio import Phylo
 
 
+# Nexus files
+
+TREE_LINE = re.compile(r'^\s*tree\s+(\S+?)\s*(?:\[[^\]]*\]\s*)?=\s*', re.I)
+TRANSLATE_LINE = re.compile(r'^\s*translate\b', re.I)
+
+
+NEWICK_SPECIAL = re.compile(r"[\s,():;\[\]']")
+
+
+def unquote(label):
+    return label[1:-1] if label[:1] == label[-1:] == "'" else label
+
+
+def quote(label):
+    return "'%s'" % label if NEWICK_SPECIAL.search(label) else label
+
+
+def iter_nexus_trees(lines, translate=None):
+    """Yield (name, newick) of each tree of a nexus file, without parsing it.
+
+    The translate block is stored into the `translate` dict."""
+    if translate is None:
+        translate = {}
+    lines = iter(lines)
+    for line in lines:
+        if TRANSLATE_LINE.match(line):
+            text = TRANSLATE_LINE.sub('', line)
+            while ';' not in text:
+                text += next(lines)
+            for entry in text[:text.index(';')].split(','):
+                if entry.strip():
+                    key, label = entry.split(maxsplit=1)
+                    translate[key] = unquote(label.strip())
+            continue
+        match = TREE_LINE.match(line)
+        if match:
+            newick = line[match.end():].strip()
+            while not newick.endswith(';'):
+                newick += next(lines).strip()
+            yield match.group(1), newick
+
+
+# Comments
+
+# Body of the BEAST comments ('[&' ... ']')
+BEAST_COMMENT = re.compile(r'\[&([^\]]*)\]')
+# variable=value, variable={v1,v2}, variable="string"
+BEAST_VARIABLE = re.compile(r'([^=,{}]+)=(\{[^}]*\}|"[^"]*"|[^,]*),?')
+# Ranges and strings, in which commas do not separate variables
+BEAST_RANGE_STRING = re.compile(r'(\{[^}]*\}|"[^"]*")')
+# The comments of a node, and its branch length (comments may be before and
+# after it)
+BEAST_COMMENTS_LENGTH = re.compile(
+        r'((?:\s*\[&[^\]]*\])+)(\s*:[^(),;\[]*)?((?:\s*\[&[^\]]*\])*)')
+NEWICK_LEAF = re.compile(r'(?<=[(,])\s*([^(),:;\[\]\s\0]+)')
+
+
+def parse_beast_value(raw):
+    """float if possible, list for '{...}' ranges, otherwise the string."""
+    if raw.startswith('{'):
+        return [parse_beast_value(x) for x in raw[1:-1].split(',')]
+    try:
+        return float(raw)
+    except ValueError:
+        return raw
+
+
 def beast_comment_parser(text):
     assert not text or text.startswith('[&') and text.endswith(']')
     variables = OrderedDict()
-    #reg_interval = re.compile('^{-?\d+')
     if text is None:
         return variables
+    body = text[2:-1]
+    end = 0
+    for match in BEAST_VARIABLE.finditer(body):
+        if match.start() != end:
+            break
+        variables[match.group(1)] = parse_beast_value(match.group(2))
+        end = match.end()
+    if end != len(body):
+        raise ValueError('Invalid BEAST comment from "%s"' % body[end:])
+    return variables
 
-    text = re.sub(r'^\[&|\]$', '', text)
-    while text:
-        try:
-            var, text = text.split('=', maxsplit=1)
-        except ValueError as err:
-            err.args += ('from "%s"' % text,)
-            raise
-
-        if text.startswith('{'):
-            end = text.find('}')
-            value = [float(x) for x in text[1:end].split(',')]
-            text = text[(end+1):].lstrip(',')
-        else:
-            try:
-                value, text = text.split(',', 1)
-            except ValueError:
-                value = text
-                text = ''
+
+def typed_column(raw):
+    """Convert the raw values of a variable (None if missing) to:
+    - a float array (NaN if missing);
+    - a 2D float array for ranges of constant length (NaN rows if missing);
+    - otherwise a list of parsed values (None if missing)."""
+    present = [v for v in raw if v is not None]
+    if present and all(v.startswith('{') for v in present):
+        values = [None if v is None else parse_beast_value(v) for v in raw]
+        lengths = set(len(v) for v in values if v is not None)
+        if len(lengths) == 1 and all(isinstance(x, float)
+                                     for v in values if v is not None for x in v):
+            width = lengths.pop()
+            return np.array([[np.NaN]*width if v is None else v for v in values])
+        return values
+    try:
+        return np.array(['nan' if v is None else v for v in raw], dtype=float)
+    except ValueError:
+        return [None if v is None else parse_beast_value(v) for v in raw]
+
+
+def parse_beast_comments(bodies):
+    """Parse the comment bodies of all nodes (without '[&' and ']') into
+    typed columns {variable: values}, see `typed_column`."""
+    raw = OrderedDict()
+    n = len(bodies)
+    for i, body in enumerate(bodies):
+        for var, value in BEAST_VARIABLE.findall(body):
             try:
-                value = float(value)
-            except ValueError:
-                pass
-        variables[var] = value
+                raw[var][i] = value
+            except KeyError:
+                raw[var] = [None] * n
+                raw[var][i] = value
+    return OrderedDict((var, typed_column(col)) for var, col in raw.items())
 
-    return variables
+
+def format_NHX_value(value):
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return '{' + '..'.join(str(x) for x in value) + '}'
+    return str(value)
 
 
 def NHX_comment_formatter(variables: dict):
     if not variables:
         return ''
-    text = '&&NHX:'  # Bio.Phylo does not want '[' or ']' at the start/end.
-    for var, value in variables.items():
-        text += var + '='
-        if isinstance(value, (list, tuple)):
-            text += '{' + '..'.join(str(x) for x in value) + '}'
+    # Bio.Phylo does not want '[' or ']' at the start/end.
+    return '&&NHX:' + ':'.join(var + '=' + format_NHX_value(value)
+                               for var, value in variables.items())
+
+
+def format_NHX_columns(columns, n):
+    """NHX comments of n nodes from the columns of `parse_beast_comments`
+    (missing values are skipped, '' for nodes without any)"""
+    fields = [[] for _ in range(n)]
+    for var, col in columns.items():
+        prefix = var + '='
+        if isinstance(col, np.ndarray):
+            present = ~np.isnan(col) if col.ndim == 1 else ~np.isnan(col).all(axis=1)
+            indices = np.flatnonzero(present).tolist()
+            values = col[present].tolist()
+            if col.ndim == 1:
+                for i, value in zip(indices, values):
+                    fields[i].append(prefix + str(value))
+            else:
+                for i, value in zip(indices, values):
+                    fields[i].append(prefix + '{' + '..'.join(map(str, value)) + '}')
         else:
-            text += str(value)
-        text += ':'
-    
-    return text.rstrip(':')
+            for i, value in enumerate(col):
+                if value is not None:
+                    fields[i].append(prefix + format_NHX_value(value))
+    return ['&&NHX:' + ':'.join(f) if f else '' for f in fields]
+
+
+def beast_bodies_to_nhx(bodies):
+    """Convert BEAST comment bodies (without '[&' and ']') to NHX bodies, as
+    text: ranges become '{v1..v2}' and variables are separated by ':'.
+    Quoted strings are kept as written."""
+    parts = BEAST_RANGE_STRING.split('\n'.join(bodies))
+    parts[0::2] = '\0'.join(parts[0::2]).replace(',', ':').split('\0')
+    parts[1::2] = [part.replace(',', '..') if part.startswith('{') else part
+                   for part in parts[1::2]]
+    return ''.join(parts).split('\n')
+
+
+def beast_tree_to_nhx(newick, translate=None):
+    """Convert the BEAST comments of a newick string to NHX (placed after the
+    branch lengths), and translate the leaf labels.
+
+    Values are kept as written (same as the `format_NHX_columns` of
+    `parse_beast_comments`, except for the formatting of numbers)."""
+    # text, comments, branch length, comments, text, ...
+    pieces = BEAST_COMMENTS_LENGTH.split(newick)
+    # The comments of a node are merged. Flags without variables, like '[&R]',
+    # are dropped.
+    bodies = beast_bodies_to_nhx([
+                ','.join(body for body in BEAST_COMMENT.findall(before + (after or ''))
+                         if '=' in body)
+                for before, after in zip(pieces[1::4], pieces[3::4])])
+    pieces[1::4] = [length or '' for length in pieces[2::4]]
+    pieces[2::4] = ['[&&NHX:' + body + ']' if body else '' for body in bodies]
+    pieces[3::4] = [''] * len(bodies)
+    if translate:
+        # Labels are outside comments, and end before them: translate the
+        # (much shorter) text between comments at once.
+        pieces[0::4] = translate_leaves('\0'.join(pieces[0::4]), translate).split('\0')
+    return ''.join(pieces).strip()
+
+
+def translate_leaves(newick, translate):
+    pieces = NEWICK_LEAF.split(newick)
+    pieces[1::2] = [quote(translate[label]) if label in translate else label
+                    for label in pieces[1::2]]
+    return ''.join(pieces)
 
 
 def nexus2nhx(infile, outfile):
     """Designed to work with Beast/treeannotator output"""
-    with open(outfile, 'w') as out:
-        for tree in Phylo.parse(infile, 'nexus'):
-            for node in tree.get_terminals() + tree.get_nonterminals():
-                node.comment = NHX_comment_formatter(
-                                    beast_comment_parser(node.comment))
-            Phylo.write(tree, out, 'newick')
+    translate = {}
+    with open(infile) as f, open(outfile, 'w') as out:
+        for _, newick in iter_nexus_trees(f, translate):
+            out.write(beast_tree_to_nhx(newick, translate) + '\n')
 
 ## TODO: tests:
 # 1. Check if the resulting newick can be parsed by Ete3/Biopython/Newick-utils.
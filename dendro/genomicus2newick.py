@@ -10,6 +10,7 @@ from __future__ import print_function
 from sys import stdin, stdout, setrecursionlimit
 import argparse as ap
 import LibsDyogen.myProteinTree as ProteinTree
+from dendro.converters import ProtTree_to_newick
 
 
 if __name__ == '__main__':
@@ -18,12 +19,19 @@ if __name__ == '__main__':
                         type=ap.FileType('r'))
     parser.add_argument('outfile', nargs='?', default=stdout,
                         type=ap.FileType('w'))
+    parser.add_argument('-i', '--iterative', action='store_true',
+                        help=('Use the stack-safe writer of dendro.converters '
+                              '(NHX tags S,D,ID), for very deep trees.'))
     args = parser.parse_args()
 
-    setrecursionlimit(20000)
+    if args.iterative:
+        for tree in ProteinTree.loadTree(args.forestfile):
+            print(ProtTree_to_newick(tree), file=args.outfile)
+    else:
+        setrecursionlimit(20000)
 
-    for tree in ProteinTree.loadTree(args.forestfile):
-        #for node, children in tree.data.items():
-        #    print(node, children)
-        tree.printDyogenNewick(args.outfile)
+        for tree in ProteinTree.loadTree(args.forestfile):
+            #for node, children in tree.data.items():
+            #    print(node, children)
+            tree.printDyogenNewick(args.outfile)
 
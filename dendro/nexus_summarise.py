@@ -5,20 +5,31 @@
 """
 Summarise tree topology and clade ages from MCMC output in nexus format.
 
+The trees are streamed one at a time (after the burn-in), and each clade is
+encoded as a bitset of taxa. Clade frequencies and node heights are
+accumulated online (heights HPD from a fixed-size random sample per clade),
+and topologies are counted by a hash of their clades, so that memory does not
+depend on the number of trees.
+
+Output: the MAP topology (newick, with mean heights as branch lengths, and
+posterior/heights in BEAST-like comments) and optionally the table of clades.
+
 Also see Beast2:TreeAnnotator
 """
 
 
-from io import StringIO
+import re
+import random
+from math import ceil, sqrt
 from functools import partial
-from collections import Counter, defaultdict
-from Bio import Phylo
-from Bio.Nexus import Nexus #, Nodes, Trees
+from collections import Counter
+import argparse as ap
+import logging
+logger = logging.getLogger(__name__)
 
 from dendro.sorter import leaf_sort
 from dendro.any import BioPhylo
-
-from dendro.bates import dfw_descendants_generalized, rev_dfw_descendants
+from dendro.formats import TREE_LINE, unquote, quote, iter_nexus_trees
 
 
 def node_topology(tree, node, get_children, get_label):
@@ -38,73 +49,321 @@ biophylo_leaf_sort = partial(leaf_sort,
                              set_children=BioPhylo.set_children,
                              get_attribute=BioPhylo.get_label)
 
-def represent_clade(tree, node, children):
-    return tuple(sorted([tuple(sorted(iter_leaves(tree,
-                                           BioPhylo.get_children,
-                                           queue=[ch])))
-                  for ch in children], key=min))
 
+### Streaming nexus reader ###
+
+def count_nexus_trees(nexusfile):
+    with open(nexusfile) as f:
+        return sum(1 for line in f if TREE_LINE.match(line))
+
+
+### Clades as bitsets ###
+
+NEWICK_TOKENS = re.compile(r"\[[^\]]*\]|'[^']*'|[(),;]|:[^,():;\[]*|[^,():;\[\]\s][^,():;\[\]]*")
+MASK64 = (1 << 64) - 1
+
+
+def mix64(h):
+    """splitmix64 finalizer: makes the sum of clade hashes order-free but not
+    linear in the taxa."""
+    h = ((h ^ (h >> 30)) * 0xbf58476d1ce4e5b9) & MASK64
+    h = ((h ^ (h >> 27)) * 0x94d049bb133111eb) & MASK64
+    return h ^ (h >> 31)
+
+
+class TaxonIndex(object):
+    """Bit position and random 64 bits key of each taxon, in order of appearance."""
+    def __init__(self, translate=None, seed=0):
+        self.translate = {} if translate is None else translate
+        self.taxa = []
+        self.bits = {}
+        self.keys = []
+        self.rng = random.Random(seed)
+
+    def __getitem__(self, label):
+        taxon = self.translate.get(label, label)
+        try:
+            return self.bits[taxon]
+        except KeyError:
+            i = self.bits[taxon] = len(self.taxa)
+            self.taxa.append(taxon)
+            self.keys.append(self.rng.getrandbits(64))
+            return i
+
+    def names(self, bits):
+        """Taxa of a bitset"""
+        names = []
+        while bits:
+            low = bits & -bits
+            names.append(self.taxa[low.bit_length() - 1])
+            bits ^= low
+        return names
+
+
+class CladeTree(object):
+    """Nodes of a tree in postorder, as taxon bitsets.
+
+    - bits: taxon bitset of each node;
+    - hashes: rolling hash of each node (sum of the taxon keys);
+    - children: indices of the children (empty for leaves);
+    - heights: distance to the most recent tip (root height - depth)."""
+    __slots__ = ('bits', 'hashes', 'children', 'heights')
+
+    def __init__(self, newick, taxa):
+        bits, hashes, children, lengths = [], [], [], []
+        stack = [[]]
+        last = None
+        for token in NEWICK_TOKENS.findall(newick):
+            first = token[0]
+            if first == '(':
+                stack.append([])
+                last = None
+            elif first == ',':
+                last = None
+            elif first == ')':
+                last = len(bits)
+                node_children = stack.pop()
+                node_bits, node_hash = 0, 0
+                for ch in node_children:
+                    node_bits |= bits[ch]
+                    node_hash += hashes[ch]
+                bits.append(node_bits)
+                hashes.append(node_hash & MASK64)
+                children.append(node_children)
+                lengths.append(0.)
+                stack[-1].append(last)
+            elif first == ':':
+                lengths[last] = float(token[1:])
+            elif first == ';':
+                break
+            elif first != '[' and last is None:
+                # Leaf (internal node labels are ignored)
+                last = len(bits)
+                i = taxa[unquote(token.strip())]
+                bits.append(1 << i)
+                hashes.append(taxa.keys[i])
+                children.append([])
+                lengths.append(0.)
+                stack[-1].append(last)
+        if len(stack) != 1 or len(stack[0]) != 1:
+            raise ValueError('Unbalanced parentheses in newick: %s...' % newick[:50])
+
+        # Depths in preorder (reversed postorder)
+        depths = [0.] * len(bits)
+        for i in range(len(bits)-1, -1, -1):
+            for ch in children[i]:
+                depths[ch] = depths[i] + lengths[ch]
+        root_height = max(depths)
+        self.bits = bits
+        self.hashes = hashes
+        self.children = children
+        self.heights = [root_height - d for d in depths]
+
+    def topology_hash(self):
+        h = 0
+        for node_hash, node_children in zip(self.hashes, self.children):
+            if node_children:
+                h += mix64(node_hash)
+        return h & MASK64
 
-def represent_clades(tree, get_children, get_label):
-    clades = {}
-    for clade, children in rev_dfw_descendants(tree,
-                                               get_children,
-                                               include_leaves=True,
-                                               queue=[tree.root]):
-        cladename = get_label(tree, clade)
+    def structure(self):
+        """{bitset: children bitsets} of the internal nodes"""
+        return {b: [self.bits[ch] for ch in node_children]
+                for b, node_children in zip(self.bits, self.children)
+                if node_children}
 
-        if not children:
-            clades[cladename] = ((cladename,),)
-            continue
 
-        # Make unique name
-        rawcladename = cladename
-        seen = 0
-        namefmt = '%s.%d'
-        while cladename in clades:
-            seen += 1
-            cladename = namefmt % (rawcladename, seen)
-        clade.name = cladename
+### Online statistics ###
 
-        # Concatenate each children subclades (flatten grand-children)
-        clades[cladename] = []
-        for child in children:
-            childleaves = ()
-            for subclade in clades[get_label(tree, child)]:
-                childleaves += subclade
-            clades[cladename].append(tuple(sorted(childleaves)))
-        clades[cladename] = tuple(sorted(clades[cladename], key=min))
+class HeightSketch(object):
+    """Count, sum, sum of squares, and a uniform random sample (reservoir) of
+    bounded size, for the median and HPD."""
+    __slots__ = ('n', 'total', 'total2', 'sample')
 
-    return clades
+    def __init__(self):
+        self.n = 0
+        self.total = self.total2 = 0.
+        self.sample = []
 
+    def add(self, value, size, rng):
+        self.n += 1
+        self.total += value
+        self.total2 += value * value
+        if len(self.sample) < size:
+            self.sample.append(value)
+        else:
+            j = rng.randrange(self.n)
+            if j < size:
+                self.sample[j] = value
 
-def main(nexusfile, reftree, burnin=10):
+    def mean(self):
+        return self.total / self.n
 
-    # Using the Nexus module
-    data = Nexus.Nexus(nexusfile)
-    taxlabels = data.structured[1].commandlines[1].options.split()
-    nb2taxlabels = data.translate
-    trees = data.trees
-    # Using the Phylo module
-    trees = list(Phylo.parse(nexusfile, 'nexus'))
+    def sd(self):
+        var = self.total2 / self.n - self.mean()**2
+        return sqrt(var) if var > 0 else 0.
 
-    N0 = len(trees)
+    def median(self):
+        values = sorted(self.sample)
+        mid = len(values) // 2
+        return values[mid] if len(values) % 2 else (values[mid-1] + values[mid]) / 2
 
-    trees = trees[N0*burnin/100+1:]
-    N = N0*(100 - burnin)/100
+    def hpd(self, proba=0.95):
+        """Shortest interval containing `proba` of the sample"""
+        values = sorted(self.sample)
+        width = max(1, int(ceil(proba * len(values))))
+        start = min(range(len(values) - width + 1),
+                    key=lambda i: values[i+width-1] - values[i])
+        return values[start], values[start+width-1]
 
-    topologies = Counter()
-    topo_groups = defaultdict(list)
 
-    for tree in trees:
-        # Ensure all equivalent topologies will be represented the same way
-        biophylo_leaf_sort(tree, tree.root)
-        topo = biophylo_topology(tree, tree.root)
-        topologies[topo] += 1
-        topo_groups.append(tree)
+class CladeSummary(object):
+    """Accumulate clade frequencies, node heights, and topology counts."""
+    def __init__(self, taxa=None, sketch_size=1000, seed=0):
+        self.taxa = TaxonIndex() if taxa is None else taxa
+        self.sketch_size = sketch_size
+        self.rng = random.Random(seed)
+        self.ntrees = 0
+        self.clades = {}  # bitset -> HeightSketch
+        self.topologies = Counter()  # topology hash -> count
+        self.map_hash = None
+        self.map_structure = None
+
+    def add(self, newick):
+        tree = CladeTree(newick, self.taxa)
+        self.ntrees += 1
+        for bits, height in zip(tree.bits, tree.heights):
+            try:
+                sketch = self.clades[bits]
+            except KeyError:
+                sketch = self.clades[bits] = HeightSketch()
+            sketch.add(height, self.sketch_size, self.rng)
+
+        topo = tree.topology_hash()
+        self.topologies[topo] += 1
+        # The MAP structure is stored when it takes the lead, i.e. while its
+        # tree is at hand.
+        if self.map_hash is None or \
+                self.topologies[topo] > self.topologies[self.map_hash]:
+            if topo != self.map_hash:
+                self.map_hash = topo
+                self.map_structure = tree.structure()
+        return tree
+
+    def posterior(self, bits):
+        sketch = self.clades.get(bits)
+        return 0. if sketch is None else float(sketch.n) / self.ntrees
+
+    def map_proba(self):
+        return float(self.topologies[self.map_hash]) / self.ntrees
+
+    def clade_row(self, bits, hpd=0.95):
+        sketch = self.clades.get(bits)
+        if sketch is None:
+            return [0, 0.] + [float('nan')] * 5
+        return [sketch.n, self.posterior(bits), sketch.mean(), sketch.sd(),
+                sketch.median()] + list(sketch.hpd(hpd))
+
+    def iter_clade_table(self, min_freq=0, hpd=0.95, leaves=False):
+        """Yield (taxa, size, row) by decreasing frequency."""
+        for bits, sketch in sorted(self.clades.items(), key=lambda item: -item[1].n):
+            size = bin(bits).count('1')
+            if (size > 1 or leaves) and float(sketch.n) / self.ntrees >= min_freq:
+                yield self.taxa.names(bits), size, self.clade_row(bits, hpd)
+
+    def format_newick(self, structure=None, hpd=0.95):
+        """Newick of a topology (by default the MAP) with mean heights"""
+        if structure is None:
+            structure = self.map_structure
+        root = max(structure, key=lambda b: bin(b).count('1'))
+
+        def format_node(bits, parent_height):
+            sketch = self.clades.get(bits)
+            height = sketch.mean() if sketch else float('nan')
+            if bits in structure:
+                label = '(' + ','.join(format_node(ch, height) for ch in
+                                       sorted(structure[bits],
+                                              key=lambda b: b & -b)) + ')'
+            else:
+                label = quote(self.taxa.names(bits)[0])
+            if sketch:
+                low, high = sketch.hpd(hpd)
+                label += ('[&posterior=%g,height_mean=%g,height_median=%g,'
+                          'height_%d%%_HPD={%g,%g}]') % (
+                          self.posterior(bits), height, sketch.median(),
+                          round(hpd*100), low, high)
+            if parent_height is not None:
+                label += ':%g' % (parent_height - height)
+            return label
+
+        return format_node(root, None) + ';'
+
+
+def structure_from_newick(newick, taxa):
+    return CladeTree(newick, taxa).structure()
+
+
+def summarise(lines, burnin_trees=0, sketch_size=1000, seed=0):
+    translate = {}
+    summary = CladeSummary(TaxonIndex(translate, seed), sketch_size, seed)
+    for i, (_, newick) in enumerate(iter_nexus_trees(lines, translate)):
+        if i >= burnin_trees:
+            summary.add(newick)
+    return summary
+
+
+CLADE_COLUMNS = ['clade', 'size', 'count', 'posterior', 'height_mean',
+                 'height_sd', 'height_median', 'HPD_low', 'HPD_high']
+
+
+def main(nexusfile, reftree=None, burnin=10, burnin_trees=None, cladesfile=None,
+         min_freq=0, sketch_size=1000, hpd=0.95):
+    if burnin_trees is None:
+        burnin_trees = int(count_nexus_trees(nexusfile) * burnin / 100)
+    with open(nexusfile) as f:
+        summary = summarise(f, burnin_trees, sketch_size)
+    logger.info('Summarised %d trees (%d clades, %d topologies)',
+                summary.ntrees, len(summary.clades), len(summary.topologies))
+
+    if reftree is None:
+        logger.info('MAP topology probability: %g', summary.map_proba())
+        print(summary.format_newick(hpd=hpd))
+        structure = None
+    else:
+        with open(reftree) as f:
+            structure = structure_from_newick(f.read(), summary.taxa)
+        print(summary.format_newick(structure, hpd=hpd))
 
-    MAP_topology, MAP_count = topologies.most_common(1)[0]
-    MAP_proba = float(MAP_count) / sum(topologies.values())
+    if cladesfile:
+        with open(cladesfile, 'w') as out:
+            out.write('\t'.join(CLADE_COLUMNS) + '\n')
+            if structure is None:
+                rows = summary.iter_clade_table(min_freq, hpd)
+            else:
+                rows = ((summary.taxa.names(bits), bin(bits).count('1'),
+                         summary.clade_row(bits, hpd)) for bits in structure)
+            for taxa, size, row in rows:
+                out.write('\t'.join([','.join(taxa), str(size)] +
+                                    ['%g' % x for x in row]) + '\n')
 
-    clades = represent_clades(reftree, BioPhylo.get_children, BioPhylo.get_label)
 
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+    parser = ap.ArgumentParser(description=__doc__,
+                               formatter_class=ap.RawDescriptionHelpFormatter)
+    parser.add_argument('nexusfile')
+    parser.add_argument('-r', '--reftree',
+                        help='Summarise the clades of this newick tree instead of the MAP')
+    parser.add_argument('-b', '--burnin', type=float, default=10,
+                        help='Percentage of trees to discard [%(default)s]')
+    parser.add_argument('-B', '--burnin-trees', type=int,
+                        help='Number of trees to discard (overrides --burnin)')
+    parser.add_argument('-c', '--cladesfile',
+                        help='Output table of the clades (tab-separated)')
+    parser.add_argument('-f', '--min-freq', type=float, default=0,
+                        help='Minimum clade frequency in the table [%(default)s]')
+    parser.add_argument('-s', '--sketch-size', type=int, default=1000,
+                        help='Heights sampled per clade for the median/HPD [%(default)s]')
+    parser.add_argument('--hpd', type=float, default=0.95)
+    args = parser.parse_args()
+    main(**vars(args))
@@ -15,6 +15,7 @@ This tools recognize different ways of annotating the species at each node:
 """
 
 
+import numpy as np
 from genomicustools.identify import ultimate_seq2sp
 import logging
 #logging.basicConfig(format='%(levelname)s:%(module)s l.%(lineno)d:%(funcName)s:%(message)s')
@@ -333,3 +334,102 @@ def prottree_extract_genecounts(proteintrees, ancestor, phyltree,
 
     return ancestors, ancestor_ancgenes, ancestor_genecounts, ancestor_spgenes
 
+
+def _subtrees_union_mask(starts, ends, size):
+    """Boolean mask of the rows in any of the [starts, ends) row intervals."""
+    delta = np.zeros(size + 1, dtype=np.int64)
+    np.add.at(delta, starts, 1)
+    np.add.at(delta, ends, -1)
+    return np.cumsum(delta[:-1]) > 0
+
+
+def forest_table_extract_genecounts(table, ancestors, phyltree, keeponly=None):
+    """Vectorized `prottree_extract_genecounts` for several ancestors at once,
+    from a `genomicustools.forest_table.ForestTable`.
+
+    Taxa are resolved once into integer codes, then the selection of the
+    nodes at each ancestor is done with array operations (no tree walk).
+
+    Return:
+        - species: list of species names (columns of `counts`);
+        - rows: table rows of the selected ancestral genes;
+        - anc_index: index in `ancestors` for each selected row;
+        - counts: array (len(rows), len(species)) of descendant gene counts.
+    """
+    species = sorted(phyltree.listSpecies)
+    sp_index = {sp: i for i, sp in enumerate(species)}
+    ntaxa = len(table.taxa)
+    # Code -1 (no taxon) maps to the last element of the lookup arrays.
+    leaf_sp = np.full(ntaxa + 1, -1, dtype=np.int64)
+    for code, taxon in enumerate(table.taxa):
+        leaf_sp[code] = sp_index.get(phyltree.officialName.get(taxon, taxon), -1)
+
+    nrows = len(table)
+    taxon = np.asarray(table.taxon)
+    parent = np.asarray(table.parent)
+    end = np.asarray(table.end)
+    has_parent = parent >= 0
+    # The root is compared to itself, as in `prottree_extract_genecounts`.
+    parent_taxon = np.where(has_parent, taxon[parent], taxon)
+    parent_isdup = has_parent & (np.asarray(table.duplication)[parent] > 1)
+    isdup = np.asarray(table.duplication) > 1
+    root_taxon = taxon[table.tree_starts][np.asarray(table.tree)]
+
+    is_leaf = table.is_leaf
+    leaves = np.flatnonzero(is_leaf & (leaf_sp[taxon] >= 0))
+    if len(leaves) < is_leaf.sum():
+        logger.error('%d leaves are not assigned to a species.',
+                     is_leaf.sum() - len(leaves))
+    leaves_sp = leaf_sp[taxon[leaves]]
+    # Leaf rows of each species, in increasing order.
+    sp_leaves = [leaves[leaves_sp == i] for i in range(len(species))]
+
+    all_rows, all_anc = [], []
+    for a, ancestor in enumerate(ancestors):
+        before = np.zeros(ntaxa + 1, dtype=bool)
+        after = np.zeros(ntaxa + 1, dtype=bool)
+        for code, t in enumerate(table.taxa):
+            before[code] = t in phyltree.dicLinks[phyltree.root][ancestor]
+            after[code] = t in phyltree.allDescendants[ancestor]
+        anc_code = table.taxon_codes.get(ancestor, -2)
+
+        node_before = before[taxon]
+        crossing = before[parent_taxon] & after[taxon]
+        # The parent is an 'ancestor' speciation: already counted.
+        counted = (crossing & (taxon != anc_code) & (parent_taxon == anc_code)
+                   & ~parent_isdup)
+        selected = crossing & ~counted
+        if keeponly == 'crown':
+            selected &= ~isdup
+        # Nodes whose descendants are not visited.
+        pruned = ~crossing & ~node_before
+        if keeponly == 'stem':
+            pruned |= selected
+        pruned_rows = np.flatnonzero(pruned)
+        hidden = _subtrees_union_mask(pruned_rows + 1, end[pruned_rows], nrows)
+
+        rows = np.flatnonzero(selected & ~hidden & before[root_taxon])
+        all_rows.append(rows)
+        all_anc.append(np.full(len(rows), a, dtype=np.int64))
+
+    rows = np.concatenate(all_rows)
+    anc_index = np.concatenate(all_anc)
+    counts = np.empty((len(rows), len(species)), dtype=np.int64)
+    for i, spl in enumerate(sp_leaves):
+        counts[:, i] = (np.searchsorted(spl, end[rows])
+                        - np.searchsorted(spl, rows))
+    return species, rows, anc_index, counts
+
+
+def genecounts_cube(table, ancestors, phyltree, keeponly='stem'):
+    """Dense array of gene counts (tree family x species x ancestor).
+
+    Return (species, cube)."""
+    species, rows, anc_index, counts = forest_table_extract_genecounts(
+                                            table, ancestors, phyltree, keeponly)
+    cube = np.zeros((table.ntrees, len(species), len(ancestors)), dtype=np.int64)
+    families = np.asarray(table.tree)[rows]
+    for i in range(len(species)):
+        np.add.at(cube[:, i, :], (families, anc_index), counts[:, i])
+    return species, cube
+
@@ -2,224 +2,354 @@
 # -*- coding: utf-8 -*-
 
 
-""" Take a 'reconciled' gene tree and converts it to a 'paralogy tree':
+""" Take 'reconciled' gene trees and convert them to 'paralogy trees':
 
 - reconciled tree: gene tree with species mapped at nodes, i.e gene tree with
                    gene duplication information.
 
 - paralogy tree: tree whose branch represent a **pair of paralogs**.
                  The aim is to make the display of duplication/deletion events easier.
+
+The input may contain several trees (one newick per tree). Each gene tree is
+converted to arrays (node names, children, taxon codes, events), and trees are
+processed in parallel with `-j`. With `-E`, the paralogy nodes are also written
+as a table of edges, so that plotting does not need to reparse the newick.
 """
 
 
-from sys import stdin, stderr, stdout
+from sys import stdin, stdout
 import re
 import argparse
-import ete3
 import os.path as op
+import logging
+logger = logging.getLogger(__name__)
 
-from LibsDyogen import myPhylTree
-from genetree_drawer import get_taxon, get_taxon_treebest, infer_gene_event
-#from dendro.reconciled
+from objectools import lazy_import, imap_window
+ete3 = lazy_import('ete3')
+myPhylTree = lazy_import('LibsDyogen.myPhylTree')
+from dendro.parsers import read_multinewick
+from dendro.reconciled import get_taxon, get_taxon_treebest, infer_gene_event
 
 ENSEMBL_VERSION = 85
 PHYLTREEFILE = op.expanduser("~/GENOMICUS{0}/PhylTree.Ensembl.{0}.conf")
 
+# Characters replaced by '_' in names and NHX values (like ete3).
+ILLEGAL_NEWICK_CHARS = re.compile(r'[:;(),\[\]\t\n\r=]')
 
-def pdbug(indent, *args, prefix='', sep=' ', end='\n', file=stderr):
-    """Debugging print. The indent should reflect the nesting level of calls."""
-    message = sep.join(str(arg) for arg in args)
-    message = '    '*indent + prefix + message.replace('\n', '\n' + '    '*indent + prefix)
-    print(message, end=end, file=file)
-
+EDGE_COLUMNS = ['tree', 'pair_id', 'parent_id', 'dup_node', 'parent_taxon',
+                'taxon', 'D', 'A', 'name']
 
-def buildparalogies(genetree, get_taxon, ancgene2sp,
-                    ensembl_version=ENSEMBL_VERSION,
-                    include_singleton_branches=False):
 
-    callnb = 0  #debug
-    indent = -1  #debug
+def make_ancgene2sp(phyltree):
+    return re.compile(r'(' + r'root|'
+                    + r'|'.join(list(phyltree.listSpecies) +
+                                sorted(phyltree.listAncestr,
+                                       key=lambda a: len(a),
+                                       reverse=True)).replace(' ','\.')
+                    + r')(.*)$')
 
-    # List of trees representing paralogies
-    paralogies = []
 
-    if include_singleton_branches:
-        def make_singleton_node(nodename, taxon):
-            snode = ete3.TreeNode(name=nodename)
-            snode.add_feature("S", taxon)
-            snode.add_feature("P", 1)  # whether it is a paralogy branch?
-            return snode
-    else:
-        def make_singleton_node(nodename, taxon):
-            return None
+def reconciled_arrays(genetree, get_taxon, ancgene2sp,
+                      ensembl_version=ENSEMBL_VERSION, taxon_codes=None):
+    """Convert an ete3 reconciled tree to lists indexed by node (preorder):
+    names, children (lists of indices), taxa (integer codes from
+    `taxon_codes`, extended with unknown taxa), events ('leaf'/'spe'/'dup')."""
+    if taxon_codes is None:
+        taxon_codes = {}
+    nodes, children = [], []
+    stack = [(genetree, None)]
+    while stack:
+        node, parent = stack.pop()
+        if parent is not None:
+            children[parent].append(len(nodes))
+        stack.extend((ch, len(nodes)) for ch in reversed(node.children))
+        nodes.append(node)
+        children.append([])
+    names = [node.name for node in nodes]
+    taxa = [taxon_codes.setdefault(get_taxon(node, ancgene2sp, ensembl_version),
+                                   len(taxon_codes))
+            for node in nodes]
+    code2taxon = {code: taxon for taxon, code in taxon_codes.items()}
+    events = [infer_gene_event(node, code2taxon[taxa[i]],
+                               set(code2taxon[taxa[ch]] for ch in children[i]))
+              for i, node in enumerate(nodes)]
+    # Treebest annotation, to compute events in another taxon.
+    flagged = [getattr(node, 'D', None) not in ('N', '0', 0, None)
+               or getattr(node, 'T', None)=='Y' for node in nodes]
+    return names, children, taxa, events, flagged
+
+
+class Paralogy(object):
+    """Node of a paralogy tree. `origin` is the index of the gene duplication
+    node from which the pair of paralogs descends."""
+    __slots__ = ('name', 'S', 'D', 'P', 'A', 'parent', 'origin', 'children')
+
+    def __init__(self, name, S, parent=None, origin=None):
+        self.name = name
+        self.S = S
+        self.D = None
+        self.P = 1  # whether it is a paralogy branch?
+        self.A = None
+        self.parent = parent
+        self.origin = origin
+        self.children = []
+
+
+def build_paralogy_nodes(names, children, taxa, events, flagged,
+                         include_singleton_branches=False):
+    """Return the list of paralogy nodes (in creation order, so parents come
+    before their children) and the list of roots.
+
+    The recursion of the original algorithm is run with generators on an
+    explicit stack."""
+    nodes = []  # All paralogy nodes
+    paralogies = []  # Roots
+
+    def event_at(paralog, taxon):
+        if taxa[paralog] == taxon:
+            return events[paralog]
+        if not children[paralog]:
+            return 'leaf'
+        return 'dup' if (flagged[paralog] or
+                         taxon in set(taxa[ch] for ch in children[paralog])) \
+                     else 'spe'
 
     # Paralog_packs: List of the 2 packs of genes on each 2 sides of the dup.
     # Can be of length>2 if the duplication is such.
-    def extendparalogy(paralog_packs: list, taxon: str,
-                       parent_paralogy=None) -> None:
+    def extendparalogy(paralog_packs, taxon, parent_paralogy=None, origin=None):
         """'Speciate' the paralogy, i.e divide the `paralog_packs` into their
-        descendant paralog_packs in each child_taxon, and call itself again on
-        each descendant paralogy"""
-        nonlocal callnb, indent  #debug
-        callnb += 1  #debug
-        indent += 1  #debug
-
-        pdbug(indent, taxon, 'call:', callnb, prefix='# ')
-
+        descendant paralog_packs in each child_taxon, and request a call on
+        each descendant paralogy (yield its arguments)"""
         # Create a node object representing the paralogy, if any. Attach to parent if any.
         para_size = len(paralog_packs)
         if para_size > 1:
-            para_name = '|'.join('-'.join(ch.name for ch in pack) for pack in paralog_packs)
-            current_paralogy = ete3.TreeNode(name=para_name)
-            current_paralogy.add_feature("S", taxon)
-            current_paralogy.add_feature("P", 1)  # It is a paralogy
-            #current_paralogy.add_feature("D", ("Y" if getattr(parent_paralogy, 'S', None)==taxon else "N")) #optional
-            #parent_paralogy.add_feature("D", )
+            para_name = '|'.join('-'.join(names[ch] for ch in pack)
+                                 for pack in paralog_packs)
+            current_paralogy = Paralogy(para_name, taxon, parent_paralogy, origin)
+        elif include_singleton_branches:
+            current_paralogy = Paralogy(names[next(iter(paralog_packs[0]))],
+                                        taxon, parent_paralogy, origin)
         else:
-            #assert len(paralog_packs[0]) == 1  # Not sure if it should happen
-            current_paralogy = make_singleton_node(list(paralog_packs[0])[0].name, taxon)
-            pdbug(indent, "No paralogy")
-        
+            current_paralogy = None
+
         if current_paralogy is not None:
+            nodes.append(current_paralogy)
             if parent_paralogy is None:
-                current_paralogy.add_feature('D', 'Y')
+                current_paralogy.D = 'Y'
                 paralogies.append(current_paralogy)
-                pdbug(indent, 'Create new paralogy', current_paralogy.name)
             else:
                 if parent_paralogy.D=="Y" and all(len(p)==1 for p in paralog_packs):
-                    current_paralogy.add_feature('A', 1)
+                    current_paralogy.A = 1
                 else:
-                    current_paralogy.add_feature('A', 0)
+                    current_paralogy.A = 0
                 # It is a "sub-paralogy" (steming from a main one by gene dupli)
-                parent_paralogy.add_child(current_paralogy)
-                pdbug(indent, ("dup" if parent_paralogy.D == "Y" else "spe") + '-extend paralogy from', parent_paralogy.name)
-        #pdbug(indent, current_paralogy.get_tree_root() if current_paralogy else None, prefix='> ')
-        pdbug(indent, 'paralog_packs:', paralog_packs)
+                parent_paralogy.children.append(current_paralogy)
 
         # The descendant paralog_pack in each species after the speciation:
         paralog_packs_after_speciation = {}  # {ch: [set()] * para_size}
-        #speciated_taxa = set()
-        
+
         # Empty paralogs if genes reached a speciation node.
         # Otherwise, replace the node by the duplication descendants and start a new paralogy
-        seen_paralogs = set() #debug
-
         for pack_i, paralog_pack in enumerate(paralog_packs):
             has_sub_paralogies = len(paralog_pack) > 1
-            #pdbug(indent, pack_i, paralog_pack, prefix='* ')
 
             while paralog_pack:
-                paralog = paralog_pack.pop()  # if isinstance(paralog_pack, set) else paralog = paralog_pack
-
-                children_taxa = [get_taxon(ch, ancgene2sp, ensembl_version)
-                                 for ch in paralog.children]
-                event = infer_gene_event(paralog, taxon, set(children_taxa))
-
-                #pdbug(indent, repr(paralog), event+':', paralog.children, prefix=' ** ')
+                paralog = paralog_pack.pop()
+                children_taxa = [taxa[ch] for ch in children[paralog]]
+                event = event_at(paralog, taxon)
 
                 if event == 'dup':
-                    #if para_size > 1 / current_paralogy is not None
-                    pdbug(indent, 'Dup!')
                     if current_paralogy is not None:
-                        current_paralogy.add_feature('D', 'Y')
-                        #if current_paralogy.P:
-                        #    # Only update the pack when we are in a paralogy.
-                        #    # If not, the current branch can be dropped, because
-                        #    # each paralog is already going to be checked in 
-                        #    # subsequent calls.
-                    paralog_pack.update(paralog.children)
-                    #if callnb == 32: import ipdb; ipdb.set_trace(context=1)
+                        current_paralogy.D = 'Y'
+                    paralog_pack.update(children[paralog])
                     if not has_sub_paralogies:
                         assert len(set(children_taxa)) == 1, "Missing speciation nodes"
-                        child_taxon = children_taxa[0]
-                        extendparalogy([set((ch,)) for ch in paralog.children],
-                                       children_taxa[0], current_paralogy)
-                        if include_singleton_branches and not getattr(parent_paralogy, 'P', 0):
-                            # It miraculously worked. I don't know why.
+                        yield ([set((ch,)) for ch in children[paralog]],
+                               children_taxa[0], current_paralogy, paralog)
+                        if include_singleton_branches and parent_paralogy is None:
                             # This is needed with option `include_singleton_branches=True`:
                             # it avoids drawing a "duplicate" branch for singleton genes left from a new paralogy node.
                             break
 
-                        extendparalogy(paralog_packs, children_taxa[0], current_paralogy)
-                        # Seems to work okay, but I suspect some paralogs are
-                        # checked several times.
-                        #break
+                        # Some paralogs might be checked several times.
+                        yield (paralog_packs, children_taxa[0], current_paralogy,
+                               origin)
                         has_sub_paralogies = True
 
-
-                    indent -= 1  #debug
-                    #also extendparalogy of the current paralogy (current_paralogy)
-                    #if has_sub_paralogies:
-                    #    paralog_pack.update(paralog.children)
-                        #extendparalogy
-                    #has_sub_paralogies = True
-
-
                 else:
                     # What if it is a leaf? The paralog is just popped out.
-                    for child_taxon, speciated_paralog in zip(children_taxa, paralog.children):
+                    for child_taxon, speciated_paralog in zip(children_taxa, children[paralog]):
                         speciated_paralog_packs = paralog_packs_after_speciation.setdefault(child_taxon, [set() for p in range(para_size)])
-                        #if child_taxon not in paralog_packs_after_speciation:
-                        #    paralog_packs_after_speciation[child_taxon] = [set() for i * para_size
                         speciated_paralog_packs[pack_i].add(speciated_paralog)
-                        #pdbug(indent, ' ** Add speciated paralog:', repr(speciated_paralog),
-                        #      '->', pack_i, child_taxon)
-
-                        assert speciated_paralog not in seen_paralogs #debug
-                        seen_paralogs.add(speciated_paralog) #debug
 
         assert taxon not in paralog_packs_after_speciation, \
             "Intermediate speciation nodes are missing at: %s -> %s" % \
-            (taxon, tuple(paralogs_after_speciation.keys()))
+            (taxon, tuple(paralog_packs_after_speciation.keys()))
 
-        #if para_size > 1 or no dup:
-        #if there hasn't been a complete update of the paralog_pack
-        # if there was a dup, this is redundant.
         for child_taxon, speciated_paralog_packs in paralog_packs_after_speciation.items():
             speciated_paralog_packs = [pack for pack in speciated_paralog_packs if pack]
 
             redundant_nodes = (len(speciated_paralog_packs) > 1 and set.intersection(*speciated_paralog_packs))
             assert not redundant_nodes, paralog_packs_after_speciation
 
-            pdbug(indent, 'Spe!')
             if current_paralogy is not None:
-                current_paralogy.add_feature('D', 'N')
-            extendparalogy(speciated_paralog_packs, child_taxon, current_paralogy)
-            indent -= 1  #debug
+                current_paralogy.D = 'N'
+            yield (speciated_paralog_packs, child_taxon, current_paralogy, origin)
+
+    calls = [extendparalogy([set((0,))], taxa[0])]
+    while calls:
+        try:
+            subcall = next(calls[-1])
+        except StopIteration:
+            calls.pop()
+        else:
+            calls.append(extendparalogy(*subcall))
+    return nodes, paralogies
+
+
+def _nhx_value(value):
+    return ILLEGAL_NEWICK_CHARS.sub('_', str(value))
+
+
+def format_paralogies(nodes, taxa_names):
+    """Newick (with NHX features S, D, P, A) of each paralogy tree, as written
+    by ete3 `write(format=1, format_root_node=True)`."""
+    texts = {}
+    roots = []
+    # Children are created after their parent.
+    for node in reversed(nodes):
+        label = ILLEGAL_NEWICK_CHARS.sub('_', node.name) + ':1'
+        features = [('S', taxa_names[node.S]), ('D', node.D), ('P', node.P),
+                    ('A', node.A)]
+        label += '[&&NHX:' + ':'.join('%s=%s' % (ft, _nhx_value(value))
+                                      for ft, value in features
+                                      if value is not None) + ']'
+        if node.children:
+            label = '(' + ','.join(texts.pop(id(ch)) for ch in node.children) \
+                    + ')' + label
+        texts[id(node)] = label
+        if node.parent is None:
+            roots.append(node)
+    return [texts[id(root)] + ';' for root in reversed(roots)]
+
+
+def paralogy_edges(nodes, names, taxa_names, treename=''):
+    """Rows of the edge table (see EDGE_COLUMNS): one per paralogy node."""
+    pair_ids = {id(node): i for i, node in enumerate(nodes)}
+    rows = []
+    for i, node in enumerate(nodes):
+        parent = node.parent
+        rows.append((treename, i,
+                     '' if parent is None else pair_ids[id(parent)],
+                     '' if node.origin is None else names[node.origin],
+                     '' if parent is None else taxa_names[parent.S],
+                     taxa_names[node.S],
+                     node.D or '', '' if node.A is None else node.A,
+                     node.name))
+    return rows
+
 
-    taxon = get_taxon(genetree, ancgene2sp, ensembl_version)
-    extendparalogy([set((genetree,))], taxon)
+def buildparalogies(genetree, get_taxon, ancgene2sp,
+                    ensembl_version=ENSEMBL_VERSION,
+                    include_singleton_branches=False):
+    """Return the paralogy trees (ete3) of an ete3 reconciled gene tree."""
+    taxon_codes = {}
+    arrays = reconciled_arrays(genetree, get_taxon, ancgene2sp,
+                               ensembl_version, taxon_codes)
+    nodes, _ = build_paralogy_nodes(*arrays, include_singleton_branches)
+    taxa_names = {code: taxon for taxon, code in taxon_codes.items()}
+    treenodes = {}
+    paralogies = []
+    for node in nodes:
+        treenode = treenodes[id(node)] = ete3.TreeNode(name=node.name)
+        for ft, value in (('S', taxa_names[node.S]), ('D', node.D),
+                          ('P', node.P), ('A', node.A)):
+            if value is not None:
+                treenode.add_feature(ft, value)
+        if node.parent is None:
+            paralogies.append(treenode)
+        else:
+            treenodes[id(node.parent)].add_child(treenode)
     return paralogies
 
 
+# Settings of the worker process
+_converter = None
+
+def _init_converter(taxa, ancgene2sp, treebest=False,
+                    ensembl_version=ENSEMBL_VERSION,
+                    include_singleton_branches=False, edges=False):
+    global _converter
+    _converter = dict(taxon_codes={taxon: i for i, taxon in enumerate(taxa)},
+                      ancgene2sp=ancgene2sp,
+                      get_taxon=(get_taxon_treebest if treebest else get_taxon),
+                      ensembl_version=ensembl_version,
+                      include_singleton_branches=include_singleton_branches,
+                      edges=edges)
+
+
+def convert_newick(newick):
+    """Return the text of the paralogy trees, and the edge rows."""
+    genetree = ete3.Tree(newick, format=1)
+    taxon_codes = dict(_converter['taxon_codes'])
+    arrays = reconciled_arrays(genetree, _converter['get_taxon'],
+                               _converter['ancgene2sp'],
+                               _converter['ensembl_version'], taxon_codes)
+    nodes, _ = build_paralogy_nodes(*arrays,
+                    _converter['include_singleton_branches'])
+    taxa_names = [None] * len(taxon_codes)
+    for taxon, code in taxon_codes.items():
+        taxa_names[code] = taxon
+    text = ''.join(nwk + '\n' for nwk in format_paralogies(nodes, taxa_names))
+    rows = paralogy_edges(nodes, arrays[0], taxa_names, genetree.name) \
+            if _converter['edges'] else []
+    return text, rows
+
+
+def iter_input_newicks(inputnwk=None):
+    """Newick strings from a file, stdin, or the argument itself."""
+    if inputnwk is None:
+        yield from read_multinewick(stdin)
+    elif not op.exists(inputnwk):
+        yield inputnwk
+    else:
+        with open(inputnwk) as f:
+            yield from read_multinewick(f)
+
 
 def main(inputnwk, outputnwk, ensembl_version=ENSEMBL_VERSION,
          phyltreefile=PHYLTREEFILE, treebest=False,
-         include_singleton_branches=False, include_singleton_root=False):
+         include_singleton_branches=False, include_singleton_root=False,
+         edgefile=None, ncores=1, chunksize=20):
 
     phyltree = myPhylTree.PhylogeneticTree(phyltreefile.format(ensembl_version))
-
-    ancgene2sp = re.compile(r'(' + r'root|'
-                    + r'|'.join(list(phyltree.listSpecies) +
-                                sorted(phyltree.listAncestr,
-                                       key=lambda a: len(a),
-                                       reverse=True)).replace(' ','\.')
-                    + r')(.*)$')
-
-    genetree = ete3.Tree(inputnwk or stdin.read(), format=1)
-
-    get_taxon = get_taxon_treebest if treebest else get_taxon
-
-    with (open(outputnwk, 'w') if outputnwk else stdout) as out:
-        for paralogy in buildparalogies(genetree, get_taxon, ancgene2sp,
-                                        ensembl_version,
-                                        include_singleton_branches):
-            outtext = paralogy.write(format=1, format_root_node=True,
-                                     features=['S', 'D', 'P', 'A'])
-            out.write(outtext + '\n')
+    taxa = list(phyltree.listSpecies) + list(phyltree.listAncestr)
+    initargs = (taxa, make_ancgene2sp(phyltree), treebest, ensembl_version,
+                include_singleton_branches, edgefile is not None)
+
+    newicks = (nwk for nwk in iter_input_newicks(inputnwk) if nwk.strip())
+    # Read the input as it is consumed (Pool.imap would read it all ahead).
+    results = imap_window(convert_newick, newicks, ncores,
+                          initializer=_init_converter, initargs=initargs,
+                          chunksize=chunksize)
+
+    edges_out = open(edgefile, 'w') if edgefile else None
+    try:
+        with (open(outputnwk, 'w') if outputnwk else stdout) as out:
+            if edges_out:
+                edges_out.write('\t'.join(EDGE_COLUMNS) + '\n')
+            for text, rows in results:
+                out.write(text)
+                if edges_out:
+                    edges_out.writelines('\t'.join(map(str, row)) + '\n'
+                                         for row in rows)
+    finally:
+        if edges_out:
+            edges_out.close()
 
 
 if __name__ == '__main__':
+    logging.basicConfig()
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument('inputnwk', nargs='?', help='Input file or `stdin` if None')
     parser.add_argument('outputnwk', nargs='?', help='Output file or `stdout` if None')
@@ -233,6 +363,13 @@ if __name__ == '__main__':
                         action='store_true',
                         help='Keep the original root of the gene tree, even ' \
                              'if it\'s not a paralogy. Discard other singletons')
+    parser.add_argument('-E', '--edgefile',
+                        help='Also write the paralogy nodes as a table: ' + \
+                             ', '.join(EDGE_COLUMNS))
+    parser.add_argument('-j', '--ncores', type=int, default=1,
+                        help='number of worker processes [%(default)s]')
+    parser.add_argument('-c', '--chunksize', type=int, default=20,
+                        help='trees sent at once to a worker [%(default)s]')
 
     args = parser.parse_args()
     main(**vars(args))
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from types import SimpleNamespace
+import pytest
+ete3 = pytest.importorskip('ete3')
+from dendro.converters import ProtTree_to_newick, ProtTree_to_ete3
+
+
+def make_prottree():
+    """Stand-in for a LibsDyogen ProteinTree: ((g3, g4)dup, g5)"""
+    return SimpleNamespace(
+            root=1,
+            data={1: [(2, 0.1234567891), (5, 123456.789012)],
+                  2: [(3, 1e-7), (4, 2)]},
+            info={1: {'taxon_name': 'Homo sapiens', 'Duplication': 0,
+                      'family_name': 'fam1'},
+                  2: {'taxon_name': 'Homo sapiens', 'Duplication': 2,
+                      'family_name': 'fam1.a'},
+                  3: {'taxon_name': 'Homo sapiens', 'gene_name': 'g3/p3'},
+                  4: {'taxon_name': 'Homo sapiens', 'gene_name': 'g4'},
+                  5: {'taxon_name': 'Mus musculus', 'gene_name': 'g5'}})
+
+
+def test_ProtTree_to_newick():
+    prottree = make_prottree()
+    tree = ete3.Tree(ProtTree_to_newick(prottree), format=1)
+    expected = ProtTree_to_ete3(prottree)
+    assert tree.name == 'fam1'
+    assert [leaf.name for leaf in tree] == ['g3', 'g4', 'g5']
+    # Same branch lengths, without rounding.
+    assert [node.dist for node in tree.iter_descendants()] == \
+            [node.dist for node in expected.iter_descendants()]
+    assert (tree & 'g3').dist == 1e-7
+    assert (tree & 'g5').dist == 123456.789012
+    dup = tree & 'fam1.a'
+    assert (dup.ID, dup.S, dup.D) == ('2', 'Homo.sapiens', 'Y')
+    assert (tree.D, (tree & 'g5').S) == ('N', 'Mus.musculus')
+    assert not hasattr(tree & 'g5', 'D')
+
+
+def test_ProtTree_to_newick_without_dist_and_tags():
+    assert ProtTree_to_newick(make_prottree(), root=2, withDist=False,
+                              withTags=False) == '(g3,g4)fam1.a;'
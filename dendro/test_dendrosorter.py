@@ -161,6 +161,40 @@ class Test_find_pivot(object):
         assert pivot == (tree&'a')
 
 
+def make_pectinate(n):
+    """Caterpillar tree with n internal nodes and 2n+1 nodes in total: ((...,l1)n1,l0)n0"""
+    root = node = ete3.Tree(name='n0')
+    for i in range(n):
+        node.add_child(name='l%d' % i)
+        node = node.add_child(name='n%d' % (i+1))
+    return root
+
+
+class Test_deep_pectinate(object):
+    """50k-node caterpillar trees must not hit the recursion limit."""
+    n = 25000
+
+    def test_ladderize(self):
+        tree = make_pectinate(self.n)
+        sizes = ds.ladderize(tree, tree, get_children, assign=set_children)
+        assert sizes[tree] == self.n + 1
+        # light leaf on top:
+        assert [ch.name for ch in tree.children] == ['l0', 'n1']
+    def test_ladderize_heavy_on_top(self):
+        tree = make_pectinate(self.n)
+        ds.ladderize(tree, tree, get_children, heavy_on_top=True, assign=set_children)
+        assert [ch.name for ch in tree.children] == ['n1', 'l0']
+    def test_pyramid(self):
+        tree = make_pectinate(self.n)
+        ds.pyramid(tree, tree, get_children, assign=set_children)
+        assert len(tree) == self.n + 1
+    def test_leaf_sort(self):
+        tree = make_pectinate(self.n)
+        ds.leaf_sort(tree, tree, get_children, assign_children=set_children,
+                     get_attribute=lambda tree, node: node.name)
+        assert [ch.name for ch in tree.children] == ['l0', 'n1']
+
+
 if __name__ == '__main__':
     from sys import exit
     results = []
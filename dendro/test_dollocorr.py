@@ -3,6 +3,7 @@
 
 from io import StringIO
 
+from LibsDyogen import myPhylTree
 from dendro.dollocorr import *
 
 
@@ -145,6 +146,23 @@ maddison_test(0, 2, tree_Maddison2, ['G', 'uv'], roots_0=['ab'], alternative='='
 assert (55,69) == maddison_test(1, 2, tree_Maddison2, ['G', 'uv'], roots_0=['ab'])
 
 
+# Subtree counts are cached and reused between tests of the same tree.
+counter = SingleEventCounter(tree5caterpillar)
+assert (14,16) == maddison_test(1, 2, tree5caterpillar, ['abc'], counter=counter)
+assert ('abc', 2) in counter.cache
+assert (12,16) == maddison_test(1, 2, tree5caterpillar, ['abc'], roots_0=['A'], counter=counter)
+assert (r == counter.counts(6)).all()
+
+# More events in the roots_1 subtree than leaves outside of it.
+assert (1,5) == maddison_test(3, 3, tree4caterpillar, ['abc'], alternative='=')
+
+# No int64 overflow: 2 ways per leaf of a star tree with 70 leaves.
+star70 = myPhylTree.PhylogeneticTree(StringIO(
+            "(%s)r;" % ','.join('L%d:1' % i for i in range(70))))
+assert place_single_events(70, star70)[70] == 1
+assert place_single_events(35, star70)[35] == 112186277816662845432
+
+
 # Test with 0 loss. The result should be NaN? Or 1?
 assert (1, 1) == print(maddison_test(0, 0, tree_Maddison2, ['G', 'uv']))
 
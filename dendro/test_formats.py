@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from io import StringIO
+import numpy as np
+import pytest
+import ete3
+from dendro.formats import beast_comment_parser, parse_beast_comments, \
+                           format_NHX_columns, beast_tree_to_nhx, \
+                           iter_nexus_trees, nexus2nhx
+
+
+NEXUS = """#NEXUS
+
+Begin trees;
+	Translate
+		1 A,
+		2 'B b'
+		;
+tree TREE1 = [&R] (1[&rate=0.5,height_95%_HPD={0.1,0.3}]:1.5,2[&rate=2.0,height_95%_HPD={0.2,0.4}]:1.5)[&height=1.5,height_95%_HPD={1.0,2.0},posterior=1.0];
+End;
+"""
+
+
+def test_beast_comment_parser():
+    variables = beast_comment_parser('[&rate=0.5,range={1,2.5},name="a,b",x=NA]')
+    assert list(variables.items()) == [('rate', 0.5), ('range', [1., 2.5]),
+                                       ('name', '"a,b"'), ('x', 'NA')]
+    assert beast_comment_parser('[&]') == {}
+    with pytest.raises(ValueError):
+        beast_comment_parser('[&rate]')
+
+
+def test_parse_beast_comments():
+    bodies = ['rate=0.5,range={1,2}', 'rate=2', 'range={3,4},name=x', '']
+    columns = parse_beast_comments(bodies)
+    assert list(columns) == ['rate', 'range', 'name']
+    np.testing.assert_array_equal(columns['rate'], [0.5, 2, np.NaN, np.NaN])
+    assert columns['range'].shape == (4, 2)
+    assert np.isnan(columns['range'][1]).all()
+    assert columns['name'] == [None, None, 'x', None]
+    assert format_NHX_columns(columns, len(bodies)) == [
+            '&&NHX:rate=0.5:range={1.0..2.0}', '&&NHX:rate=2.0',
+            '&&NHX:range={3.0..4.0}:name=x', '']
+
+
+def test_beast_tree_to_nhx():
+    nhx = beast_tree_to_nhx('[&R] (1[&rate=0.5,r={1,2}]:1.5,b:2)[&height=2];',
+                            {'1': 'A a'})
+    assert nhx == "('A a':1.5[&&NHX:rate=0.5:r={1..2}],b:2)[&&NHX:height=2];"
+
+
+def test_beast_tree_to_nhx_keeps_quoted_commas():
+    nhx = beast_tree_to_nhx('(a[&name="x,y",r={1,2}]:1,b[&name="z"]:2);')
+    assert nhx == '(a:1[&&NHX:name="x,y":r={1..2}],b:2[&&NHX:name="z"]);'
+
+
+def test_beast_tree_to_nhx_merges_node_comments():
+    nhx = beast_tree_to_nhx('(1[&rate=1][&x=2]:1.0,b[&R]:2[&y={3,4}],'
+                            'c:3[&z=5] [&t=6])[&height=2][&R];', {'1': 'a'})
+    assert nhx == '(a:1.0[&&NHX:rate=1:x=2],b:2[&&NHX:y={3..4}],' \
+                  'c:3[&&NHX:z=5:t=6])[&&NHX:height=2];'
+
+
+def test_nexus2nhx(tmp_path):
+    infile = tmp_path / 'trees.nex'
+    infile.write_text(NEXUS)
+    outfile = tmp_path / 'trees.nhx'
+    nexus2nhx(str(infile), str(outfile))
+    lines = outfile.read_text().splitlines()
+    assert len(lines) == 1
+    tree = ete3.Tree(lines[0], format=1, quoted_node_names=True)
+    assert sorted(tree.get_leaf_names()) == ['A', 'B b']
+    leaf = tree & 'A'
+    assert leaf.dist == 1.5
+    assert leaf.rate == '0.5'
+    assert getattr(leaf, 'height_95%_HPD') == '{0.1..0.3}'
+    assert tree.posterior == '1.0'
+    assert len(list(iter_nexus_trees(StringIO(NEXUS)))) == 1
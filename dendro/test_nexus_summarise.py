@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from io import StringIO
+import pytest
+from dendro.nexus_summarise import iter_nexus_trees, summarise, TaxonIndex, \
+                                   CladeTree, HeightSketch
+
+
+NEXUS = """#NEXUS
+
+Begin taxa;
+	Dimensions ntax=4;
+End;
+Begin trees;
+	Translate
+		1 A,
+		2 B,
+		3 'C c',
+		4 D
+		;
+tree STATE_0 = [&R] ((1:3,3:3):1,(2:2,4:2):2);
+tree STATE_10 = [&R] ((1[&rate=1.0]:1.0,2:1.0)[&rate=0.5]:2.0,(3:0.5,4:0.5):2.5);
+tree STATE_20 [&lnP=-10.5] = [&R] ((4:0.6,3:0.6):2.4,(2:1.2,1:1.2):1.8);
+tree STATE_30 = [&R] ((1:1.4,2:1.4):1.6,(3:0.4,4:0.4):2.6);
+tree STATE_40 = [&R] ((1:2,3:2):1,(2:1,4:1):2);
+End;
+"""
+
+
+def test_iter_nexus_trees():
+    translate = {}
+    trees = list(iter_nexus_trees(StringIO(NEXUS), translate))
+    assert translate == {'1': 'A', '2': 'B', '3': 'C c', '4': 'D'}
+    assert [name for name, _ in trees] == ['STATE_%d' % i for i in range(0, 50, 10)]
+    assert trees[2][1] == '[&R] ((4:0.6,3:0.6):2.4,(2:1.2,1:1.2):1.8);'
+
+
+def test_cladetree():
+    taxa = TaxonIndex()
+    tree = CladeTree("(('A':1,B:1)[&x=1]AB:2,C:3)[&R];", taxa)
+    assert taxa.taxa == ['A', 'B', 'C']
+    assert tree.bits == [1, 2, 3, 4, 7]
+    assert tree.children == [[], [], [0, 1], [], [2, 3]]
+    assert tree.heights == [0, 0, 1, 0, 3]
+    assert tree.hashes[2] == (taxa.keys[0] + taxa.keys[1]) % 2**64
+    # Independent of the order of children
+    assert tree.topology_hash() == CladeTree('(C,(B,A));', taxa).topology_hash()
+    assert tree.topology_hash() != CladeTree('(B,(C,A));', taxa).topology_hash()
+    with pytest.raises(ValueError):
+        CladeTree('((A,B),C;', taxa)
+
+
+def test_summarise():
+    summary = summarise(StringIO(NEXUS), burnin_trees=1)
+    taxa = summary.taxa
+    AB = 1 << taxa['A'] | 1 << taxa['B']
+    CD = 1 << taxa['C c'] | 1 << taxa['D']
+    assert summary.ntrees == 4
+    assert summary.map_proba() == 0.75
+    assert summary.posterior(AB) == summary.posterior(CD) == 0.75
+    assert summary.clades[AB].mean() == pytest.approx(1.2)
+    assert summary.clades[AB].hpd(0.5) == pytest.approx((1.0, 1.2))
+    assert summary.clades[CD].median() == pytest.approx(0.5)
+    assert summary.format_newick() == (
+            '((A[&posterior=1,height_mean=0,height_median=0,height_95%_HPD={0,0}]:1.2,'
+            'B[&posterior=1,height_mean=0,height_median=0,height_95%_HPD={0,0}]:1.2)'
+            '[&posterior=0.75,height_mean=1.2,height_median=1.2,height_95%_HPD={1,1.4}]:1.8,'
+            "('C c'[&posterior=1,height_mean=0,height_median=0,height_95%_HPD={0,0}]:0.5,"
+            'D[&posterior=1,height_mean=0,height_median=0,height_95%_HPD={0,0}]:0.5)'
+            '[&posterior=0.75,height_mean=0.5,height_median=0.5,height_95%_HPD={0.4,0.6}]:2.5)'
+            '[&posterior=1,height_mean=3,height_median=3,height_95%_HPD={3,3}];')
+    table = list(summary.iter_clade_table(min_freq=0.5))
+    assert [(names, size, row[:2]) for names, size, row in table] == [
+            (['A', 'B', 'C c', 'D'], 4, [4, 1.]),
+            (['A', 'B'], 2, [3, 0.75]),
+            (['C c', 'D'], 2, [3, 0.75])]
+
+
+def test_heightsketch_bounded():
+    import random
+    rng = random.Random(1)
+    sketch = HeightSketch()
+    for x in range(10000):
+        sketch.add(float(x), 100, rng)
+    assert sketch.n == 10000 and len(sketch.sample) == 100
+    assert sketch.mean() == pytest.approx(4999.5)
+    low, high = sketch.hpd()
+    assert low < 1000 and high > 9000
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from copy import deepcopy
+from collections import defaultdict
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+from genomicustools.forest_table import ForestTableWriter, ForestTable
+from dendro.reconciled import prottree_extract_genecounts, \
+                              forest_table_extract_genecounts, \
+                              genecounts_cube
+
+
+def make_phyltree():
+    """Minimal stand-in for LibsDyogen.myPhylTree: ((A,B)AB,C)ABC"""
+    descendants = {'ABC': {'ABC', 'AB', 'A', 'B', 'C'}, 'AB': {'AB', 'A', 'B'},
+                   'A': {'A'}, 'B': {'B'}, 'C': {'C'}}
+    links = {'ABC': ['ABC'], 'AB': ['ABC', 'AB'], 'A': ['ABC', 'AB', 'A'],
+             'B': ['ABC', 'AB', 'B'], 'C': ['ABC', 'C']}
+    return SimpleNamespace(root='ABC',
+                           dicLinks={'ABC': links},
+                           allDescendants=descendants,
+                           outgroupSpecies=defaultdict(set),
+                           getTargetsAnc=lambda name: set(),
+                           officialName={t: t for t in descendants},
+                           listSpecies=['A', 'B', 'C'],
+                           allNames=set(descendants))
+
+
+def make_prottree(root, data, taxa, dups=()):
+    info = {}
+    for node, taxon in taxa.items():
+        info[node] = {'taxon_name': taxon,
+                      'Duplication': 2 if node in dups else 0,
+                      'family_name': 'fam%d' % node}
+        if node not in data:
+            info[node]['gene_name'] = 'gene%d' % node
+    return SimpleNamespace(root=root, info=info,
+            data={n: [(ch, 1.) for ch in children] for n, children in data.items()})
+
+
+def make_forest():
+    return [
+        # ABC speciation -> (AB duplication -> 2 x (A,B)), C
+        make_prottree(1, {1: [2, 3], 2: [4, 5], 4: [6, 7], 5: [8, 9]},
+                      {1: 'ABC', 2: 'AB', 3: 'C', 4: 'AB', 5: 'AB',
+                       6: 'A', 7: 'B', 8: 'A', 9: 'B'}, dups=(2,)),
+        # ABC speciation with a branch jumping over AB.
+        make_prottree(10, {10: [11, 12]}, {10: 'ABC', 11: 'A', 12: 'C'}),
+        # Rooted at AB.
+        make_prottree(20, {20: [21, 22], 22: [23, 24]},
+                      {20: 'AB', 21: 'A', 22: 'B', 23: 'B', 24: 'B'}, dups=(22,)),
+        ]
+
+
+@pytest.fixture
+def table(tmp_path):
+    with ForestTableWriter(str(tmp_path), chunk_rows=4) as writer:
+        for tree in make_forest():
+            writer.add_tree(tree)
+    return ForestTable.load(str(tmp_path))
+
+
+@pytest.mark.parametrize('keeponly', [None, 'stem', 'crown'])
+@pytest.mark.parametrize('ancestor', ['AB', 'ABC', 'A'])
+def test_same_as_prottree_extract(table, ancestor, keeponly):
+    phyltree = make_phyltree()
+    expected_ancs, expected_ancgenes, expected_counts, _ = \
+            prottree_extract_genecounts(deepcopy(make_forest()), ancestor,
+                                        phyltree, keeponly=keeponly)
+    species, rows, anc_index, counts = forest_table_extract_genecounts(
+                                        table, [ancestor], phyltree, keeponly)
+    assert (anc_index == 0).all()
+    assert ['fam%d' % node for node in table.node_id[rows]] == expected_ancgenes
+    assert counts.tolist() == [[gc.get(sp, 0) for sp in species]
+                               for gc in expected_counts]
+
+
+def test_genecounts_cube(table):
+    species, cube = genecounts_cube(table, ['AB', 'ABC'], make_phyltree())
+    assert species == ['A', 'B', 'C']
+    assert cube.shape == (3, 3, 2)
+    assert cube[:, :, 0].tolist() == [[2, 2, 0], [1, 0, 0], [1, 2, 0]]
+    assert cube[:, :, 1].tolist() == [[2, 2, 1], [1, 0, 1], [0, 0, 0]]
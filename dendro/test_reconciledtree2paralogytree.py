@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import ete3
+from dendro.reconciled import get_taxon_treebest
+from dendro.reconciledtree2paralogytree import _init_converter, convert_newick, \
+        buildparalogies, build_paralogy_nodes
+
+
+TAXA = ['Homo sapiens', 'Mus musculus', 'Gallus gallus', 'Euarchontoglires',
+        'Amniota']
+
+# Duplications in Euarchontoglires (E0), Homo sapiens (H0) and Gallus gallus (G0)
+GENETREE = ("((((h1[&&NHX:S=Homo.sapiens],h4[&&NHX:S=Homo.sapiens])H0[&&NHX:S=Homo.sapiens:D=Y],"
+            "m1[&&NHX:S=Mus.musculus])E1[&&NHX:S=Euarchontoglires:D=N],"
+            "(h3[&&NHX:S=Homo.sapiens],m3[&&NHX:S=Mus.musculus])E3[&&NHX:S=Euarchontoglires:D=N])E0[&&NHX:S=Euarchontoglires:D=Y],"
+            "(g1[&&NHX:S=Gallus.gallus],g2[&&NHX:S=Gallus.gallus])G0[&&NHX:S=Gallus.gallus:D=Y])A1[&&NHX:S=Amniota:D=N];")
+
+
+def test_convert_newick():
+    _init_converter(TAXA, None, treebest=True, edges=True)
+    text, rows = convert_newick(GENETREE)
+    assert text.splitlines() == [
+        '((h1|h4:1[&&NHX:S=Homo sapiens:P=1:A=1],h1-h4|h3:1[&&NHX:S=Homo sapiens:P=1:A=0])'
+        'H0|h3:1[&&NHX:S=Homo sapiens:D=Y:P=1:A=0],m1|m3:1[&&NHX:S=Mus musculus:P=1:A=0])'
+        'E1|E3:1[&&NHX:S=Euarchontoglires:D=N:P=1];',
+        'g1|g2:1[&&NHX:S=Gallus gallus:D=Y:P=1];']
+    # (tree, pair_id, parent_id, dup_node, parent_taxon, taxon, D, A, name)
+    assert rows[0] == ('A1', 0, '', 'E0', '', 'Euarchontoglires', 'N', '', 'E1|E3')
+    assert rows[2] == ('A1', 2, 1, 'H0', 'Homo sapiens', 'Homo sapiens', '', 1, 'h1|h4')
+    assert rows[5] == ('A1', 5, '', 'G0', '', 'Gallus gallus', 'Y', '', 'g1|g2')
+
+    # Same trees with the ete3 interface
+    paralogies = buildparalogies(ete3.Tree(GENETREE, format=1),
+                                 get_taxon_treebest, None)
+    assert [p.write(format=1, format_root_node=True, features=['S', 'D', 'P', 'A'])
+            for p in paralogies] == text.splitlines()
+
+
+def test_deep_duplications():
+    # Chain of successive duplications, deeper than the recursion limit
+    n = 1200
+    names = ['d%d' % i for i in range(n)] + ['g%d' % i for i in range(n + 1)]
+    children = [[i + 1, n + i] for i in range(n - 1)] + [[2*n - 1, 2*n]] \
+               + [[] for _ in range(n + 1)]
+    events = ['dup'] * n + ['leaf'] * (n + 1)
+    nodes, roots = build_paralogy_nodes(names, children, [0] * (2*n + 1),
+                                        events, [True] * n + [False] * (n + 1))
+    assert len(roots) == 1
+    assert roots[0].name == 'd1|g0'
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import numpy as np
+import ete3
+from dendro.any import methodchoice
+from dendro.transform_branchlengths import ForestBranches, transform_forest, \
+        discretize, rank, rescale, discretize_branchlengths
+
+
+def make_forest():
+    return [ete3.Tree('((a:1,b:2)x:3,c:4)r;', format=1),
+            ete3.Tree('((d:10,e:20)y:30,f:40)s;', format=1)]
+
+
+def test_ForestBranches():
+    branches = ForestBranches(methodchoice['ete3'], make_forest())
+    assert branches.dists.tolist() == [3, 4, 1, 2, 30, 40, 10, 20]
+    assert branches.tree_dists(1).tolist() == [30, 40, 10, 20]
+    # Write back by index
+    trees = branches.write(branches.dists * 2)
+    assert [n.dist for n in trees[0].traverse('preorder')] == [0, 6, 2, 4, 8]
+
+
+def test_transform_forest():
+    trees = transform_forest(methodchoice['ete3'], make_forest(), rank)
+    assert [n.dist for n in trees[1].traverse('postorder')] == [5, 6, 7, 8, 0.5]
+    trees = transform_forest(methodchoice['ete3'], make_forest(), rank,
+                             per_tree=True)
+    assert ([n.dist for n in trees[0].traverse('postorder')] ==
+            [n.dist for n in trees[1].traverse('postorder')] == [1, 2, 3, 4, 0.5])
+
+    trees = transform_forest(methodchoice['ete3'], make_forest(), rescale,
+                             per_tree=True, mean=1)
+    assert np.mean([n.dist for n in trees[1].iter_descendants()]) == 1
+
+    trees = transform_forest(methodchoice['ete3'], make_forest(), discretize,
+                             nbins=2, quantiles=True)
+    # Global median is 7; the maximum falls after the last edge (as np.digitize)
+    assert sorted(n.dist for n in trees[0].iter_descendants()) == [1, 1, 1, 1]
+    assert sorted(n.dist for n in trees[1].iter_descendants()) == [2, 2, 2, 3]
+
+
+def test_discretize_branchlengths():
+    tree = make_forest()[0]
+    reference = np.array([3, 4, 1, 2.])
+    bins = np.histogram_bin_edges(reference, bins=3)
+    discretize_branchlengths(methodchoice['ete3'], tree, nbins=3)
+    assert [n.dist for n in tree.traverse('preorder')] == \
+            np.digitize([0, 3, 1, 2, 4], bins).tolist()
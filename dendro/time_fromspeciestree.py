@@ -6,6 +6,9 @@
 
 
 from sys import stdout
+import os
+import os.path as op
+from functools import lru_cache
 import argparse as ap
 import ete3
 from LibsDyogen import myPhylTree
@@ -83,8 +86,20 @@ def time_fromspeciestree(tree, phyltree):
                     node_species = parent_species
 
 
+# The last species trees loaded, by absolute path and file version.
+@lru_cache(maxsize=4)
+def _load_phyltree(path, size, mtime_ns):
+    return myPhylTree.PhylogeneticTree(path)
+
+def load_phyltree(phyltreefile):
+    """Load the species tree, or reuse it if the file did not change."""
+    path = op.abspath(phyltreefile)
+    stat = os.stat(path)
+    return _load_phyltree(path, stat.st_size, stat.st_mtime_ns)
+
+
 def time_fromspeciestreeIO(treefile, phyltreefile, outfile=None):
-    phyltree = myPhylTree.PhylogeneticTree(phyltreefile)
+    phyltree = load_phyltree(phyltreefile)
     with open(treefile) as f:
         lines = f.readlines()
     with (open(outfile, 'w') if outfile else stdout) as out:
@@ -95,15 +110,23 @@ def time_fromspeciestreeIO(treefile, phyltreefile, outfile=None):
             out.write(newick + '\n')
 
 
-if __name__ == '__main__':
-    logging.basicConfig(format=logging.BASIC_FORMAT)
+def preload(args):
+    """Load the species tree (for a persistent server, see cmdserver)"""
+    load_phyltree(args.phyltreefile)
+
+
+def make_parser():
     parser = ap.ArgumentParser(description=__doc__)
     parser.add_argument('phyltreefile')
     parser.add_argument('treefile')
     parser.add_argument('outfile', nargs='?')
     parser.add_argument('-v', '--verbose', action='count', default=0)
-    
-    dargs = vars(parser.parse_args())
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(format=logging.BASIC_FORMAT)
+    dargs = vars(make_parser().parse_args(argv))
     verbosity = dargs.pop('verbose')
     if verbosity > 1:
         logger.setLevel(logging.DEBUG)
@@ -111,3 +134,7 @@ if __name__ == '__main__':
         logger.setLevel(logging.INFO)
 
     time_fromspeciestreeIO(**dargs)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,59 +1,142 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-""""""
+"""Transform the branch lengths of all trees of a file.
+
+The branch lengths of all trees are gathered into one array, so that the
+transform (bins, ranks, scaling) is computed once over the forest, or per tree
+with `--per-tree`.
+"""
 
 from dendro.parsers import parserchoice
 from dendro.any import methodchoice
-from dendro.bates import dfw_descendants_generalized
 import numpy as np
 
 import argparse as ap
 
 
-def discretize_branchlengths(tree_methods, tree, nbins=5):
-    get_items = tree_methods.get_items
-    set_items = tree_methods.set_items
-    get_root = tree_methods.get_root
-    get_dist = tree_methods.get_dist
-    root = get_root(tree)
-    rootdist = get_dist(tree, root)  # Unused.
+class ForestBranches(object):
+    """Branch lengths of a forest, as one array (`dists`), in depth-first
+    order of the parent nodes. Root lengths are kept apart (`root_dists`, NaN
+    if undefined), as they are not used to compute the transforms."""
+    def __init__(self, tree_methods, trees):
+        self.tree_methods = tree_methods
+        self.trees = list(trees)
+        get_items = tree_methods.get_items
+        get_root = tree_methods.get_root
+        get_dist = tree_methods.get_dist
+
+        self.roots = []
+        self.parents = []  # (tree index, (parent, dist), children)
+        # Start index of the branches of each tree, and end of the last one.
+        self.tree_offsets = [0]
+        dists = []
+        for t, tree in enumerate(self.trees):
+            root = get_root(tree)
+            rootdist = get_dist(tree, root)
+            self.roots.append((root, rootdist))
+            # Depth-first, like dendro.bates.dfw_descendants_generalized
+            queue = [(root, rootdist)]
+            while queue:
+                nodedist = queue.pop()
+                items = get_items(tree, nodedist)
+                if items:
+                    children = [ch for ch, _ in items]
+                    self.parents.append((t, nodedist, children))
+                    dists.extend([d for _, d in items])
+                    queue.extend(reversed(items))
+            self.tree_offsets.append(len(dists))
+        self.dists = np.array(dists, dtype=float)
+        self.root_dists = np.array([np.NaN if d is None else d
+                                    for _, d in self.roots], dtype=float)
+
+    def tree_dists(self, t):
+        return self.dists[self.tree_offsets[t]:self.tree_offsets[t+1]]
+
+    def transform(self, func, per_tree=False, **kwargs):
+        """Return the new (dists, root_dists), from `func(values, reference,
+        **kwargs)` where the reference is the forest (or tree) branch lengths."""
+        if not per_tree:
+            return (func(self.dists, self.dists, **kwargs),
+                    func(self.root_dists, self.dists, **kwargs))
+        newdists, newroots = [], []
+        for t in range(len(self.trees)):
+            reference = self.tree_dists(t)
+            newdists.append(func(reference, reference, **kwargs))
+            newroots.append(func(self.root_dists[t:t+1], reference, **kwargs))
+        if not newdists:
+            return self.dists.copy(), self.root_dists.copy()
+        return np.concatenate(newdists), np.concatenate(newroots)
+
+    def write(self, dists, root_dists=None):
+        """Set the branch lengths of the trees (inplace), by index."""
+        set_child_dists = self.tree_methods.set_child_dists
+        values = dists.tolist()
+        i = 0
+        for t, nodedist, children in self.parents:
+            set_child_dists(self.trees[t], nodedist, children,
+                            values[i:i+len(children)])
+            i += len(children)
+        if root_dists is not None:
+            for tree, (root, rootdist), newdist in zip(self.trees, self.roots,
+                                                       root_dists.tolist()):
+                if rootdist is not None:
+                    self.tree_methods.set_dist(tree, root, newdist)
+        return self.trees
+
+
+### Transforms: func(values, reference, **kwargs)
+
+def discretize(values, reference, nbins=5, quantiles=False):
+    """Index of the bin (from 1) of each value. Bins are equal-width over the
+    reference range, or contain equal numbers of reference values."""
+    if quantiles:
+        bins = np.quantile(reference, np.linspace(0, 1, nbins + 1))
+    else:
+        bins = np.histogram_bin_edges(reference, bins=nbins)
+    return np.digitize(values, bins)
 
-    distrib = []
-    iter_tree = list(dfw_descendants_generalized(tree, get_items, queue=[(root, rootdist)]))
 
-    for (parent, dist), items in iter_tree:
-        distrib.extend((d for ch,d in items))
+def multiply(values, reference, factor=1):
+    return values * factor
 
-    bins = np.histogram_bin_edges(distrib, bins=nbins)
-    newdists = np.digitize(distrib, bins)
-    i = 0
 
-    for (parent, dist), items in iter_tree:
-        newitems = [(ch, nd) for (ch, _), nd in zip(items, newdists[i:])]
-        set_items(tree, (parent, dist), newitems)
-        i+=len(newitems)
+def log(values, reference, offset=10):
+    return np.log(offset + values)
 
-    tree_methods.set_dist(tree, root, np.digitize(rootdist, bins))
-    return tree
 
-### TODO: new_age = log(10 + age)
+def rank(values, reference):
+    """Rank among the reference values (from 1, average rank for ties)"""
+    ordered = np.sort(reference)
+    return (np.searchsorted(ordered, values, side='left')
+            + np.searchsorted(ordered, values, side='right') + 1) / 2.
+
+
+def rescale(values, reference, mean=1):
+    """Scale so that the mean of the reference becomes `mean`"""
+    return values * (mean / reference.mean())
+
+
+TRANSFORMS = {'discretize': discretize,
+              'multiply': multiply,
+              'log': log,
+              'rank': rank,
+              'rescale': rescale}
+
+
+def transform_forest(tree_methods, trees, func, per_tree=False, **kwargs):
+    """Transform the branch lengths of all the trees (inplace)."""
+    branches = ForestBranches(tree_methods, trees)
+    return branches.write(*branches.transform(func, per_tree, **kwargs))
 
-def multiply_branchlengths(tree_methods, tree, factor=1):
-    get_items = tree_methods.get_items
-    set_items = tree_methods.set_items
-    get_root = tree_methods.get_root
-    get_dist = tree_methods.get_dist
-    root = get_root(tree)
-    rootdist = get_dist(tree, root)  # Unused.
 
-    iter_tree = list(dfw_descendants_generalized(tree, get_items, queue=[(root, rootdist)]))
+def discretize_branchlengths(tree_methods, tree, nbins=5):
+    transform_forest(tree_methods, [tree], discretize, nbins=nbins)
+    return tree
 
-    for (parent, dist), items in iter_tree:
-        newitems = [(ch, d*factor) for ch, d in items]
-        set_items(tree, (parent, dist), newitems)
 
-    tree_methods.set_dist(tree, root, rootdist*factor)
+def multiply_branchlengths(tree_methods, tree, factor=1):
+    transform_forest(tree_methods, [tree], multiply, factor=factor)
     return tree
 
 
@@ -64,36 +147,47 @@ def main():
     parser.add_argument('-p', '--parser', choices=list(set(k.lower() for k in parserchoice.keys())),
                         default='ete3',
                         help='[%(default)s]')
-    
+    parser.add_argument('-t', '--per-tree', action='store_true',
+                        help='compute the transform separately for each tree '
+                             '(default: over all branches of the file)')
+
     subp = parser.add_subparsers(dest='transform')
 
     pars_discret = subp.add_parser('discretize', aliases=['disc'],
                                    help='Convert branch lengths to a limited set of integers')
     pars_discret.add_argument('-n', '--nbins', type=int, default=5,
                               help='number of bins [%(default)s]')
+    pars_discret.add_argument('-q', '--quantiles', action='store_true',
+                              help='bins of equal counts instead of equal width')
 
     pars_multiply = subp.add_parser('multiply', aliases=['mult'], help='')
     pars_multiply.add_argument('factor', type=float, help='')
 
+    pars_log = subp.add_parser('log', help='log(offset + length)')
+    pars_log.add_argument('-o', '--offset', type=float, default=10,
+                          help='[%(default)s]')
+
+    subp.add_parser('rank', help='Rank of the branch length (average for ties)')
+
+    pars_rescale = subp.add_parser('rescale', help='Divide by the mean branch length')
+    pars_rescale.add_argument('-m', '--mean', type=float, default=1,
+                              help='new mean branch length [%(default)s]')
+
     args = parser.parse_args()
-    transform = args.transform
-    delattr(args, 'transform')
+    transform = {'disc': 'discretize', 'mult': 'multiply'}.get(args.transform,
+                                                               args.transform)
+    if transform not in TRANSFORMS:
+        raise ValueError('Invalid transform command %r' % transform)
+    kwargs = {k: v for k, v in vars(args).items()
+              if k not in ('treefile', 'parser', 'per_tree', 'transform')}
 
     parse_tree = parserchoice[args.parser]
     #convert_tree = convertchoice[args.parser]['ete3']
     tree_methods = methodchoice[args.parser]
 
-    if transform in ('disc', 'discretize'):
-        func = discretize_branchlengths
-        kwargs = dict(nbins=args.nbins)
-    elif transform in ('mult', 'multiply'):
-        func = multiply_branchlengths
-        kwargs = dict(factor=args.factor)
-    else:
-        raise ValueError('Invalid transform command %r' % transform)
-
-    for tree in parse_tree(args.treefile):
-        func(tree_methods, tree, **kwargs)  # inplace
+    trees = transform_forest(tree_methods, parse_tree(args.treefile),
+                             TRANSFORMS[transform], args.per_tree, **kwargs)
+    for tree in trees:
         tree_methods.print_newick(tree)
 
 
@@ -38,11 +38,18 @@ def treebest2genomicus(treebestnwk, genetreename, outfile):
 
 
 
-if __name__ == '__main__':
+def make_parser():
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument('treebestnwk')
     parser.add_argument('genetreename')
     parser.add_argument('outfile')
-    
-    args = parser.parse_args()
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
     treebest2genomicus(**vars(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -72,33 +72,38 @@ def thin_prottree(tree, root, rootdist, keptleaves):
 
     This edits the structure (copying might be needed).
     """
-    if root not in tree.data:
-        if root in keptleaves:
-            return root, rootdist
+    # (new node, new dist) of each visited node, children before parents.
+    thinned = {}
+    for (node, dist), childrendists in rev_dfw_descendants(tree,
+                                            lambda tree, nd: tree.data.get(nd[0], []),
+                                            include_leaves=True,
+                                            queue=[(root, rootdist)]):
+        if node not in tree.data:
+            if node in keptleaves:
+                thinned[node] = (node, dist)
+            else:
+                del tree.info[node]
+                thinned[node] = (None, None)
+            continue
+
+        newnodedata = [thinned.pop(child) for child, _ in childrendists]
+        newnodedata = [chdata for chdata in newnodedata if chdata[0] is not None]
+
+        if not newnodedata:
+            del tree.data[node]
+            del tree.info[node]
+            thinned[node] = (None, None)
+        elif len(newnodedata) == 1:
+            del tree.data[node]
+            del tree.info[node]
+            child, newdist = newnodedata[0]
+            # Transfer the branch length to the *child*
+            thinned[node] = (child, dist + newdist)
         else:
-            del tree.info[root]
-            return None, None
-    
-    newnodedata = []
-    for child,dist in tree.data[root]:
-        thinned_child, thinned_dist = thin_prottree(tree, child, dist, keptleaves)
-        if thinned_child is not None:
-            newnodedata.append((thinned_child, thinned_dist))
-    
-    if not newnodedata:
-        del tree.data[root]
-        del tree.info[root]
-        return None, None
-
-    if len(newnodedata) == 1:
-        del tree.data[root]
-        del tree.info[root]
-        root, newdist = newnodedata[0]
-        rootdist += newdist  # Transfer the branch length to the *child*
-    else:
-        tree.data[root] = newnodedata
-
-    return root, rootdist
+            tree.data[node] = newnodedata
+            thinned[node] = (node, dist)
+
+    return thinned[root]
 
 
 def fuse_single_child_nodes_ete3(tree, copy=True):
@@ -22,6 +22,7 @@ from datasci.dataframe_recipees import bounded_background_gradient, \
                                        matplotlib_background_gradient
 from datasci.savior import HtmlReport, css_dark_style, reroute_loggers, \
                            generate_slideshow, slideshow_generator
+from duprates.distrib_fits import fit_all
 
 from genchron.analyse.regress_dating_errors import *
 import genchron.analyse.regress_dating_errors as aregr
@@ -204,9 +205,11 @@ def fmt_params_gamma(params, prec=4, floc=None, sep=', '):
 
 
 def fit_distribs(distribs, df, nodup, x=None, nbins=100, stream=None, lang_fr=True, dark=False,
-                 fix_loc=0):
+                 fix_loc=0, ncores=1, cachedir=None):
     """
     floc: fix the location parameter when fitting.
+    ncores: number of processes fitting the distributions (see `distrib_fits.fit_all`).
+    cachedir: where to cache the fits, so that only the plots are redone.
     """
     if dark: plt.style.use('softdark')  # Also see the default 'dark_background'
     dist_realnames = distrib_realnames_fr if lang_fr else distrib_realnames
@@ -220,10 +223,11 @@ def fit_distribs(distribs, df, nodup, x=None, nbins=100, stream=None, lang_fr=Tr
             df.lossrate[~nodup].values,
             df.lossrate[nodup].values)
     hist_kwargs = dict(density=True, edgecolor='none', alpha=0.7, rwidth=1.05)  # stacked=True
+    # All fits at once, with the likelihoods and KS tests.
+    fit_table = fit_all(distribs, datas, fix_loc, ncores, cachedir)
     for i, distrib in enumerate(distribs, start=1):
         floc = fix_loc #floc = None if distrib in strictly_positive_distribs else fix_loc
         # TODO: fix loc for Pareto for datas[1]
-        fit_kw = {} if floc is None else {'floc': floc}
         fmt_fit = (partial(fmt_params_gamma, floc=floc) if distrib.name == 'gamma'
                    else partial(fmt_params, distrib, floc=floc))
         distname = dist_realnames.get(distrib.name)
@@ -260,7 +264,8 @@ def fit_distribs(distribs, df, nodup, x=None, nbins=100, stream=None, lang_fr=Tr
         ymax = h_loss.max()
         axes_loss.dobreak(max(h_loss[h_loss<ymax]))
 
-        fits = [distrib.fit(data, **fit_kw) for data in datas]
+        distrib_fits = fit_table.loc[distrib.name]
+        fits = distrib_fits.params.tolist()
         if len(fits[0]) != distrib.numargs + 2:
             logger.error('Unexpected difference in nb params: theo %d VS fitted %d',
                          distrib.numargs+2, len(fits[0]))
@@ -293,13 +298,11 @@ def fit_distribs(distribs, df, nodup, x=None, nbins=100, stream=None, lang_fr=Tr
               entropy(h_loss - h_loss_nodup, loss_density_dup),
               entropy(h_loss_nodup, loss_density_nodup)]
         # negative log-likelihood:
-        nlL = [distrib.nnlf(fit, data) for fit, data in zip(fits, datas)]
-        aic = [2*distrib_k + 2*nll for nll in nlL]
-        ks, ks_p = zip(*[st.kstest(data, distrib(*fit).cdf, N=nbins) for fit, data
-                         in zip(fits, datas)])
+        nlL, aic, bic, ks, ks_p = (distrib_fits[col].tolist() for col in
+                                   ('nlL', 'AIC', 'BIC', 'KS', 'KS_p'))
 
-        for info in zip(descriptions, kl, nlL, aic, ks, ks_p):
-            print('%-14s: KL = %8.6f;  -lL = %8.1f;  AIC = %7.0f;  KS = %8.6g p=%-8g' % info, file=stream)
+        for info in zip(descriptions, kl, nlL, aic, bic, ks, ks_p):
+            print('%-14s: KL = %8.6f;  -lL = %8.1f;  AIC = %7.0f;  BIC = %7.0f;  KS = %8.6g p=%-8g' % info, file=stream)
 
         axes_loss.plot(xloss, loss_density,
                        label=fmt_fit(fits[2]))
@@ -312,22 +315,35 @@ def fit_distribs(distribs, df, nodup, x=None, nbins=100, stream=None, lang_fr=Tr
         fig.suptitle('Fitting %s' % distrib.name)
         logger.info('Fitted %-16s [%2d/%d]' % (distrib.name, i, len(distribs)))
 
-        yield fig, kl, nlL, aic, ks, ks_p
-
-
-def load_generax_familyrates():
-    #infile = op.join(workdir, 'familyrates.txt')
-    infile = workdir / 'familyrates.tsv'
-
-    df = pd.read_csv(str(infile), sep='\t', index_col=0, header=None,
-                     names=['nb', 'subgenetree', 'duprate', 'lossrate',
-                            'phy_lL', 'rec_lL',
-                            'S', 'SL', 'D', 'T', 'TL', 'Leaf', 'Invalid'],
-                     dtype={'nb': str, 'subgenetree': str,
-                            'duprate': float, 'lossrate': float,
-                            'phy_lL': float, 'rec_lL': float,
-                            'S': int, 'SL': int, 'D': int, 'T': int, 'TL': int,
-                            'Leaf': int, 'Invalid': int})
+        yield fig, kl, nlL, aic, bic, ks, ks_p
+
+
+def load_generax_familyrates(store=None):
+    """Load the GeneRax results gathered in `workdir/familyrates.tsv`, or in
+    the given store of `duprates.gather_reconciliations`."""
+    if store is not None:
+        from duprates.gather_reconciliations import load_store
+        df = load_store(store)
+        df = df[df.source == 'generax']
+        # Family number from the run directory (generax_family-1by1/NN/NNN)
+        df.index = pd.Index(df.path.str.replace(r'^.*/(\d+)/(\d+)/?$', r'\1\2',
+                                                regex=True), name='nb')
+        df = df.rename(columns={'family': 'subgenetree'})[
+                        ['subgenetree', 'duprate', 'lossrate', 'phy_lL', 'rec_lL',
+                         'S', 'SL', 'D', 'T', 'TL', 'Leaf', 'Invalid']]
+    else:
+        #infile = op.join(workdir, 'familyrates.txt')
+        infile = workdir / 'familyrates.tsv'
+
+        df = pd.read_csv(str(infile), sep='\t', index_col=0, header=None,
+                         names=['nb', 'subgenetree', 'duprate', 'lossrate',
+                                'phy_lL', 'rec_lL',
+                                'S', 'SL', 'D', 'T', 'TL', 'Leaf', 'Invalid'],
+                         dtype={'nb': str, 'subgenetree': str,
+                                'duprate': float, 'lossrate': float,
+                                'phy_lL': float, 'rec_lL': float,
+                                'S': int, 'SL': int, 'D': int, 'T': int, 'TL': int,
+                                'Leaf': int, 'Invalid': int})
     logger.info('Loaded data (shape %s)', df.shape)
     df['duprate_nonzero'] = (df.duprate.dropna()>1e-7)
     df['generax_robust'] = ~(df[['SL', 'D', 'T', 'TL']].dropna().any(axis=1))
@@ -465,7 +481,7 @@ def analysis_1_generax_withgamma(lang_fr=True, dark=False):
 
 
 def analysis_2_alldistribs(lang_fr=True, dark=False, restrict_distribs=True,
-        fix_loc=0):
+        fix_loc=0, ncores=1):
     filesuffix = '_restricted' if restrict_distribs else ''
     if fix_loc is None: filesuffix += '_nofloc'
     dist_realnames = distrib_realnames_fr if lang_fr else distrib_realnames
@@ -492,20 +508,22 @@ def analysis_2_alldistribs(lang_fr=True, dark=False, restrict_distribs=True,
         # log-logistique (=Fisk)
         # Gompertz (age-dependent proba of dying)
 
-        all_kl, all_nlL, all_aic, all_ks, all_ks_p = [], [], [], [], []
+        all_kl, all_nlL, all_aic, all_bic, all_ks, all_ks_p = [], [], [], [], [], []
         with PdfPages('distrib_fits_duploss%s.pdf' % filesuffix) as pdfdoc:
-            for _, (fig, kl, nlL, aic, ks, ks_p) in zip(
+            for _, (fig, kl, nlL, aic, bic, ks, ks_p) in zip(
                     generate_slideshow(hr, len(tested_distribs)),
                     fit_distribs(tested_distribs,
                                          df, nodup, x=['duprate', 'lossrate'],
                                          stream=hr, lang_fr=lang_fr, dark=dark,
-                                         fix_loc=fix_loc)):
+                                         fix_loc=fix_loc, ncores=ncores,
+                                         cachedir=str(workdir / 'fit_cache'))):
                 hr.show(fig)
                 pdfdoc.savefig(fig, bbox_inches='tight', transparent=True,
                                facecolor=('k' if dark else 'none'))
                 plt.close()
                 all_kl.append(kl)
                 all_aic.append(aic)
+                all_bic.append(bic)
                 all_ks.append(ks)
                 all_ks_p.append(ks_p)
                 hr.flush()
@@ -515,12 +533,14 @@ def analysis_2_alldistribs(lang_fr=True, dark=False, restrict_distribs=True,
                              index=[dist_realnames.get(d.name, d.name.capitalize()) for d in tested_distribs])
         aic_df = pd.DataFrame(all_aic, columns=descriptions_tex,
                               index=[dist_realnames.get(d.name, d.name.capitalize()) for d in tested_distribs])
+        bic_df = pd.DataFrame(all_bic, columns=descriptions_tex,
+                              index=[dist_realnames.get(d.name, d.name.capitalize()) for d in tested_distribs])
         ks_df = pd.DataFrame(all_ks, columns=descriptions_tex,
                              index=[dist_realnames.get(d.name, d.name.capitalize()) for d in tested_distribs])
         ks_p_df = pd.DataFrame(all_ks_p, columns=descriptions_tex,
                              index=[dist_realnames.get(d.name, d.name.capitalize()) for d in tested_distribs])
 
-        fit_stats = pd.concat((kl_df, aic_df), axis=1, keys=['KL', 'AIC'],
+        fit_stats = pd.concat((kl_df, aic_df, bic_df), axis=1, keys=['KL', 'AIC', 'BIC'],
                               verify_integrity=True)
         fit_stats.rename(dict(zip(descriptions_tex, descriptions)), axis=1, level=1).to_csv('distrib_fits_duploss%s.csv' % filesuffix, sep='\t')
 
@@ -547,7 +567,9 @@ def analysis_2_alldistribs(lang_fr=True, dark=False, restrict_distribs=True,
                         .style.apply(bounded_background_gradient, cmap=cmapKL,
                                      subset=['KL'])\
                               .apply(bounded_background_gradient, cmap=cmapAIC,
-                                     subset=['AIC']))
+                                     subset=['AIC'])\
+                              .apply(bounded_background_gradient, cmap=cmapAIC,
+                                     subset=['BIC']))
         hr.raw('\n<br />\n')
         hr.html(ks_stats.rename(lambda n: n.replace('$', '$$'), axis=1, level=1)\
                         .style.apply(bounded_background_gradient, cmap=cmapKL,
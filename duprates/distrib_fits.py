@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Fit candidate scipy distributions to rate vectors, in parallel, with a cache.
+
+- Closed-form maximum likelihood estimators are used when they exist (expon,
+  lognorm, and gamma by Newton iterations on the shape, with fixed loc); other
+  gamma/lognorm fits start from the moment estimates;
+- the negative log-likelihood, AIC, BIC and Kolmogorov-Smirnov test are
+  computed along with the fit;
+- each result is cached as json, keyed by distribution name, fixed loc and a
+  hash of the data, so that reruns only redo the plots.
+"""
+
+
+import os
+import os.path as op
+import json
+import hashlib
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import scipy
+import scipy.stats as st
+from scipy.special import digamma, polygamma
+import logging
+logger = logging.getLogger(__name__)
+
+
+STATS = ['nlL', 'AIC', 'BIC', 'KS', 'KS_p']
+
+
+def data_hash(data):
+    return hashlib.sha1(np.ascontiguousarray(data, dtype=np.float64)).hexdigest()
+
+
+def fit_gamma_floc(x, floc=0, niter=20, tol=1e-10):
+    """MLE of the gamma shape by Newton iterations on
+    log(a) - digamma(a) = log(mean(x)) - mean(log(x)), with Minka's initial value."""
+    x = x - floc
+    mean = x.mean()
+    s = np.log(mean) - np.log(x).mean()
+    a = (3 - s + np.sqrt((s - 3)**2 + 24*s)) / (12*s)
+    for _ in range(niter):
+        step = (np.log(a) - digamma(a) - s) / (1/a - polygamma(1, a))
+        a -= step
+        if abs(step) < tol * a:
+            break
+    return a, floc, mean / a
+
+
+def closed_form_fit(distrib, data, floc=None):
+    """Return the fitted parameters, or None if no estimator is implemented."""
+    if distrib.name == 'expon':
+        loc = data.min() if floc is None else floc
+        return loc, data.mean() - loc
+    if floc is None or (data <= floc).any():
+        return None
+    if distrib.name == 'gamma':
+        return fit_gamma_floc(data, floc)
+    if distrib.name == 'lognorm':
+        logx = np.log(data - floc)
+        return logx.std(), floc, np.exp(logx.mean())
+    return None
+
+
+def moment_guess(distrib, data):
+    """Initial shape parameters from the moments."""
+    if distrib.name == 'gamma':
+        return (data.mean()**2 / data.var(),)
+    if distrib.name == 'lognorm':
+        return (np.sqrt(np.log(1 + data.var() / data.mean()**2)),)
+    return ()
+
+
+def fit_one(distrib, data, floc=None):
+    """Fit, then compute the negative log-likelihood, AIC, BIC, and KS test."""
+    params = closed_form_fit(distrib, data, floc)
+    if params is None:
+        fit_kw = {} if floc is None else {'floc': floc}
+        params = distrib.fit(data, *moment_guess(distrib, data), **fit_kw)
+    params = tuple(float(p) for p in params)
+    k = distrib.numargs + (2 if floc is None else 1)
+    nlL = float(distrib.nnlf(params, data))
+    ks, ks_p = st.kstest(data, distrib(*params).cdf)
+    return {'params': params,
+            'nlL': nlL,
+            'AIC': 2*k + 2*nlL,
+            'BIC': k*np.log(len(data)) + 2*nlL,
+            'KS': float(ks),
+            'KS_p': float(ks_p)}
+
+
+class FitCache(object):
+    """One json file per (distribution, floc, data)."""
+    def __init__(self, cachedir=None):
+        self.cachedir = cachedir
+        if cachedir is not None:
+            os.makedirs(cachedir, exist_ok=True)
+
+    def path(self, distname, floc, datahash):
+        return op.join(self.cachedir, '%s_floc%s_%s.json' % (distname, floc, datahash))
+
+    def get(self, distname, floc, datahash):
+        if self.cachedir is None:
+            return None
+        try:
+            with open(self.path(distname, floc, datahash)) as f:
+                result = json.load(f)
+        except FileNotFoundError:
+            return None
+        if result.get('scipy') != scipy.__version__:
+            return None
+        result['params'] = tuple(result['params'])
+        return result
+
+    def set(self, distname, floc, datahash, result):
+        if self.cachedir is None:
+            return
+        with open(self.path(distname, floc, datahash), 'w') as out:
+            json.dump(dict(result, scipy=scipy.__version__), out)
+
+
+def _fit_task(task):
+    distname, data, floc = task
+    try:
+        return fit_one(getattr(st, distname), data, floc)
+    except Exception as err:
+        err.args += ('Fitting %s (floc=%s)' % (distname, floc),)
+        raise
+
+
+def fit_all(distribs, datas, floc=None, ncores=1, cachedir=None):
+    """Fit each distribution to each data vector.
+
+    Return a DataFrame indexed by (distribution name, data index), with the
+    columns 'params' and `STATS`."""
+    cache = FitCache(cachedir)
+    hashes = [data_hash(data) for data in datas]
+    keys = [(distrib.name, i) for distrib in distribs for i in range(len(datas))]
+    results = {key: cache.get(key[0], floc, hashes[key[1]]) for key in keys}
+    todo = [key for key in keys if results[key] is None]
+    logger.info('%d fits to compute (%d cached).', len(todo), len(keys) - len(todo))
+
+    tasks = [(distname, datas[i], floc) for distname, i in todo]
+    if ncores > 1 and len(tasks) > 1:
+        with mp.Pool(ncores) as pool:
+            computed = pool.map(_fit_task, tasks, chunksize=1)
+    else:
+        computed = [_fit_task(task) for task in tasks]
+    for (distname, i), result in zip(todo, computed):
+        cache.set(distname, floc, hashes[i], result)
+        results[(distname, i)] = result
+
+    rows = [results[key] for key in keys]
+    table = pd.DataFrame(rows, columns=['params'] + STATS,
+                         index=pd.MultiIndex.from_tuples(keys, names=['distrib', 'data']))
+    return table
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Gather the per-family outputs of GeneRax and ALE into a single columnar store.
+
+The results directory tree is scanned, and only the families with new (or
+modified) output files are parsed, in parallel. They are appended as a new
+part of the store:
+
+    <store>/manifest.tsv             ingested files: path, size, mtime, part
+    <store>/part<N>/<column>.npy     one array per column
+    <store>/part<N>/trees.nwk        reconciled trees, one line per family
+
+GeneRax families are found from `results/<family>/stats.txt` (as in the
+output of generax_family1by1.sh), ALE families from `.uml_rec`/`.ml_rec` files.
+
+USAGE:
+
+./gather_reconciliations.py <resultsdir> <store>
+"""
+
+
+import os
+import os.path as op
+import re
+from glob import glob
+import argparse as ap
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+from duprates.ale2treebest import parse_ALEoutput
+import logging
+logger = logging.getLogger(__name__)
+
+
+# Column name -> dtype (None: strings).
+COLUMNS = {'family':       None,
+           'source':       None,  # 'generax' or 'ale'
+           'path':         None,  # run directory (generax) or rec file (ale)
+           'duprate':      np.float64,
+           'lossrate':     np.float64,
+           'transferrate': np.float64,
+           'phy_lL':       np.float64,
+           'rec_lL':       np.float64,  # ALE: logl
+           # Event counts (ALE: average over the sampled reconciliations)
+           'S':            np.float64,
+           'SL':           np.float64,
+           'D':            np.float64,
+           'T':            np.float64,
+           'TL':           np.float64,
+           'L':            np.float64,
+           'Leaf':         np.float64,
+           'Invalid':      np.float64}
+
+MANIFEST = 'manifest.tsv'
+ALE_EXT = re.compile(r'(\.ale)?\.u?ml_rec$')
+
+
+def generax_files(rundir, family):
+    """Output files of one GeneRax family run (only the existing ones)."""
+    files = {'stats': op.join(rundir, 'results', family, 'stats.txt'),
+             'events': op.join(rundir, 'reconciliations',
+                               family + '_eventCounts.txt'),
+             'tree': op.join(rundir, 'reconciliations',
+                             family + '_reconciliated.nhx')}
+    # Rates of the last optimization round.
+    rounds = glob(op.join(rundir, 'gene_optimization_*', 'dtl_rates.txt'))
+    if rounds:
+        files['rates'] = max(rounds, key=lambda f: int(
+                                    op.basename(op.dirname(f)).rsplit('_', 1)[1]))
+    return {key: f for key, f in files.items() if op.exists(f)}
+
+
+def parse_generax(rundir, family):
+    files = generax_files(rundir, family)
+    row = {}
+    tree = ''
+    if 'rates' in files:
+        with open(files['rates']) as f:
+            rates = [float(x) for x in f.read().split()]
+        for col, rate in zip(('duprate', 'lossrate', 'transferrate'), rates):
+            row[col] = rate
+    if 'stats' in files:
+        with open(files['stats']) as f:
+            row['phy_lL'], row['rec_lL'] = [float(x) for x in f.read().split()][:2]
+    if 'events' in files:
+        with open(files['events']) as f:
+            for line in f:
+                if line.strip():
+                    event, count = line.split(':')
+                    row[event.strip()] = float(count)
+    if 'tree' in files:
+        with open(files['tree']) as f:
+            tree = ''.join(f.read().split())
+    return row, tree
+
+
+def parse_ale(recfile):
+    aleout = parse_ALEoutput(recfile)
+    row = {'rec_lL': aleout['logl'],
+           'duprate': aleout['rate_Duplications'],
+           'transferrate': aleout['rate_Transfers'],
+           'lossrate': aleout['rate_Losses'],
+           'D': aleout['total_Duplications'],
+           'T': aleout['total_Transfers'],
+           'L': aleout['total_Losses'],
+           'S': aleout['total_Speciations']}
+    return row, ''.join(aleout['reconciliations'])
+
+
+def scan_results(resultsdir):
+    """List the families as (source, family, path, files)"""
+    units = []
+    for dirpath, dirnames, filenames in os.walk(resultsdir):
+        dirnames.sort()
+        if op.basename(dirpath) == 'results':
+            rundir = op.dirname(dirpath)
+            for family in dirnames:
+                if op.exists(op.join(dirpath, family, 'stats.txt')):
+                    files = generax_files(rundir, family)
+                    units.append(('generax', family, rundir,
+                                  sorted(files.values())))
+        for filename in sorted(filenames):
+            if ALE_EXT.search(filename):
+                recfile = op.join(dirpath, filename)
+                units.append(('ale', ALE_EXT.sub('', filename), recfile,
+                              [recfile]))
+    return units
+
+
+def file_signature(filename):
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def load_manifest(storedir):
+    """Return {path: (size, mtime_ns, part)}"""
+    manifest = {}
+    try:
+        with open(op.join(storedir, MANIFEST)) as f:
+            for line in f:
+                path, size, mtime, part = line.rstrip('\n').split('\t')
+                manifest[path] = (int(size), int(mtime), part)
+    except FileNotFoundError:
+        pass
+    return manifest
+
+
+def parse_unit(unit):
+    source, family, path, files = unit
+    try:
+        row, tree = parse_generax(path, family) if source == 'generax' \
+                    else parse_ale(path)
+    except Exception as err:
+        logger.warning('Skip %s %s (%s): %s', source, family, path, err)
+        return None
+    row.update(family=family, source=source, path=path)
+    return row, tree, [(f,) + file_signature(f) for f in files]
+
+
+def ingest(resultsdir, storedir, ncores=1):
+    """Parse the new families of `resultsdir`, and append them to the store.
+
+    Return the name of the new part (None if nothing new)."""
+    os.makedirs(storedir, exist_ok=True)
+    manifest = load_manifest(storedir)
+    units = [unit for unit in scan_results(resultsdir)
+             if any(file_signature(f) != manifest.get(f, (None, None))[:2]
+                    for f in unit[3])]
+    logger.info('%d new or modified families.', len(units))
+    if not units:
+        return None
+
+    if ncores > 1:
+        with mp.Pool(ncores) as pool:
+            parsed = pool.map(parse_unit, units, chunksize=64)
+    else:
+        parsed = [parse_unit(unit) for unit in units]
+    parsed = [p for p in parsed if p is not None]
+    if not parsed:
+        return None
+
+    nparts = sum(1 for d in os.listdir(storedir) if d.startswith('part'))
+    part = 'part%05d' % nparts
+    partdir = op.join(storedir, part)
+    os.makedirs(partdir)
+    for col, dtype in COLUMNS.items():
+        if dtype is None:
+            values = np.array([row[col] for row, _, _ in parsed], dtype=str)
+        else:
+            values = np.array([row.get(col, np.NaN) for row, _, _ in parsed],
+                              dtype=dtype)
+        np.save(op.join(partdir, col + '.npy'), values)
+    with open(op.join(partdir, 'trees.nwk'), 'w') as out:
+        for _, tree, _ in parsed:
+            out.write(tree + '\n')
+
+    # Last, so that an interrupted ingestion is redone.
+    with open(op.join(storedir, MANIFEST), 'a') as out:
+        for _, _, signatures in parsed:
+            for filename, size, mtime in signatures:
+                out.write('%s\t%d\t%d\t%s\n' % (filename, size, mtime, part))
+    logger.info('Wrote %d families into %s', len(parsed), partdir)
+    return part
+
+
+def load_store(storedir, trees=False, mmap_mode=None):
+    """Concatenate the parts into a DataFrame. Families ingested again are
+    taken from their most recent part."""
+    ingested = set(part for _, _, part in load_manifest(storedir).values())
+    parts = []
+    for part in sorted(ingested):
+        partdir = op.join(storedir, part)
+        df = pd.DataFrame({col: np.load(op.join(partdir, col + '.npy'),
+                                        mmap_mode=mmap_mode)
+                           for col in COLUMNS})
+        if trees:
+            with open(op.join(partdir, 'trees.nwk')) as f:
+                df['trees'] = [line.rstrip('\n') for line in f]
+        parts.append(df)
+    if not parts:
+        return pd.DataFrame(columns=list(COLUMNS) + (['trees'] if trees else []))
+    return pd.concat(parts, ignore_index=True)\
+             .drop_duplicates(['source', 'path', 'family'], keep='last')\
+             .reset_index(drop=True)
+
+
+def main():
+    logging.basicConfig(format='%(levelname)s:%(funcName)s:%(message)s',
+                        level=logging.INFO)
+    parser = ap.ArgumentParser(description=__doc__,
+                               formatter_class=ap.RawDescriptionHelpFormatter)
+    parser.add_argument('resultsdir')
+    parser.add_argument('store')
+    parser.add_argument('-n', '--ncores', type=int, default=1)
+    args = parser.parse_args()
+    ingest(args.resultsdir, args.store, args.ncores)
+
+
+if __name__ == '__main__':
+    main()
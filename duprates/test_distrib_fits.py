@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import numpy as np
+import scipy.stats as st
+import pytest
+from duprates.distrib_fits import closed_form_fit, fit_one, fit_all
+
+
+DATA = st.gamma.rvs(2.5, scale=0.3, size=400, random_state=np.random.RandomState(7))
+
+
+@pytest.mark.parametrize('distname,floc', [('expon', None), ('expon', 0),
+                                           ('lognorm', 0), ('gamma', 0)])
+def test_closed_form_fit_equals_scipy(distname, floc):
+    distrib = getattr(st, distname)
+    params = closed_form_fit(distrib, DATA, floc)
+    fit_kw = {} if floc is None else {'floc': floc}
+    expected = distrib.fit(DATA, **fit_kw)
+    assert np.allclose(params, expected, rtol=1e-4)
+    # Maximum likelihood: not worse than the scipy fit.
+    assert distrib.nnlf(params, DATA) <= distrib.nnlf(expected, DATA) + 1e-6
+
+
+def test_no_closed_form():
+    assert closed_form_fit(st.gamma, DATA) is None  # loc estimated too
+    assert closed_form_fit(st.lognorm, DATA, floc=DATA.max()) is None
+    assert closed_form_fit(st.weibull_min, DATA, floc=0) is None
+
+
+def test_fit_all(tmp_path):
+    datas = [DATA, DATA[:100]]
+    table = fit_all([st.expon, st.gamma], datas, floc=0, cachedir=str(tmp_path))
+    assert list(table.index) == [('expon', 0), ('expon', 1), ('gamma', 0), ('gamma', 1)]
+    assert table.loc[('gamma', 0), 'params'] == \
+            fit_one(st.gamma, DATA, floc=0)['params']
+    assert (table.loc['gamma', 'AIC'] < table.loc['expon', 'AIC']).all()
+    # Cached
+    assert len(list(tmp_path.iterdir())) == 4
+    assert fit_all([st.expon, st.gamma], datas, floc=0,
+                   cachedir=str(tmp_path)).equals(table)
+
+
+def test_fit_error_is_raised():
+    with pytest.raises(Exception, match='Fitting lognorm'):
+        fit_all([st.lognorm], [np.array([1., np.nan, 2.])], floc=None)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import os
+import os.path as op
+from duprates.gather_reconciliations import ingest, load_store, load_manifest
+
+
+def write_generax_run(rundir, family, duprate, rec_lL):
+    """Outputs of generax_family1by1.sh for one family."""
+    files = {op.join('results', family, 'stats.txt'): '-100.5 %s\n' % rec_lL,
+             op.join('reconciliations', family + '_eventCounts.txt'):
+                 'S:10\nSL:2\nD:%d\nT:0\nTL:0\nLeaf:12\nInvalid:0\n' % (duprate*10),
+             op.join('reconciliations', family + '_reconciliated.nhx'):
+                 '((a,b)n1,c)n0;\n',
+             op.join('gene_optimization_1', 'dtl_rates.txt'): '0.5 0.5 0\n',
+             op.join('gene_optimization_2', 'dtl_rates.txt'): '%s 0.25 0\n' % duprate}
+    for relpath, content in files.items():
+        path = op.join(rundir, relpath)
+        os.makedirs(op.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+
+def test_incremental_ingestion(tmp_path):
+    resultsdir = str(tmp_path / 'generax_family-1by1')
+    store = str(tmp_path / 'store')
+    write_generax_run(op.join(resultsdir, '01', '001'), 'famA', 0.1, -20.5)
+    write_generax_run(op.join(resultsdir, '01', '002'), 'famB', 0.2, -30.5)
+
+    assert ingest(resultsdir, store) == 'part00000'
+    df = load_store(store, trees=True).set_index('family')
+    assert sorted(df.index) == ['famA', 'famB']
+    assert df.loc['famA', 'duprate'] == 0.1  # From the last optimization round
+    assert df.loc['famB', 'rec_lL'] == -30.5
+    assert df.loc['famB', 'D'] == 2
+    assert df.loc['famA', 'trees'] == '((a,b)n1,c)n0;'
+    manifest = load_manifest(store)
+    assert len(manifest) == 2 * 4
+    assert set(part for _, _, part in manifest.values()) == {'part00000'}
+
+    # Nothing new.
+    assert ingest(resultsdir, store) is None
+
+    # Modify one family: only this one is ingested again.
+    statsfile = op.join(resultsdir, '01', '002', 'results', 'famB', 'stats.txt')
+    with open(statsfile, 'w') as f:
+        f.write('-100.5 -31.25\n')
+    assert ingest(resultsdir, store) == 'part00001'
+    manifest = load_manifest(store)
+    assert len(manifest) == 2 * 4
+    stat = os.stat(statsfile)
+    assert manifest[statsfile] == (stat.st_size, stat.st_mtime_ns, 'part00001')
+    rundirA = op.join(resultsdir, '01', '001') + os.sep
+    assert [part for path, (_, _, part) in manifest.items()
+            if path.startswith(rundirA)] == ['part00000'] * 4
+
+    df = load_store(store).set_index('family')
+    assert df.loc['famB', 'rec_lL'] == -31.25
+    assert df.loc['famA', 'rec_lL'] == -20.5
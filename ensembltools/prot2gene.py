@@ -3,22 +3,29 @@
 """Convert any Ensembl protein ID to gene ID and vice-versa
 EXAMPLE:
     ./prot2gene ~/ws2/DUPLI_data85/gene_info/%s_gene_info.tsv <fastafiles>
+
+With `--merged`, the gene_info files of all species are loaded once into a
+compact sorted array (optionally cached as .npy files with `--map-cache`),
+shared by all worker processes.
 """
 
 from __future__ import print_function
 
 from sys import version_info, stderr, exit
+import os
 import os.path as op
+from functools import lru_cache
 import argparse
 from bz2 import BZ2File
 from multiprocessing import Pool
+import numpy as np
 import logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(format='%(levelname)s:%(funcName)s:%(message)s')
 
 
 #from genomicustools.identify import convert_prot2gene
-from genomicustools.identify import convert_prot2species
+from genomicustools.identify import convert_prot2species, PROT2SP, PROT2SP_F
 
 
 ENSEMBL_VERSION = 85
@@ -45,7 +52,7 @@ def myopen(filename, *args, **kwargs):
         return open(filename, *args, **kwargs)
 
 
-def load_prot2gene(filename, cprot, cgene):
+def read_prot2gene(filename, cprot, cgene):
     conversions = {}
     with open(filename) as f:
         for line in f:
@@ -54,12 +61,109 @@ def load_prot2gene(filename, cprot, cgene):
     return conversions
 
 
-def rewrite_fastafile(fastafile, gene_info, outputformat="{0}_genes.fa", cprot=2,
-                      cgene=0, shorten_species=False,
-                      ensembl_version=ENSEMBL_VERSION, force_overwrite=False,
-                      verbose=1, strict=False, dryrun=False):
-    if verbose:
-        print(fastafile)
+def file_version(filename):
+    """(absolute path, size, modification time), to detect a changed file."""
+    stat = os.stat(filename)
+    return op.abspath(filename), stat.st_size, stat.st_mtime_ns
+
+
+# The last conversion tables loaded, by file version.
+@lru_cache(maxsize=4)
+def _load_prot2gene(version, cprot, cgene):
+    return read_prot2gene(version[0], cprot, cgene)
+
+def load_prot2gene(filename, cprot, cgene):
+    """Load the conversion table, or reuse it if the file did not change."""
+    return _load_prot2gene(file_version(filename), cprot, cgene)
+
+
+def species_filename(species, shorten_species=False):
+    """Species name as formatted in the gene_info file names."""
+    if shorten_species:
+        spsplit = species.split()
+        return spsplit[0][0].lower() + spsplit[-1]
+    return species.replace(' ', '.')
+
+
+def gene_info_files(gene_info, shorten_species=False,
+                    ensembl_version=ENSEMBL_VERSION):
+    """Existing gene_info files of all species known in this Ensembl version."""
+    ensembl_version = PROT2SP_F.set_fallback(ensembl_version)
+    filenames = []
+    for sp in sorted(set(PROT2SP[ensembl_version].values())):
+        filename = gene_info % species_filename(sp, shorten_species)
+        if not op.exists(filename):
+            logger.info("No gene_info file for %s: %s", sp, filename)
+            continue
+        filenames.append(filename)
+    return filenames
+
+
+class Prot2GeneArray(object):
+    """Compact protein->gene mapping, as two arrays of fixed-width bytes
+    sorted by protein ID and searched by bisection.
+
+    Built once in the parent process, it is inherited copy-on-write by the
+    forked workers of a `multiprocessing.Pool` (or memory-mapped from disk).
+    """
+    def __init__(self, prots, genes):
+        self.prots = prots
+        self.genes = genes
+
+    @classmethod
+    def from_dict(cls, conversions):
+        prots = np.array([p.encode() for p in conversions], dtype=bytes)
+        genes = np.array([g.encode() for g in conversions.values()], dtype=bytes)
+        order = prots.argsort(kind='stable')
+        return cls(prots[order], genes[order])
+
+    @classmethod
+    def from_files(cls, filenames, cprot=2, cgene=0):
+        conversions = {}
+        for filename in filenames:
+            conversions.update(read_prot2gene(filename, cprot, cgene))
+        return cls.from_dict(conversions)
+
+    @classmethod
+    def from_gene_infos(cls, gene_info, cprot=2, cgene=0, shorten_species=False,
+                        ensembl_version=ENSEMBL_VERSION):
+        """Merge the gene_info files of all species known in this Ensembl version.
+
+        `gene_info` is a template like '../gene_info/%s_gene_info.tsv'."""
+        return cls.from_files(gene_info_files(gene_info, shorten_species,
+                                              ensembl_version),
+                              cprot, cgene)
+
+    def save(self, prefix):
+        np.save(prefix + '.prot.npy', self.prots)
+        np.save(prefix + '.gene.npy', self.genes)
+
+    @classmethod
+    def load(cls, prefix, mmap_mode='r'):
+        return cls(np.load(prefix + '.prot.npy', mmap_mode=mmap_mode),
+                   np.load(prefix + '.gene.npy', mmap_mode=mmap_mode))
+
+    def __len__(self):
+        return len(self.prots)
+
+    def get_many(self, protIDs):
+        """Convert a batch of protein IDs at once (None when not found)."""
+        if not len(self.prots):
+            return [None] * len(protIDs)
+        keys = np.array([p.encode() for p in protIDs], dtype=bytes)
+        idx = np.minimum(np.searchsorted(self.prots, keys), len(self.prots)-1)
+        hits = self.prots[idx] == keys
+        return [self.genes[i].decode() if hit else None
+                for i, hit in zip(idx, hits)]
+
+    def get(self, protID, default=None):
+        geneID, = self.get_many([protID])
+        return default if geneID is None else geneID
+
+
+def get_outfile(fastafile, outputformat="{0}_genes.fa", force_overwrite=False,
+                dryrun=False):
+    """Return the output file name, or None if it should be skipped."""
     genetree, ext = op.splitext(fastafile)
     if ext == '.bz2': genetree, ext = op.splitext(genetree)
     genetreedir, genetreefile = op.split(genetree)
@@ -74,10 +178,67 @@ def rewrite_fastafile(fastafile, gene_info, outputformat="{0}_genes.fa", cprot=2
         else:
             logger.warning("%s exists. Skipping.", outfile)
             return
+    return outfile
+
+
+class GeneIDNamer(object):
+    """Make the output gene names unique, and name the unconverted proteins."""
+    def __init__(self, ensembl_version=ENSEMBL_VERSION, strict=False, verbose=1):
+        self.ensembl_version = ensembl_version
+        self.strict = strict
+        self.verbose = verbose
+        # avoid duplicate genes
+        self.found = {}
+        self.unknowns = 0
+
+    def __call__(self, protID, geneID):
+        if not geneID:
+            notfound_msg = "Protein ID %s could not be converted" % protID
+            if self.strict:
+                raise LookupError(notfound_msg)
+            else:
+                logger.error(notfound_msg)
+            self.unknowns += 1
+            species = convert_prot2species(protID, self.ensembl_version, 'unknown')
+            geneID = "UNKNOWN_prot2gene_%s_%d" % (species.replace(' ', '.'),
+                                                  self.unknowns)
+        else:
+            self.found.setdefault(geneID, 0)
+            self.found[geneID] += 1
+            if self.found[geneID] > 1:
+                geneID += ".%d" % self.found[geneID]
+        if self.verbose > 1:
+            print("%s -> %s" % (protID, geneID))
+        return geneID
+
+
+def iter_fasta_batches(lines, batch_size=1000):
+    """Group the lines of a fasta file into batches of records.
+
+    Yield (protIDs, records) where each record is a list of sequence lines."""
+    protIDs, records = [], []
+    for line in lines:
+        if line[0] == '>':
+            if len(protIDs) == batch_size:
+                yield protIDs, records
+                protIDs, records = [], []
+            protIDs.append(line[1:].split('/')[0].rstrip())
+            records.append([])
+        elif records:
+            records[-1].append(line)
+    if protIDs:
+        yield protIDs, records
 
-    # avoid duplicate genes
-    found = {}
-    unknowns = 0
+
+def rewrite_fastafile(fastafile, gene_info, outputformat="{0}_genes.fa", cprot=2,
+                      cgene=0, shorten_species=False,
+                      ensembl_version=ENSEMBL_VERSION, force_overwrite=False,
+                      verbose=1, strict=False, dryrun=False):
+    if verbose:
+        print(fastafile)
+    outfile = get_outfile(fastafile, outputformat, force_overwrite, dryrun)
+    if outfile is None:
+        return
 
     if version_info.major == 3 and fastafile.endswith('.bz2'):
         iter_lines = lambda F: (line.decode() for line in F)
@@ -85,12 +246,13 @@ def rewrite_fastafile(fastafile, gene_info, outputformat="{0}_genes.fa", cprot=2
         iter_lines = lambda F: F
     
     prot2gene = load_prot2gene(gene_info, cprot, cgene)
+    namer = GeneIDNamer(ensembl_version, strict, verbose)
 
     with myopen(fastafile) as IN, \
             (noop_output() if dryrun else myopen(outfile, 'w')) as OUT:
         for line in iter_lines(IN):
             if line[0] == '>':
-                protID = line[1:].split('/')[0]
+                protID = line[1:].split('/')[0].rstrip()
                 geneID = prot2gene.get(protID)
                          #convert_prot2gene(protID, gene_info, cprot, cgene,
                          #                  shorten_species, ensembl_version)
@@ -101,22 +263,7 @@ def rewrite_fastafile(fastafile, gene_info, outputformat="{0}_genes.fa", cprot=2
                 #    if geneID:
                 #        # Fit names in tree
                 #        geneID = geneID.replace('ENSCSAVG', 'ENSCSAG')
-                if not geneID:
-                    notfound_msg = "Protein ID %s could not be converted" % protID
-                    if strict:
-                        raise LookupError(notfound_msg)
-                    else:
-                        logger.error(notfound_msg)
-                    unknowns += 1
-                    species = convert_prot2species(protID, ensembl_version, 'unknown')
-                    geneID = "UNKNOWN_prot2gene_%s_%d" % (species.replace(' ', '.'), unknowns)
-                else:
-                    found.setdefault(geneID, 0)
-                    found[geneID] += 1
-                    if found[geneID] > 1:
-                        geneID += ".%d" % found[geneID]
-                if verbose > 1:
-                    print("%s -> %s" % (protID, geneID))
+                geneID = namer(protID, geneID)
                 OUT.write('>' + geneID + '\n')
             else:
                 OUT.write(line)
@@ -126,9 +273,85 @@ def rewrite_fasta_process(arglist):
     rewrite_fastafile(*arglist)
 
 
-if __name__=='__main__':
-    #fasta_rewriter = FastaRewriter()
-    #fasta_rewriter.run()
+def rewrite_fastafile_batched(fastafile, prot2gene, outputformat="{0}_genes.fa",
+                              ensembl_version=ENSEMBL_VERSION,
+                              force_overwrite=False, verbose=1, strict=False,
+                              dryrun=False, batch_size=1000):
+    """Like `rewrite_fastafile`, but with an already loaded `Prot2GeneArray`,
+    converting the fasta headers by batches of `batch_size` records."""
+    if verbose:
+        print(fastafile)
+    outfile = get_outfile(fastafile, outputformat, force_overwrite, dryrun)
+    if outfile is None:
+        return
+
+    if version_info.major == 3 and fastafile.endswith('.bz2'):
+        iter_lines = lambda F: (line.decode() for line in F)
+    else:
+        iter_lines = lambda F: F
+
+    namer = GeneIDNamer(ensembl_version, strict, verbose)
+
+    with myopen(fastafile) as IN, \
+            (noop_output() if dryrun else myopen(outfile, 'w')) as OUT:
+        for protIDs, records in iter_fasta_batches(iter_lines(IN), batch_size):
+            geneIDs = prot2gene.get_many(protIDs)
+            OUT.writelines(line
+                           for protID, geneID, seqlines in zip(protIDs, geneIDs, records)
+                           for line in ['>' + namer(protID, geneID) + '\n'] + seqlines)
+
+
+# Set in each worker by the Pool initializer (inherited without copy when forked).
+_shared_prot2gene = None
+
+def _init_shared_prot2gene(prot2gene):
+    global _shared_prot2gene
+    _shared_prot2gene = prot2gene
+
+
+def rewrite_fasta_batched_process(arglist):
+    fastafile, *args = arglist
+    rewrite_fastafile_batched(fastafile, _shared_prot2gene, *args)
+
+
+def get_prot2gene_array(gene_info, cprot=2, cgene=0, shorten_species=False,
+                        ensembl_version=ENSEMBL_VERSION, map_cache=None):
+    """Load the merged Prot2GeneArray once (per version of the gene_info
+    files), from `map_cache` if it is more recent than these files."""
+    versions = tuple(file_version(filename) for filename in
+                     gene_info_files(gene_info, shorten_species, ensembl_version))
+    return _get_prot2gene_array(versions, cprot, cgene,
+                                map_cache and op.abspath(map_cache))
+
+
+# The last merged conversion arrays loaded, by gene_info file versions.
+@lru_cache(maxsize=2)
+def _get_prot2gene_array(versions, cprot, cgene, map_cache=None):
+    last_mtime = max((mtime for _, _, mtime in versions), default=0)
+    if map_cache and all(op.exists(map_cache + ext) and
+                         os.stat(map_cache + ext).st_mtime_ns >= last_mtime
+                         for ext in ('.prot.npy', '.gene.npy')):
+        prot2gene = Prot2GeneArray.load(map_cache)
+    else:
+        prot2gene = Prot2GeneArray.from_files([path for path, _, _ in versions],
+                                              cprot, cgene)
+        if map_cache:
+            prot2gene.save(map_cache)
+    logger.info("Loaded %d protein->gene conversions.", len(prot2gene))
+    return prot2gene
+
+
+def preload(args):
+    """Load the conversion tables (for a persistent server, see cmdserver)"""
+    if args.merged:
+        get_prot2gene_array(args.gene_info, args.cprot, args.cgene,
+                            args.shorten_species, args.ensembl_version,
+                            args.map_cache)
+    elif op.exists(args.gene_info):
+        load_prot2gene(args.gene_info, args.cprot, args.cgene)
+
+
+def make_parser():
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("gene_info", type=str, help=('string with wildcard,'
                         'for example ../gene_info/%%s_gene_info.tsv'))
@@ -160,17 +383,29 @@ if __name__=='__main__':
                         default=ENSEMBL_VERSION, help='[%(default)s]')
     parser.add_argument("--shorten-species", action='store_true',
                         help="DEPRECATED. Change 'Mus musculus' to 'mmusculus'?")
+    parser.add_argument("-m", "--merged", action='store_true',
+                        help=("Load the gene_info of all species once, in a "
+                              "single sorted array shared by the workers."))
+    parser.add_argument("--map-cache", metavar='PREFIX',
+                        help=("with --merged: load the merged map from "
+                              "PREFIX.{prot,gene}.npy (memory-mapped), or "
+                              "save it there if absent."))
+    parser.add_argument("-b", "--batch-size", type=int, default=1000,
+                        help=("with --merged: number of fasta records "
+                              "converted at once [%(default)s]"))
+    return parser
+
 
-    args = parser.parse_args()
+def main(argv=None):
+    args = make_parser().parse_args(argv)
     #for protID in argv[2:]:
     #for fastafile in args.fastafiles:
     #    print(fastafile, file=stderr)
     #    rewrite_fastafile(fastafile, args.outputformat, args.cprot, args.cgene)
-    pool = Pool(processes=args.cores)
     if args.fromfile:
         if len(args.fastafiles) > 1:
             logger.error("Only one 'fastafiles' allowed with --fromfile. See help")
-            exit(1)
+            return 1
         else:
             with open(args.fastafiles[0]) as ff:
                 fastafiles = [line.rstrip() for line in ff]
@@ -180,16 +415,37 @@ if __name__=='__main__':
 #def _run_process(self, fastafile):
 #    rewrite_fastafile(fastafile, **self.args)#fastafile, args.gene_infoargs.outputformat, args.cprot, args.cgene, verbose=True)
 
-    generate_args = ((f,
-                      args.gene_info,
-                      args.outputformat,
-                      args.cprot,
-                      args.cgene,
-                      args.shorten_species,
-                      args.ensembl_version,
-                      args.force_overwrite,
-                      args.verbose,
-                      args.strict,
-                      args.dryrun) for f in fastafiles)
-    pool.map(rewrite_fasta_process, generate_args)
+    if args.merged:
+        prot2gene = get_prot2gene_array(args.gene_info, args.cprot, args.cgene,
+                                        args.shorten_species,
+                                        args.ensembl_version, args.map_cache)
 
+        pool = Pool(processes=args.cores, initializer=_init_shared_prot2gene,
+                    initargs=(prot2gene,))
+        generate_args = ((f,
+                          args.outputformat,
+                          args.ensembl_version,
+                          args.force_overwrite,
+                          args.verbose,
+                          args.strict,
+                          args.dryrun,
+                          args.batch_size) for f in fastafiles)
+        pool.map(rewrite_fasta_batched_process, generate_args)
+    else:
+        pool = Pool(processes=args.cores)
+        generate_args = ((f,
+                          args.gene_info,
+                          args.outputformat,
+                          args.cprot,
+                          args.cgene,
+                          args.shorten_species,
+                          args.ensembl_version,
+                          args.force_overwrite,
+                          args.verbose,
+                          args.strict,
+                          args.dryrun) for f in fastafiles)
+        pool.map(rewrite_fasta_process, generate_args)
+
+
+if __name__=='__main__':
+    exit(main())
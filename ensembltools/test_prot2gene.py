@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import os
+from ensembltools.prot2gene import load_prot2gene, get_prot2gene_array, main
+
+
+def write_gene_info(path, pairs):
+    path.write_text(''.join('%s\tx\t%s\n' % (gene, prot) for prot, gene in pairs))
+    return str(path)
+
+
+def touch_later(path):
+    """Make sure the modification time changes"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_load_prot2gene_reloads_changed_file(tmp_path):
+    filename = write_gene_info(tmp_path / 'gene_info.tsv', [('P1', 'G1')])
+    conversions = load_prot2gene(filename, 2, 0)
+    assert conversions == {'P1': 'G1'}
+    assert load_prot2gene(filename, 2, 0) is conversions
+
+    write_gene_info(tmp_path / 'gene_info.tsv', [('P2', 'G2')])
+    touch_later(filename)
+    assert load_prot2gene(filename, 2, 0) == {'P2': 'G2'}
+
+
+def test_get_prot2gene_array_reloads_changed_files(tmp_path):
+    gene_info = str(tmp_path / '%s_gene_info.tsv')
+    write_gene_info(tmp_path / 'Ailuropoda.melanoleuca_gene_info.tsv',
+                    [('ENSAMEP1', 'ENSAMEG1'), ('ENSAMEP2', 'ENSAMEG2')])
+    write_gene_info(tmp_path / 'Anas.platyrhynchos_gene_info.tsv',
+                    [('ENSAPLP1', 'ENSAPLG1')])
+    map_cache = str(tmp_path / 'map')
+    prot2gene = get_prot2gene_array(gene_info, ensembl_version=85,
+                                    map_cache=map_cache)
+    assert prot2gene.get_many(['ENSAPLP1', 'ENSAMEP2', 'ENSXXXP1']) == \
+            ['ENSAPLG1', 'ENSAMEG2', None]
+    assert os.path.exists(map_cache + '.prot.npy')
+    assert get_prot2gene_array(gene_info, ensembl_version=85,
+                               map_cache=map_cache) is prot2gene
+
+    # Changed gene_info file: the map cache is outdated too.
+    filename = write_gene_info(tmp_path / 'Anas.platyrhynchos_gene_info.tsv',
+                               [('ENSAPLP1', 'ENSAPLG9')])
+    touch_later(filename)
+    prot2gene = get_prot2gene_array(gene_info, ensembl_version=85,
+                                    map_cache=map_cache)
+    assert prot2gene.get('ENSAPLP1') == 'ENSAPLG9'
+    assert len(prot2gene) == 3
+
+
+FASTA = """>ENSAMEP1/1-12
+ATGGCC
+TAAGCG
+>ENSAPLP1
+ATGAAA
+>ENSXXXP1/1-6
+ATGCCC
+>ENSAMEP2/1-6
+ATGTTT
+>ENSAMEP3/1-6
+ATGGGG
+>ENSAPLP1/7-12
+ATGCGT
+"""
+
+
+def test_merged_batched_same_as_rewrite_fastafile(tmp_path):
+    """Unknown protein, same gene twice, proteins of several species, headers
+    without '/', and records across batches."""
+    pairs = {'Ailuropoda.melanoleuca': [('ENSAMEP1', 'ENSAMEG1'),
+                                        ('ENSAMEP2', 'ENSAMEG2'),
+                                        ('ENSAMEP3', 'ENSAMEG1')],
+             'Anas.platyrhynchos': [('ENSAPLP1', 'ENSAPLG1')]}
+    for species, species_pairs in pairs.items():
+        write_gene_info(tmp_path / ('%s_gene_info.tsv' % species), species_pairs)
+    gene_info = write_gene_info(tmp_path / 'all_gene_info.tsv',
+                                [pair for species_pairs in pairs.values()
+                                 for pair in species_pairs])
+    fastafile = tmp_path / 'fam.fa'
+    fastafile.write_text(FASTA)
+
+    eager_out = str(tmp_path / 'eager_{0}.fa')
+    batched_out = str(tmp_path / 'batched_{0}.fa')
+    main([gene_info, str(fastafile), '-q', '-o', eager_out])
+    main([str(tmp_path / '%s_gene_info.tsv'), str(fastafile), '-q', '-o',
+          batched_out, '--merged', '-b', '2'])
+    eager = (tmp_path / 'eager_fam.fa').read_text()
+    assert (tmp_path / 'batched_fam.fa').read_text() == eager
+    assert [line for line in eager.splitlines() if line.startswith('>')] == [
+            '>ENSAMEG1', '>ENSAPLG1', '>UNKNOWN_prot2gene_unknown_1',
+            '>ENSAMEG2', '>ENSAMEG1.2', '>ENSAPLG1.2']
+    assert [line for line in eager.splitlines() if not line.startswith('>')] \
+            == [line for line in FASTA.splitlines() if not line.startswith('>')]
@@ -12,37 +12,54 @@ from dendro.bates import dfw_descendants_generalized, dfw_pairs_generalized
 setrecursionlimit(10000) # YOLO
 
 
-def main(ensembltree, outputfile):
-    get_ch = lambda tree, node: [x[0] for x in tree.data.get(node, [])]
-    get_chd = lambda tree, nodedist: tree.data.get(nodedist[0], [])
+def get_ch(tree, node):
+    return [x[0] for x in tree.data.get(node, [])]
+
+def get_chd(tree, nodedist):
+    return tree.data.get(nodedist[0], [])
+
+
+def del_split_genes(tree):
+    """Delete the gene splits (Duplication == 10) and their descendants, inplace.
+
+    Return the number of visited nodes, of splits and of deleted nodes."""
+    count_treenodes = 0
+    count_splits = 0
+    count_split_desc = 0
+    for (node, dist), childrendists in dfw_descendants_generalized(tree,
+                            get_chd, queue=[(tree.root, 0)]):
+        count_treenodes += 1
+        assert tree.info[node]['Duplication'] != 10, \
+                "Unexpected. parent node is a split gene: %s: %s" % \
+                        (node, tree.info[node])
+        for child, chdist in childrendists:
+            if tree.info[child]['Duplication'] == 10:
+                # It's a gene split
+                # Recurse through all the descendants to remove them
+                count_splits += 1
+                for _, GS_descendant in reversed(list(
+                            dfw_pairs_generalized(tree, get_ch,
+                                                  queue=[(None, child)],
+                                                  include_root=True))):
+                    tree.info.pop(GS_descendant)
+                    tree.data.pop(GS_descendant, None)  # Absent for leaves
+                    count_split_desc += 1
+
+                tree.data[node].remove((child, chdist))
+    return count_treenodes, count_splits, count_split_desc
 
+
+def main(ensembltree, outputfile):
     count_trees = 0
     count_treenodes = []
     count_splits = 0
     count_split_desc = 0
     with myFile.openFile(outputfile, 'w') as out:
         for tree in ProteinTree.loadTree(ensembltree):
-            count_treenodes.append(0)
-            for (node, dist), childrendists in dfw_descendants_generalized(tree,
-                                    get_chd, queue=[(None, (tree.root, 0))]):
-                count_treenodes[-1] += 1
-                assert tree.info[node]['duplication'] != 10, \
-                        "Unexpected. parent node is a split gene: %s: %s" % \
-                                (node, tree.info[node])
-                for child, chdist in childrendists:
-                    if tree.info[child]['Duplication'] == 10:
-                        # It's a gene split
-                        # Recurse through all the descendants to remove them
-                        count_splits += 1
-                        for _, GS_descendant in reversed(list(
-                                    dfw_pairs_generalized(tree, get_ch,
-                                                          queue=[(None, child)],
-                                                          include_root=True))):
-                            tree.info.pop(GS_descendant)
-                            tree.data.pop(GS_descendant)
-                            count_split_desc += 1
-
-                        tree.data[node].remove((child, chdist))
+            treenodes, splits, split_desc = del_split_genes(tree)
+            count_treenodes.append(treenodes)
+            count_splits += splits
+            count_split_desc += split_desc
 
             tree.printTree(out)
     print("%d trees" % count_trees, file=stderr)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Edit a forest of protein trees (LibsDyogen format) with a chain of
+operations, parsing and printing each tree only once.
+
+Operations (applied in the given order, with an argument after '='):
+    delsplit            delete the gene splits and their descendants
+                        (see ProtTree_DelSplitGenes);
+    toolong[=MAXDIST]   detach the branches longer than MAXDIST, output the
+                        detached subtrees as new trees (see ProtTree_cleaner);
+    fusetips            keep one sequence per group of subspecies
+                        (see ProtTree_fuseTips);
+    prune=PHYLTREE      keep only the species of this species tree
+                        (see ProtTree_prune_species).
+
+Trees are edited in worker processes, and output in the input order.
+
+USAGE:
+    ./ProtTree_pipeline.py -e delsplit -e toolong=10000 -e prune=PhylTree.conf -j 4 tree.1.ensembl.bz2 > edited.txt
+"""
+
+
+from sys import stdin, stdout
+from io import StringIO
+from collections import Counter
+from functools import partial
+import argparse as ap
+import logging
+logger = logging.getLogger(__name__)
+
+from LibsDyogen import myPhylTree, myProteinTree
+from objectools import imap_window
+from genchron.ProtTree_DelSplitGenes import del_split_genes
+from dendro.ProtTree_cleaner import tree_detach_toolong, MAXDIST
+from dendro.ProtTree_fuseTips import fuse_tree_subspecies, species2seq
+from dendro.ProtTree_prune_species import prune_tree_species
+
+
+# Each operation takes a tree and a Counter, and returns the list of output trees.
+
+def op_delsplit(tree, counts):
+    _, splits, split_desc = del_split_genes(tree)
+    counts['splits'] += splits
+    counts['split descendants'] += split_desc
+    return [tree]
+
+
+def op_toolong(tree, counts, maxdist=MAXDIST):
+    root_counts, detached_subtrees = tree_detach_toolong(tree, maxdist)
+    counts['detached'] += root_counts[0]
+    counts['included'] += root_counts[1]
+    counts['leaves detached'] += root_counts[2]
+    if tree.root is None:
+        counts['discarded roots'] += 1
+        return detached_subtrees
+    return [tree] + detached_subtrees
+
+
+def op_fusetips(tree, counts):
+    fuse_tree_subspecies(tree, species2seq, counts)
+    return [tree]
+
+
+def op_prune(tree, counts, phyltree):
+    newroot = prune_tree_species(phyltree, tree)
+    if newroot is None:
+        logger.warning('Discard tree %d', tree.root)
+        counts['discarded trees'] += 1
+        return []
+    tree.root = newroot
+    return [tree]
+
+
+# name: (operation, name and converter of its argument, required argument)
+OPERATIONS = {'delsplit': (op_delsplit, None, None, False),
+              'toolong':  (op_toolong, 'maxdist', float, False),
+              'fusetips': (op_fusetips, None, None, False),
+              'prune':    (op_prune, 'phyltree', myPhylTree.PhylogeneticTree, True)}
+
+
+def check_operations(specs):
+    """['toolong=10000', ...] -> [('toolong', '10000'), ...]"""
+    checked = []
+    for spec in specs:
+        name, _, arg = spec.partition('=')
+        try:
+            _, argname, _, required = OPERATIONS[name]
+        except KeyError:
+            raise ValueError('Unknown operation %r (expected %s)' % (
+                             name, ', '.join(OPERATIONS)))
+        if arg and argname is None:
+            raise ValueError('Operation %r takes no argument' % name)
+        if required and not arg:
+            raise ValueError('Operation %r requires an argument: %s=%s' % (
+                             name, name, argname.upper()))
+        checked.append((name, arg))
+    return checked
+
+
+def parse_operations(specs):
+    """['toolong=10000', ...] -> [('toolong', operation), ...]"""
+    operations = []
+    for name, arg in check_operations(specs):
+        operation, argname, convert, _ = OPERATIONS[name]
+        if arg:
+            operation = partial(operation, **{argname: convert(arg)})
+        operations.append((name, operation))
+    return operations
+
+
+def edit_tree(tree, operations):
+    """Apply the operations in turn. Return the output trees, and the counts
+    of each operation."""
+    counts = {name: Counter() for name, _ in operations}
+    trees = [tree]
+    for name, operation in operations:
+        trees = [newtree for t in trees for newtree in operation(t, counts[name])]
+    return trees, counts
+
+
+# Operations of the worker process
+_operations = None
+
+def _init_worker(specs):
+    global _operations
+    _operations = parse_operations(specs)
+
+
+def _edit_and_format(tree):
+    trees, counts = edit_tree(tree, _operations)
+    out = StringIO()
+    for t in trees:
+        t.printTree(out)
+    return out.getvalue(), len(trees), counts
+
+
+def main(forestfile=None, operations=(), outfile=None, ncores=1, window=None):
+    checked = check_operations(operations)  # Before starting the workers.
+    if forestfile is None:
+        forestfile = stdin
+    out = stdout if outfile is None else open(outfile, 'w')
+
+    n_in, n_out = 0, 0
+    total_counts = {name: Counter() for name, _ in checked}
+    try:
+        for text, n_trees, counts in imap_window(_edit_and_format,
+                                        myProteinTree.loadTree(forestfile),
+                                        ncores, window,
+                                        _init_worker, (list(operations),)):
+            out.write(text)
+            n_in += 1
+            n_out += n_trees
+            for name, count in counts.items():
+                total_counts[name].update(count)
+    finally:
+        if outfile is not None:
+            out.close()
+
+    logger.info('%d input trees, %d output trees.', n_in, n_out)
+    for name, count in total_counts.items():
+        logger.info('%s: %s', name, ', '.join('%d %s' % (n, what)
+                                              for what, n in sorted(count.items())))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:%(name)s:%(message)s')
+    logger.setLevel(logging.INFO)
+    parser = ap.ArgumentParser(description=__doc__,
+                               formatter_class=ap.RawDescriptionHelpFormatter)
+    parser.add_argument('forestfile', nargs='?')
+    parser.add_argument('-e', '--edit', action='append', default=[],
+                        dest='operations', metavar='OPERATION[=ARG]',
+                        help='operation to apply (repeat to chain them)')
+    parser.add_argument('-o', '--outfile')
+    parser.add_argument('-j', '--ncores', type=int, default=1,
+                        help='number of worker processes [%(default)s]')
+    parser.add_argument('-w', '--window', type=int,
+                        help='maximum number of trees in memory [4 x ncores]')
+
+    args = parser.parse_args()
+    main(**vars(args))
@@ -20,14 +20,20 @@ from __future__ import print_function
 import sys
 
 
-def allocate_memory(phylip_file):
-    """Decide how much memory should be allocated to the codeml run on the
-    cluster"""
+def phylip_dims(phylip_file):
+    """Number of sequences and alignment length, from the Phylip header"""
     with open(phylip_file) as IN:
         line = IN.readline()
         fields = line.split()
         nseq = int(fields[0])
         length = int(fields[1])
+    return nseq, length
+
+
+def allocate_memory(phylip_file):
+    """Decide how much memory should be allocated to the codeml run on the
+    cluster"""
+    nseq, length = phylip_dims(phylip_file)
     if nseq < 50:
         return "500M"
     elif nseq < 100:
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Benchmark `bound_average` on a random gene tree, with the arrays of the
+debug messages formatted eagerly (before `ls` became lazy) or only when
+printed.
+
+Also checks that the ages are identical.
+
+USAGE:
+
+./bench_bound_average.py [-n <nleaves>] [-r <repeat>] [-m dS dN t dist]
+"""
+
+
+from time import perf_counter
+import random
+import argparse as ap
+import ete3
+import genchron.analyse.generate_dNdStable as gd
+from genchron.analyse.generate_dNdStable import ANCGENE2SP, bound_average, \
+        combine_boolean_funcs, isdup_cache, retrieve_isdup
+
+
+# Species tree: ((Aa,Bb)Ab,(Cc,Dd)Cd)Ad
+SPECIES_CHILDREN = {'Ad': ['Ab', 'Cd'], 'Ab': ['Aa', 'Bb'], 'Cd': ['Cc', 'Dd']}
+SPECIES_AGES = {'Ad': 100., 'Ab': 40., 'Cd': 60.,
+                'Aa': 0., 'Bb': 0., 'Cc': 0., 'Dd': 0.}
+
+
+def random_genetree(nleaves, measures, pdup=0.3, seed=0):
+    """Gene tree reconciled to SPECIES_CHILDREN, with nodes named like
+    'AbENSGT00010'"""
+    rng = random.Random(seed)
+    count = [0]
+
+    def newname(taxon):
+        count[0] += 1
+        return '%sENSGT%05d' % (taxon, count[0])
+
+    root = ete3.TreeNode(name=newname('Ad'))
+    root.add_feature('taxon', 'Ad')
+    leaves = [root]
+    while len(leaves) < nleaves:
+        node = leaves.pop(rng.randrange(len(leaves)))
+        taxon = node.taxon
+        if taxon in SPECIES_CHILDREN and rng.random() > pdup:
+            children_taxa = SPECIES_CHILDREN[taxon]
+        else:
+            children_taxa = [taxon, taxon]
+        for chtaxon in children_taxa:
+            child = node.add_child(name=newname(chtaxon))
+            child.add_feature('taxon', chtaxon)
+            leaves.append(child)
+    for node in root.traverse():
+        node.del_feature('taxon')
+        for m in measures:
+            node.add_feature(m, rng.uniform(0.01, 1))
+    return root
+
+
+def taxon_from_name(node):
+    return ANCGENE2SP.match(node.name).group(1)
+
+
+def eager_ls(array):
+    return str(array).replace('\n', '')
+
+
+def run_eager(tree, measures):
+    lazy_ls, gd.ls = gd.ls, eager_ls
+    try:
+        return run_lazy(tree, measures)
+    finally:
+        gd.ls = lazy_ls
+
+
+def run_lazy(tree, measures):
+    """Dating of the duplications, as set up in `process`"""
+    todate = combine_boolean_funcs('isdup', {'isdup': retrieve_isdup})
+
+    def get_eventtype(node, subtree):
+        if node.is_leaf():
+            subtree[node.name]['isdup'] = False
+            return 'leaf'
+        return 'dup' if isdup_cache(node, subtree) else 'spe'
+
+    return bound_average(tree, dict(SPECIES_AGES), todate, measures,
+                         calib_selecter='taxon',
+                         node_info=[('taxon', taxon_from_name)],
+                         node_feature_setter=[('type', get_eventtype)])
+
+
+def timeit(func, *args):
+    start = perf_counter()
+    func(*args)
+    return perf_counter() - start
+
+
+def main():
+    parser = ap.ArgumentParser(description=__doc__,
+                               formatter_class=ap.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--nleaves', type=int, nargs='+',
+                        default=[500, 2000, 8000])
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-m', '--measures', nargs='+',
+                        default=['dS', 'dN', 't', 'dist'])
+    args = parser.parse_args()
+
+    print('nleaves\tbound_average_eager\tbound_average_lazy\tspeedup')
+    for nleaves in args.nleaves:
+        tree = random_genetree(nleaves, args.measures)
+        eager_ages, _ = run_eager(tree.copy(), args.measures)
+        lazy_ages, _ = run_lazy(tree.copy(), args.measures)
+        # NaN != NaN, hence the comparison of strings.
+        assert [str(row) for row in eager_ages] == \
+               [str(row) for row in lazy_ages], "Different ages!"
+
+        times = [min(timeit(run, tree.copy(), args.measures)
+                     for _ in range(args.repeat))
+                 for run in (run_eager, run_lazy)]
+        print('%d\t%.4f\t%.4f\t%.2f' % (nleaves, times[0], times[1],
+                                        times[0]/times[1]))
+
+
+if __name__ == '__main__':
+    main()
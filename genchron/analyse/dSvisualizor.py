@@ -43,6 +43,7 @@ import os.path
 import re
 import bz2
 import pickle
+import hashlib
 try:
     import argparse_custom as argparse
 except ImportError:
@@ -132,6 +133,118 @@ def bin_data(data, bins, binvar=DEFAULT_AGE_KEY, outvar=None):
 #    return data.groupby(bin_positions)
 
 
+class AgeHistCube(object):
+    """Histogram counts of ages: taxon x event type x age bin, for each age measure.
+
+    The ages are stored sorted within each (taxon, type) group, so that the
+    counts of all groups for any bins are obtained by binary search (same
+    bins semantics as `np.histogram`). The cubes already computed are kept in
+    memory, and the default one is saved with the sorted ages in the cache.
+    """
+    version = 1
+
+    def __init__(self, taxa, types, sorted_ages, offsets, cubes=None):
+        self.taxa = list(taxa)
+        self.types = list(types)
+        self.sorted_ages = sorted_ages  # age_key -> sorted values by group
+        self.offsets = offsets          # age_key -> start of each group (+ end)
+        self.cubes = {} if cubes is None else cubes  # (age_key, nbins, range) -> (edges, counts)
+
+    @classmethod
+    def build(cls, ages, age_keys):
+        taxon_codes, taxa = pd.factorize(ages.taxon, sort=True)
+        type_codes, types = pd.factorize(ages['type'], sort=True)
+        groups = taxon_codes * len(types) + type_codes
+        ngroups = len(taxa) * len(types)
+        sorted_ages, offsets = {}, {}
+        for age_key in age_keys:
+            values = ages[age_key].values.astype(float)
+            valid = ~np.isnan(values)
+            order = np.lexsort((values[valid], groups[valid]))
+            sorted_ages[age_key] = values[valid][order]
+            offsets[age_key] = np.searchsorted(groups[valid][order],
+                                               np.arange(ngroups + 1))
+        return cls(taxa, types, sorted_ages, offsets)
+
+    def save(self, filename):
+        arrays = {'taxa': np.array(self.taxa, dtype=str),
+                  'types': np.array(self.types, dtype=str),
+                  'version': np.array(self.version)}
+        for age_key in self.sorted_ages:
+            arrays['sorted/' + age_key] = self.sorted_ages[age_key]
+            arrays['offsets/' + age_key] = self.offsets[age_key]
+        for i, ((age_key, nbins, range_), (edges, counts)) in enumerate(self.cubes.items()):
+            arrays['cube%d/%s' % (i, age_key)] = counts
+            arrays['edges%d/%s' % (i, age_key)] = edges
+        with open(filename, 'wb') as out:
+            np.savez(out, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as archive:
+            if archive['version'] != cls.version:
+                raise ValueError('Unsupported cache version %s' % archive['version'])
+            sorted_ages, offsets, cubes = {}, {}, {}
+            for name in archive.files:
+                prefix, _, age_key = name.partition('/')
+                if prefix == 'sorted':
+                    sorted_ages[age_key] = archive[name]
+                elif prefix == 'offsets':
+                    offsets[age_key] = archive[name]
+                elif prefix.startswith('cube'):
+                    edges = archive['edges%s/%s' % (prefix[4:], age_key)]
+                    cubes[(age_key, len(edges) - 1, (edges[0], edges[-1]))] = \
+                            (edges, archive[name])
+            return cls(archive['taxa'], archive['types'], sorted_ages, offsets,
+                       cubes)
+
+    def group_slice(self, age_key, taxon, evt):
+        g = self.taxa.index(taxon) * len(self.types) + self.types.index(evt)
+        offsets = self.offsets[age_key]
+        return slice(offsets[g], offsets[g+1])
+
+    def data_range(self, age_key, keys):
+        """(min, max) of the ages of the given (taxon, type) groups."""
+        values = self.sorted_ages[age_key]
+        slices = [self.group_slice(age_key, *key) for key in keys]
+        slices = [sl for sl in slices if sl.stop > sl.start]
+        if not slices:
+            return (0., 1.)
+        return (min(values[sl.start] for sl in slices),
+                max(values[sl.stop-1] for sl in slices))
+
+    def histogram(self, age_key, nbins, range):
+        """Return the bin edges, and the counts cube of shape (taxa, types, nbins)."""
+        lo, hi = float(range[0]), float(range[1])
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5  # like np.histogram
+        key = (age_key, nbins, (lo, hi))
+        try:
+            return self.cubes[key]
+        except KeyError:
+            pass
+        edges = np.linspace(lo, hi, nbins + 1)
+        values = self.sorted_ages[age_key]
+        offsets = self.offsets[age_key]
+        ngroups = len(offsets) - 1
+        counts = np.zeros((ngroups, nbins), dtype=np.int64)
+        for g in np.flatnonzero(np.diff(offsets)):
+            group_values = values[offsets[g]:offsets[g+1]]
+            pos = np.searchsorted(group_values, edges, side='left')
+            # The last bin includes its right edge.
+            pos[-1] = np.searchsorted(group_values, edges[-1], side='right')
+            counts[g] = np.diff(pos)
+        counts = counts.reshape(len(self.taxa), len(self.types), nbins)
+        self.cubes[key] = (edges, counts)
+        return edges, counts
+
+    def counts(self, age_key, keys, nbins, range):
+        """Bin edges, and the counts of each (taxon, type) in `keys`."""
+        edges, cube = self.histogram(age_key, nbins, range)
+        return edges, [cube[self.taxa.index(taxon), self.types.index(evt)]
+                       for taxon, evt in keys]
+
+
 def intersect_size(serie, checked_values):
     is_edited = set(serie) & checked_values
     return float(len(is_edited)) / len(serie)
@@ -164,7 +277,8 @@ class DataVisualizor(object):
         logger.info('Loading the set of edited nodes:')
         pickled_file = os.path.basename(os.path.splitext(treeforest)[0]) + \
                         '.editedset.pickle'
-        if os.path.exists(pickled_file):
+        if os.path.exists(pickled_file) and \
+                os.path.getmtime(pickled_file) >= os.path.getmtime(treeforest):
             print('from pickle...')
             with open(pickled_file, 'rb') as pickle_in:
                 self.edited_set = pickle.load(pickle_in)
@@ -184,9 +298,16 @@ class DataVisualizor(object):
                 pickle.dump(self.edited_set, pickle_out)
 
     def __init__(self, ages_file, no_edited=None, age_key=DEFAULT_AGE_KEY,
-                 filter=None):
-        """Load and format data"""
+                 filter=None, cache=True):
+        """Load and format data
+
+        cache: save the histogram counts (see `AgeHistCube`) next to the ages_file.
+        """
 
+        self.ages_file = ages_file
+        self.filter = filter
+        self.cache = cache
+        self._hist_cube = None
         self.edited_set = None
         self.not_edited = None
         self.no_edited  = no_edited
@@ -228,7 +349,7 @@ class DataVisualizor(object):
 
         if no_edited:
             self.load_edited_set(no_edited)
-            self.not_edited = self.ages.name.apply(lambda x: x not in self.edited_set)
+            self.not_edited = ~self.ages.name.isin(self.edited_set)
             self.ages = self.ages[self.not_edited]
         
         self.ages = self.ages.drop_duplicates()
@@ -246,6 +367,39 @@ class DataVisualizor(object):
         
         #newdata = [taxa_ages.get_group(lab)[age_keys] for lab in labels]
 
+    def hist_cube_file(self):
+        """Cache file name, specific to the ages file version and the filters."""
+        stat = os.stat(self.ages_file)
+        edited_stat = None
+        if self.no_edited:
+            edited = os.stat(self.no_edited)
+            edited_stat = (edited.st_size, edited.st_mtime_ns)
+        key = repr((stat.st_size, stat.st_mtime_ns, self.filter, self.no_edited,
+                    edited_stat, AgeHistCube.version))
+        return '%s.histcube-%s.npz' % (os.path.splitext(self.ages_file)[0],
+                                       hashlib.sha1(key.encode()).hexdigest()[:12])
+
+    @property
+    def hist_cube(self):
+        """Built once per ages file and filters, then loaded from the cache."""
+        if self._hist_cube is not None:
+            return self._hist_cube
+        cachefile = self.hist_cube_file() if self.cache else None
+        if cachefile and os.path.exists(cachefile):
+            logger.info('Loading histogram data from %s', cachefile)
+            self._hist_cube = AgeHistCube.load(cachefile)
+        else:
+            age_keys = [col for col in self.ages.columns
+                        if (col.startswith('age') or col == self.age_key)
+                        and np.issubdtype(self.ages[col].dtype, np.number)]
+            self._hist_cube = AgeHistCube.build(self.ages, age_keys)
+            if cachefile:
+                # Also cache the default histograms
+                self._hist_cube.histogram(self.age_key, self.default_nbins,
+                                          (0, self.ages[self.age_key].max()))
+                self._hist_cube.save(cachefile)
+        return self._hist_cube
+
     def load_phyltree(self, phyltreefile=None, ensembl_version=None):
         phyltreefile = phyltreefile if phyltreefile else self.phyltreefile
         ensembl_version = ensembl_version if ensembl_version else \
@@ -279,8 +433,9 @@ class DataVisualizor(object):
                                     for evt in ('dup', 'spe')}
         #use `hatch=` in plt.bar for patterning.
 
-        self.ages['taxon_evt_color'] = self.ages[['taxon', 'type']].apply(
-                lambda k: self.taxon_evt_2color[tuple(k)], axis=1, raw=True)
+        self.ages['taxon_evt_color'] = pd.Series(
+                list(zip(self.ages.taxon, self.ages['type'])),
+                index=self.ages.index).map(self.taxon_evt_2color)
 
 
     def scatter(self, x, y, xlim=None, ylim=None):
@@ -365,6 +520,37 @@ class DataVisualizor(object):
         return data, colors, labs_legend
 
 
+    def make_hist_counts(self, taxa=None, nbins=None, range=None):
+        """Same as `make_hist_data`, but return the bin edges and the counts
+        of each histogram, from the cached `hist_cube`.
+
+        range: defaults to the (min, max) of the selected data."""
+        nbins = nbins if nbins else self.default_nbins
+        taxa = taxa if taxa is not None else self.taxa
+        label_len = max(len(lab) for lab in taxa)
+        label_fmt = "%%-%ds (%%s)" % label_len
+
+        keys = [key for key in self.taxa_evt if key[0] in taxa]
+        cube = self.hist_cube
+        nonempty = [key for key in keys
+                    if cube.group_slice(self.age_key, *key).stop >
+                       cube.group_slice(self.age_key, *key).start]
+        if len(nonempty) < len(keys):
+            logger.warning('Only NaN for some taxa')
+        if range is None:
+            range = cube.data_range(self.age_key, nonempty)
+        edges, counts = cube.counts(self.age_key, nonempty, nbins, range)
+        colors      = [self.taxon_evt_2color[key] for key in nonempty]
+        labs_legend = [label_fmt % key for key in nonempty]
+        return edges, counts, colors, labs_legend
+
+    def plot_hist_counts(self, ax, edges, counts, **kwargs):
+        """Stacked histogram of precomputed counts"""
+        centers = (edges[:-1] + edges[1:]) / 2
+        if len(counts) == 1:
+            return ax.hist(centers, bins=edges, weights=counts[0], **kwargs)
+        return ax.hist([centers]*len(counts), bins=edges, weights=counts, **kwargs)
+
     def lineage_hist(self, lineage=None, nbins=None):
         """
         Histogram of duplications along a selected lineage.
@@ -381,12 +567,12 @@ class DataVisualizor(object):
         # set up hist_coords, in case `add_edited_prop` is used.
         self.hist_coords = {tax: (None, 0) for tax in taxa} # age not needed.
 
-        data, colors, labels = self.make_hist_data(taxa)
+        edges, counts, colors, labels = self.make_hist_counts(taxa, nbins)
 
         logger.info("plotting histogram")
         
         self.fig, self.ax = plt.subplots()
-        self.ax.hist(data, bins=nbins,
+        self.plot_hist_counts(self.ax, edges, counts,
                      histtype='barstacked',
                      rwidth=1,
                      color=colors,
@@ -581,29 +767,27 @@ class DataVisualizor(object):
 
         for ax_pos, ax in enumerate(axes):
             labs        = self.subs_taxa[ax_pos]
-            data, colors, labs_legend = self.make_hist_data(labs)
+            edges, counts, colors, labs_legend = self.make_hist_counts(
+                                                labs, nbins, (0, oldest_age))
             logger.info("* Labels: %s; N observations: %s; nbins: %r",
                          labs_legend,
-                         ([d.shape for d in data],),
+                         ([c.sum() for c in counts],),
                          nbins)
             #logger.debug("orientation: %r", bar_orientation)
             #logger.debug("colors: %s", colors)
-            if not data:
+            if not counts:
                 logger.warning('No data. Skip')
                 continue
             try:
-                if len(data)==1:
-                    data, = data
-
-                _, bins, _ = ax.hist(data, bins=nbins, histtype='barstacked', rwidth=1,
-                                 range=(0, oldest_age),
+                _, bins, _ = self.plot_hist_counts(ax, edges, counts,
+                                 histtype='barstacked', rwidth=1,
                                  orientation=bar_orientation,
                                  color=colors,
                                  edgecolor='none',
                                  label=labs_legend,
                                  picker=True) # allow mouse selecting bars.
             except BaseException as err:
-                err.args += tuple((type(d), repr(d)) for d in data)
+                err.args += tuple((type(c), repr(c)) for c in counts)
                 raise
 
             fix_dupticks(ax)
@@ -710,7 +894,7 @@ def run(command, ages_file, phyltreefile=None, ensembl_version=None,
         outfile=None, lineage=None,
         show_edited=None, no_edited=False, age_key=DEFAULT_AGE_KEY, filter=None,
         nbins=DEFAULT_NBINS, vertical=False, x=None, y=None, xlim=None, ylim=None,
-        sharescale=False, title=None):
+        sharescale=False, title=None, no_cache=False):
 
     curr_backend = mpl.get_backend()
     if not outfile and "inline" not in curr_backend and curr_backend != "nbagg":
@@ -724,7 +908,7 @@ def run(command, ages_file, phyltreefile=None, ensembl_version=None,
                 plt.switch_backend("TkAgg")
 
     dv = DataVisualizor(ages_file, no_edited=no_edited, age_key=age_key,
-                        filter=filter)
+                        filter=filter, cache=(not no_cache))
     if xlim is not None:
         xlim = tuple(float(x) for x in xlim.split(','))
     if ylim is not None:
@@ -794,6 +978,9 @@ if __name__=='__main__':
                                help="Filter rows on the value of a given "\
                                     "column.  e.g: 'type==\"spe\"' ")
     parent_parser.add_argument('-v', '--verbose', action='count', default=0)
+    parent_parser.add_argument('--no-cache', action='store_true',
+                               help='do not save the histogram data next to '\
+                                    'the ages_file')
     
     process_edited_parser = parent_parser.add_mutually_exclusive_group()
     # these two options must be given the treeforest file.
@@ -12,12 +12,13 @@ from collections import OrderedDict, defaultdict
 from queue import deque
 import numpy as np
 #from numpy import array as a, concatenate as c
-import ete3
 import argparse
 import logging
-import scipy.stats as st
 
-import LibsDyogen.myPhylTree as PhylTree # my custom python3 version
+from objectools import lazy_import
+ete3 = lazy_import('ete3')
+st = lazy_import('scipy.stats')
+PhylTree = lazy_import('LibsDyogen.myPhylTree') # my custom python3 version
 
 from genomicustools.identify import convert_gene2species
 from IOtools import Stream
@@ -56,8 +57,14 @@ BEAST_REASSIGNS = {'%s_%s' % (v,s): reassign_beast_range
                    for s in ('95%_HPD', 'range')}
 
 
-def ls(array):
-    return str(array).replace('\n', '')
+class ls(object):
+    """Array printed on one line. Only formatted when printed, since it is
+    mostly passed to `logger.debug`."""
+    __slots__ = ('array',)
+    def __init__(self, array):
+        self.array = array
+    def __str__(self):
+        return str(self.array).replace('\n', '')
 
 def printtree(tree, indent='', features=None, **kwargs):
     line = indent + tree.name
@@ -945,6 +952,128 @@ def rec_combine_weighted_paths(node, subtree, unweighted=True):
     assert subtree[node.name]['w'].shape == (expected_shape[0],), subtree[node.name]['w'].shape
 
 
+class PathStore(object):
+    """Paths from the nodes to their next calibrated descendants (leaves or
+    calibrated nodes), in memory linear in the number of leaves.
+
+    Instead of concatenating the children paths at each node (quadratic in
+    deep trees), each calibrated descendant has one row in preallocated arrays.
+    Rows are allocated like a stack in postorder, so that the rows below a node
+    form a contiguous slice, and the branch lengths are added in place to the
+    slice of each child when merging it into its parent (in the same order as
+    the concatenation, so that the paths are identical).
+
+    The paths of a node are therefore only available until its parent is
+    merged; `replay` recomputes them below a calibrated node. Once dated, the
+    slice of a calibrated node is replaced by a single row.
+    """
+    # subtree entries computed from the store
+    KEYS = ('tmp_m', 'cal_ages', 'cal_paths', 'cal_leaves', 'w')
+
+    def __init__(self, capacity, n_measures):
+        self.tmp_m = np.empty((capacity, n_measures))
+        self.w = np.empty(capacity)  # Weights (path fraction)
+        self.cal_ages = np.empty(capacity)
+        self.cal_paths = np.empty((capacity, n_measures))
+        self.cal_leaves = np.empty(capacity, dtype=int)
+        self.rows = {}  # node name -> (start, stop)
+        self.end = 0
+
+    def entry(self, name, *args, **kwargs):
+        """New subtree entry, whose paths are read from the store"""
+        return StoredPathsEntry(self, name, *args, **kwargs)
+
+    def _set_row(self, row, name, cal_age, cal_path, cal_leaves):
+        self.tmp_m[row] = self.cal_paths[row] = cal_path
+        self.w[row] = 1
+        self.cal_ages[row] = cal_age
+        self.cal_leaves[row] = cal_leaves
+        self.rows[name] = (row, row+1)
+
+    def add_leaf(self, name, age):
+        self._set_row(self.end, name, age, 0, 1)
+        self.end += 1
+
+    def merge(self, node, subtree):
+        """Slice of an internal node: add the children branch lengths to their
+        paths, and weight them by the fraction of children."""
+        frac = 1. / len(node.children)
+        start = stop = None
+        for ch in node.children:
+            ch_start, ch_stop = self.rows[ch.name]
+            assert stop is None or ch_start == stop, \
+                    "Non contiguous paths at %r" % node.name
+            if start is None:
+                start = ch_start
+            stop = ch_stop
+            self.tmp_m[ch_start:ch_stop] += subtree[ch.name]['br_m']
+            self.w[ch_start:ch_stop] *= frac
+        self.rows[node.name] = (start, stop)
+
+    def replay(self, node, subtree):
+        """Recompute the paths below the calibrated `node`, and yield each
+        uncalibrated node when its paths are available."""
+        start, stop = self.rows[node.name]
+        self.tmp_m[start:stop] = self.cal_paths[start:stop]
+        self.w[start:stop] = 1
+        for desc in node.traverse('postorder',
+                                  is_leaf_fn=lambda n: n is not node and n.cal):
+            if desc.cal:
+                continue
+            self.merge(desc, subtree)
+            yield desc
+
+    def calibrate(self, name, age, path, cal_leaves=None):
+        """Replace the rows of a dated calibrated node by its own row.
+        `path`: the average path from this node."""
+        start, stop = self.rows[name]
+        assert stop == self.end, "Calibrated node %r is not the last one" % name
+        if cal_leaves is None:
+            cal_leaves = self.cal_leaves[start:stop].sum()
+        self._set_row(start, name, age, path, cal_leaves)
+        self.end = start + 1
+
+    def get(self, name, key):
+        start, stop = self.rows[name]
+        return getattr(self, key)[start:stop].copy()
+
+
+class StoredPathsEntry(dict):
+    """Subtree entry (dict) of `bound_average`, computing the path arrays
+    from a `PathStore` when they are not set."""
+    __slots__ = ('store', 'name')
+
+    def __init__(self, store, name, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.store = store
+        self.name = name
+
+    def __missing__(self, key):
+        if key not in PathStore.KEYS:
+            raise KeyError(key)
+        return self.store.get(self.name, key)
+
+
+def rec_combine_stored_paths(node, subtree, store, unweighted=True):
+    """Like `rec_combine_weighted_paths`, but with the paths in a `PathStore`"""
+    store.merge(node, subtree)
+    frac = 1. / len(node.children)
+    children_leaves = np.array([subtree[ch.name]['leaves'] for ch in node.children])[:,None]
+    children_sds = np.array([subtree[ch.name]['sd'] for ch in node.children])
+    children_brlen = np.array([subtree[ch.name]['br_m'] for ch in node.children])
+    subtree[node.name]['leaves'] = children_leaves.sum()
+    if unweighted:
+        subtree[node.name]['sd'] = np.sqrt(((children_sds**2).sum(axis=0) +
+                                            (children_brlen).sum(axis=0)
+                                           )) * frac
+    else:
+        subtree[node.name]['sd'] = np.sqrt(
+                                    (((children_sds*children_leaves)**2).sum()
+                                     + (children_brlen*children_leaves**2).sum(axis=0)
+                                    ) / sum(children_leaves)**2)
+    assert subtree[node.name]['sd'].shape == children_sds.shape[1:]
+
+
 def old_timescale_paths(previous_node, previous_path, nodename, subtree,
                         tmp_m='tmp_m', weight_key=None, original_leading_paths=False):
     previous_age = subtree[previous_node]['age']
@@ -1154,7 +1283,6 @@ def bound_average(fulltree, calibration, todate=isdup,
 
     reset_at_calib = False
 
-    rec_rootward = rec_combine_weighted_paths
     calibration[None] = np.NaN  # When select_calib_id returns None
 
     node_info = [] if node_info is None \
@@ -1185,6 +1313,8 @@ def bound_average(fulltree, calibration, todate=isdup,
     n_measures = len(measures)
     # initial measure while passing a speciation for the first time
     measures_zeros = np.zeros((1, n_measures))
+    # Paths to the calibrated descendants, shared by the subtree entries.
+    store = PathStore(len(fulltree), n_measures)
     is_next_cal = lambda node: (not node.is_root() and node.cal)
 
     for node in fulltree.traverse('postorder'):
@@ -1195,8 +1325,8 @@ def bound_average(fulltree, calibration, todate=isdup,
             logger.debug(debug_msg + "Root (discard)")
             continue
 
-        subtree[scname] = {attr: getinfo(node)
-                           for attr,getinfo in node_info}
+        subtree[scname] = store.entry(scname, {attr: getinfo(node)
+                                               for attr,getinfo in node_info})
         node.add_features(**{ft: setft(node, subtree) for ft,setft in node_feature_setter})
 
         #try:
@@ -1211,15 +1341,12 @@ def bound_average(fulltree, calibration, todate=isdup,
             
             leaf_age = calibration.get(select_calib_id(node), 0)
 
+            # tmp_m, cal_paths: 0; w (path fraction): 1;
+            # cal_leaves (number of leaves below the next calibrated nodes): 1
+            store.add_leaf(scname, leaf_age)
             subtree[scname].update({
-                               'tmp_m': measures_zeros,
-                               #'total_m': measures_zeros,
                                'age': leaf_age,
-                               'w': np.array([1]),   # Weights (path fraction)
                                'sd': np.zeros(n_measures),
-                               'cal_ages': np.array([leaf_age]),
-                               'cal_paths': measures_zeros,
-                               'cal_leaves': np.array([1]), # number of leaves below the next calibrated nodes
                                'leaves': 1}) # number of descendant leaves
             #ages[scname] = 0
             ages.append([scname] + branch_measures.tolist() +
@@ -1240,20 +1367,22 @@ def bound_average(fulltree, calibration, todate=isdup,
             #    else:
             #        raise
 
+            # Before the children paths are merged into this node.
+            subtree[scname]['p_clock'] = clock_test(node, subtree, measures, unweighted)
+
             # Compute the temporary measure of the node.
-            rec_rootward(node, subtree, unweighted=unweighted)
+            rec_combine_stored_paths(node, subtree, store, unweighted=unweighted)
             #rec_rootward(node, subtree, 'total_m')
             #rec_average(node, subtree, measures, weight_key='ncal')
 
-            subtree[scname]['p_clock'] = clock_test(node, subtree, measures, unweighted)
-
             if todate(node, subtree):
                 # it is uncalibrated:
                 node.add_feature('cal', 0)
-                logger.debug(debug_msg + "Uncal.; m=%s; sd=%s; cal_leaves=%s",
-                             ls(subtree[scname]['tmp_m']),
-                             ls(subtree[scname]['sd']),
-                             ls(subtree[scname]['cal_leaves']))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(debug_msg + "Uncal.; m=%s; sd=%s; cal_leaves=%s",
+                                 ls(subtree[scname]['tmp_m']),
+                                 ls(subtree[scname]['sd']),
+                                 ls(subtree[scname]['cal_leaves']))
             else:
                 # It is calibrated.
                 node.add_feature('cal', 1)
@@ -1287,62 +1416,73 @@ def bound_average(fulltree, calibration, todate=isdup,
                 else:
                     scaling_m = next_tmp_m
 
-                logger.debug("    climb up to next calibrations: "
-                             "scaling_m=%s m=%s sd=%s w=%s leaves=%s "
-                             "cal_leaves=%s",
-                             ls(scaling_m),
-                             ls(subtree[scname]['tmp_m']),
-                             ls(subtree[scname]['sd']),
-                             None if unweighted else ls(subtree[scname]['w']),
-                             subtree[scname]['leaves'],
-                             ls(subtree[scname]['cal_leaves']))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("    climb up to next calibrations: "
+                                 "scaling_m=%s m=%s sd=%s w=%s leaves=%s "
+                                 "cal_leaves=%s",
+                                 ls(scaling_m),
+                                 ls(subtree[scname]['tmp_m']),
+                                 ls(subtree[scname]['sd']),
+                                 None if unweighted else ls(subtree[scname]['w']),
+                                 subtree[scname]['leaves'],
+                                 ls(subtree[scname]['cal_leaves']))
                 ### This is where version _2 is different
                 # walk descendants until speciation.
                 # need to get the age of next speciation and compute the
                 # time between the two speciation.
 
-                # Dynamic list during the climbing:
-                # store (node, measures for this node's branch)
-                # TODO: deque
-                nextnodes = deque([(ch,subtree[ch.name]['br_m'])
-                                   for ch in node.children])
-                while nextnodes:
-                    nextnode, next_path_m = nextnodes.popleft()
-
-                    try:
-                        nextnode_m = subtree[nextnode.name]['tmp_m']
-                    except KeyError as err:
-                        err.args += ("Error: Node exists twice in the "
-                          "tree. You may need to rerun `prune2family.py`",)
-                        raise
+                # Measures from this calibration to each descendant.
+                leading_paths = {}
+                if original_leading_paths:
+                    for desc in node.iter_descendants('preorder',
+                            is_leaf_fn=lambda n: n is not node and n.cal):
+                        leading_paths[desc.name] = subtree[desc.name]['br_m']
+                        if desc.up is not node:
+                            leading_paths[desc.name] = leading_paths[desc.name] \
+                                                       + leading_paths[desc.up.name]
+
+                # Scale the uncalibrated descendants while their paths are
+                # available in the store (postorder).
+                scaled_ages = {}
+                for nextnode in store.replay(node, subtree):
+                    nextnode_m = subtree[nextnode.name]['tmp_m']
                     logger.debug("    - %s: measure(to calib)=%s",
                                  nextnode.name, ls(nextnode_m))
-                    # or: any(nextnode_m > measures_zeros) ?
-                    #if nextnode_m is measures_zeros:
+                    if original_leading_paths:
+                        next_path_m = leading_paths[nextnode.name]
+                        logger.debug("          measure(from calib)=%s",
+                                     ls(next_path_m))
+                        scaling_weights = (subtree[nextnode.name]['cal_leaves']
+                                           if unweighted else
+                                           subtree[nextnode.name]['w'])
+                        scaling_m = np.average(next_path_m + nextnode_m,
+                                               axis=0,
+                                               weights=scaling_weights)
+
+                    logger.debug('        Previous shapes: previous_paths %s; scaling_weights %s',
+                                 scaling_m.shape,
+                                 scaling_weights.shape)
+
+                    if (scaling_m == 0).any():
+                        logger.warning("Scaling measure = %s (cannot divide) at %r",
+                                       ls(scaling_m), nextnode.name)
+
+                    scaled_ages[nextnode.name] = timescale_paths(
+                                                    scname, scaling_m,
+                                                    nextnode.name, subtree,
+                                                    unweighted,
+                                                    correct_unequal_calibs)
+
+                # Then fix the ages from the parents (preorder).
+                nextnodes = deque(node.children)
+                while nextnodes:
+                    nextnode = nextnodes.popleft()
+                    if nextnode.name not in subtree:
+                        raise KeyError(nextnode.name, "Error: Node exists twice "
+                                "in the tree. You may need to rerun `prune2family.py`")
 
                     if not nextnode.cal:
-                        if original_leading_paths:
-                            logger.debug("          measure(from calib)=%s",
-                                         ls(next_path_m))
-                            scaling_weights = (subtree[nextnode.name]['cal_leaves']
-                                               if unweighted else
-                                               subtree[nextnode.name]['w'])
-                            scaling_m = np.average(next_path_m + nextnode_m,
-                                                   axis=0,
-                                                   weights=scaling_weights)
-
-                        logger.debug('        Previous shapes: previous_paths %s; scaling_weights %s',
-                                     scaling_m.shape,
-                                     scaling_weights.shape)
-
-                        if (scaling_m == 0).any():
-                            logger.warning("Scaling measure = %s (cannot divide) at %r",
-                                           ls(scaling_m), nextnode.name)
-
-                        age = timescale_paths(scname, scaling_m,
-                                              nextnode.name, subtree,
-                                              unweighted,
-                                              correct_unequal_calibs)
+                        age = scaled_ages[nextnode.name]
                         parent_age = discarded_nodes[nextnode.up.name]['age']
                         if fix_conflict_ages:
                             child_age = subtree[nextnode.name]['cal_ages'].max()
@@ -1377,11 +1517,7 @@ def bound_average(fulltree, calibration, todate=isdup,
                                      getattr(fulltree, 'treename', '')])
                         for i, m in enumerate(measures):
                             nextnode.add_feature('age_'+m, age[i])
-                        # When climbing up to next spe, need to increment
-                        # the lengths 'next_path_m' from the previous spe
-                        nextnodes.extend(
-                                (nch, subtree[nch.name]['br_m'] + next_path_m)
-                                for nch in nextnode.children)
+                        nextnodes.extend(nextnode.children)
                     else:
                         logger.debug('        calibrated.')
                     discarded_nodes[nextnode.name] = subtree.pop(nextnode.name)
@@ -1406,18 +1542,13 @@ def bound_average(fulltree, calibration, todate=isdup,
                 next_tmp_m = np.array([next_tmp_m])
                 logger.debug('    After calibrated node: next_tmp_m=%s',
                              ls(next_tmp_m))
-                subtree[scname].update(
-                            cal_ages=np.array([node_age]),
-                            tmp_m=next_tmp_m,
-                            cal_paths=next_tmp_m,
-                            cal_leaves=np.array([subtree[scname]['cal_leaves'].sum()]),
-                            w=np.array([1]))
                 # then reset measure (dS, dist) to zero
                 if reset_at_calib:
-                    subtree[scname].update(tmp_m=measures_zeros, # and no need for total_m
-                                           cal_paths=measures_zeros,
-                                           leaves=1,
-                                           cal_leaves=np.array([1]))
+                    store.calibrate(scname, node_age, measures_zeros[0],
+                                    cal_leaves=1)
+                    subtree[scname]['leaves'] = 1
+                else:
+                    store.calibrate(scname, node_age, next_tmp_m[0])
     #logger.debug(subtree)
     return ages, subtrees
 
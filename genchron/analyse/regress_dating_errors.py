@@ -23,6 +23,7 @@ import seaborn as sb
 
 from objectools import Args, as_args, generic_update, generic_remove_items
 from seqtools.compo_freq import weighted_std
+from pamliped.codemlparser2 import time2seconds  # Convert "time used" into seconds.
 from dendro.bates import dfw_pairs_generalized, dfw_pairs
 from dendro.framed import get_topo_time
 from datasci.graphs import scatter_density, \
@@ -158,15 +159,6 @@ RATE_MEASURES = ['%s_rate' % m for m in MEASURES]
 RATE_STD_MEASURES = [r + '_std' for r in RATE_MEASURES]
 
 
-# Convert "time used" into seconds.  # ~~> numbertools? timetools? converters?
-def time2seconds(time_str):
-    factors = [1, 60, 3600, 3600*24]
-    s = 0
-    for factor, n_units in zip(factors, reversed(time_str.split(':'))):
-        s += factor * int(n_units)
-    return s
-
-
 def load_stats_al(alfile):
     return pd.read_csv(alfile, index_col=0, sep='\t')
 
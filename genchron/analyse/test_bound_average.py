@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from collections import Counter
+import pytest
+pytest.importorskip('ete3')
+from genchron.analyse.bench_bound_average import random_genetree, \
+        taxon_from_name, run_eager, run_lazy, SPECIES_AGES
+from genchron.analyse.generate_dNdStable import bound_average, \
+        retrieve_isdup, isdup_cache
+
+MEASURES = ['dS', 'dN', 't', 'dist']
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_lazy_debug_formatting_same_ages(seed):
+    tree = random_genetree(300, MEASURES, seed=seed)
+    eager_ages, _ = run_eager(tree.copy(), MEASURES)
+    lazy_ages, _ = run_lazy(tree.copy(), MEASURES)
+    assert len(lazy_ages) > 0
+    # NaN != NaN, hence the comparison of strings.
+    assert [str(row) for row in eager_ages] == [str(row) for row in lazy_ages]
+
+
+def test_node_getters_called_once_per_node():
+    """The taxon and event type are already computed once per node (and the
+    predicates read them from `subtree`), whatever the number of measures."""
+    calls = Counter()
+
+    def get_taxon(node):
+        calls['taxon', node.name] += 1
+        return taxon_from_name(node)
+
+    def get_eventtype(node, subtree):
+        calls['type', node.name] += 1
+        if node.is_leaf():
+            subtree[node.name]['isdup'] = False
+            return 'leaf'
+        return 'dup' if isdup_cache(node, subtree) else 'spe'
+
+    tree = random_genetree(300, MEASURES)
+    bound_average(tree, dict(SPECIES_AGES), retrieve_isdup, MEASURES,
+                  calib_selecter='taxon', node_info=[('taxon', get_taxon)],
+                  node_feature_setter=[('type', get_eventtype)])
+    assert set(calls.values()) == {1}
+    assert len(calls) == 2 * (len(list(tree.traverse())) - 1)  # Except the root
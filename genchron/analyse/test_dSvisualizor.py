@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import os
+import bz2
+import numpy as np
+import pytest
+from genchron.analyse.dSvisualizor import DataVisualizor, AgeHistCube
+
+
+AGES = """name\ttaxon\tgenetree\ttype\tcalibrated\tage_dS\tage_t
+HominidaeENSGT001\tHominidae\tENSGT001\tdup\t0\t0.1\t10
+HominidaeENSGT002\tHominidae\tENSGT002\tdup\t0\t0.3\t20
+HominidaeENSGT003\tHominidae\tENSGT003\tspe\t0\t0.2\t15
+MuridaeENSGT001\tMuridae\tENSGT001\tdup\t0\t0.5\t30
+MuridaeENSGT004\tMuridae\tENSGT004\tspe\t0\t0.4\t25
+MuridaeENSGT005\tMuridae\tENSGT005\tspe\t1\t0.9\t90
+"""
+
+
+def write_forest(filename, edited):
+    """Edited nodes as (taxon, family)"""
+    with bz2.open(filename, 'wt') as out:
+        for taxon, family in edited:
+            out.write("info\t{'Duplication': 3, 'family_name': '%s', "
+                      "'taxon_name': '%s'}\n" % (family, taxon))
+
+
+@pytest.fixture
+def ages_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The edited set is pickled in the working dir.
+    path = tmp_path / 'ages.tsv'
+    path.write_text(AGES)
+    return str(path)
+
+
+def test_hist_cube(ages_file):
+    visu = DataVisualizor(ages_file)
+    cube = visu.hist_cube
+    edges, counts = cube.counts('age_dS', visu.taxa_evt, 4, (0, 0.6))
+    expected = [np.histogram(visu.taxa_evt_ages.get_group(key).age_dS, 4, (0, 0.6))[0]
+                for key in visu.taxa_evt]
+    assert np.allclose(edges, np.linspace(0, 0.6, 5))
+    assert [c.tolist() for c in counts] == [e.tolist() for e in expected]
+    assert cube.data_range('age_t', visu.taxa_evt) == (10, 30)  # calibrated excluded
+    cachefile = visu.hist_cube_file()
+    assert os.path.exists(cachefile)
+
+    # Reloaded from the cache, with the default histogram.
+    reloaded = AgeHistCube.load(cachefile)
+    assert reloaded.taxa == cube.taxa and reloaded.types == cube.types
+    default_key = ('age_dS', visu.default_nbins, (0., 0.5))
+    assert default_key in reloaded.cubes
+    assert (reloaded.cubes[default_key][1] == cube.cubes[default_key][1]).all()
+    assert (DataVisualizor(ages_file).hist_cube.sorted_ages['age_t']
+            == cube.sorted_ages['age_t']).all()
+
+    # Invalidated by a new version of the ages file.
+    with open(ages_file, 'a') as out:
+        out.write('MuridaeENSGT006\tMuridae\tENSGT006\tdup\t0\t0.55\t33\n')
+    visu2 = DataVisualizor(ages_file)
+    assert visu2.hist_cube_file() != cachefile
+    _, counts = visu2.hist_cube.counts('age_dS', [('Muridae', 'dup')], 4, (0, 0.6))
+    assert counts[0].tolist() == [0, 0, 0, 2]
+
+
+def test_hist_cube_edited_genes(ages_file, tmp_path):
+    forest = str(tmp_path / 'forest.bz2')
+    write_forest(forest, [('Muridae', 'ENSGT001')])
+    visu = DataVisualizor(ages_file, no_edited=forest)
+    _, counts = visu.hist_cube.counts('age_dS', [('Muridae', 'dup')], 4, (0, 0.6))
+    assert counts[0].tolist() == [0, 0, 0, 0]
+    cachefile = visu.hist_cube_file()
+
+    # The edited genes change: not the same cache.
+    write_forest(forest, [('Hominidae', 'ENSGT002')])  # Newer than the pickle.
+    visu2 = DataVisualizor(ages_file, no_edited=forest)
+    assert visu2.hist_cube_file() != cachefile
+    _, counts = visu2.hist_cube.counts('age_dS', [('Muridae', 'dup'),
+                                                  ('Hominidae', 'dup')], 4, (0, 0.6))
+    assert [c.tolist() for c in counts] == [[0, 0, 0, 1], [1, 0, 0, 0]]
@@ -82,6 +82,29 @@ assert 'dup' == get_eventtype(tree&'Homo.sapiensENSGT', subtree)
 assert 'leaf' == get_eventtype(tree&'Pan.paniscusENSGT', subtree)
 assert 'spe' == get_eventtype(tree&'HomoPanENSGT', subtree)
 
+#### Paths to the calibrated descendants ####
+
+tree = ete3.Tree('((A:0.5,B:0.25)x:1,(C:0.5,D:1.5,E:1)y:0.5)R;', format=1)
+subtree = {n.name: {'br_m': np.array([n.dist])} for n in tree.traverse()}
+store = PathStore(len(tree), 1)
+for n in tree.traverse('postorder'):
+    n.add_feature('cal', int(n.is_leaf() or n.is_root()))
+    if n.is_leaf():
+        store.add_leaf(n.name, 0)
+    else:
+        store.merge(n, subtree)
+assert store.rows == {'A': (0,1), 'B': (1,2), 'x': (0,2), 'C': (2,3),
+                      'D': (3,4), 'E': (4,5), 'y': (2,5), 'R': (0,5)}
+assert store.get('R', 'tmp_m')[:,0].tolist() == [1.5, 1.25, 1, 2, 1.5]
+assert np.allclose(store.get('R', 'w'), [1/4, 1/4, 1/6, 1/6, 1/6])
+# Paths of the uncalibrated nodes are recomputed
+replayed = {n.name: store.get(n.name, 'tmp_m')[:,0].tolist()
+            for n in store.replay(tree, subtree)}
+assert replayed == {'x': [0.5, 0.25], 'y': [0.5, 1.5, 1]}
+store.calibrate('R', 3, np.array([1.5]))
+assert store.rows['R'] == (0,1) and store.end == 1
+assert store.get('R', 'cal_leaves').tolist() == [5]
+
 #### Recursive algo ####
 #def get_taxon(node):
 #    return node.name
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Run many codeml control files in batches, on a local pool of workers.
+
+Jobs whose .mlc output is already complete (ends with the 'Time used' line)
+are skipped. The others get a predicted memory (`allocate_codeml_memory`) and
+runtime (proportional to nseq² x length, scaled by the 'Time used' of the
+completed .mlc files), and are packed into batches of at most `--batch-time`
+predicted seconds, longest first. Each worker runs one batch at a time, with
+its jobs run sequentially by `run_codeml_separatedir.sh`.
+
+A tab-separated report (one row per job) is written to stdout.
+
+USAGE:
+    ./codeml_packer.py -j 8 subtrees/*_m1w04.ctl
+    ./codeml_packer.py -j 8 --fromfile ctl_list.txt --dryrun
+"""
+
+
+import os.path as op
+import re
+import sys
+import shlex
+import subprocess
+import multiprocessing as mp
+from time import perf_counter
+import argparse as ap
+import logging
+logger = logging.getLogger(__name__)
+
+from genchron.allocate_codeml_memory import phylip_dims, allocate_memory
+from pamliped.codemlparser2 import time2seconds
+
+
+RUN_CODEML = op.join(op.dirname(op.dirname(op.abspath(__file__))),
+                     'pamliped', 'run_codeml_separatedir.sh')
+
+CTL_FILE = re.compile(r'^\s*(seqfile|treefile|outfile)\s*=\s*(\S+)', re.M)
+TIME_USED = re.compile(rb'Time used:\s+(\S+)$')
+MEMORY_UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+# Used when no completed .mlc is available.
+DEFAULT_SECONDS_PER_COST = 2e-6
+
+REPORT_COLUMNS = ['ctl', 'batch', 'nseq', 'length', 'memory', 'predicted',
+                  'status', 'seconds']
+
+
+def read_ctl(ctlfile):
+    """Paths of seqfile/treefile/outfile (relative to the .ctl directory)"""
+    with open(ctlfile) as f:
+        files = dict(CTL_FILE.findall(f.read()))
+    ctldir = op.dirname(ctlfile)
+    return {key: op.join(ctldir, path) for key, path in files.items()}
+
+
+def mlc_time_used(mlcfile, tailsize=1024):
+    """Seconds of the 'Time used' line ending a complete .mlc file, or None
+    if the file is missing or incomplete."""
+    try:
+        with open(mlcfile, 'rb') as f:
+            f.seek(0, 2)
+            f.seek(max(0, f.tell() - tailsize))
+            tail = f.read()
+    except FileNotFoundError:
+        return None
+    match = TIME_USED.match(tail.rstrip().rsplit(b'\n', 1)[-1])
+    if match is None:
+        return None
+    return time2seconds(match.group(1).decode())
+
+
+def memory_bytes(memory):
+    """'500M' -> 524288000"""
+    return int(memory[:-1]) * MEMORY_UNITS[memory[-1].upper()]
+
+
+class CodemlJob(object):
+    """A control file, with the dimensions of its alignment."""
+    def __init__(self, ctlfile):
+        self.ctlfile = ctlfile
+        files = read_ctl(ctlfile)
+        self.seqfile = files['seqfile']
+        self.mlcfile = files['outfile']
+        self.nseq, self.length = phylip_dims(self.seqfile)
+        self.memory = memory_bytes(allocate_memory(self.seqfile))
+        # None if not done yet
+        self.seconds = mlc_time_used(self.mlcfile)
+
+    @property
+    def cost(self):
+        return self.nseq**2 * self.length
+
+
+def fit_seconds_per_cost(jobs, default=DEFAULT_SECONDS_PER_COST):
+    """Median ratio of 'Time used' to cost over the completed jobs"""
+    ratios = sorted(job.seconds / job.cost for job in jobs
+                    if job.seconds and job.cost)
+    if not ratios:
+        return default
+    return ratios[len(ratios) // 2]
+
+
+def pack_batches(predicted, batch_time):
+    """First-fit decreasing: group the job indices into batches whose summed
+    prediction does not exceed `batch_time` (unless a single job does).
+
+    Return the batches (lists of indices), and their total predictions."""
+    batches, loads = [], []
+    for i in sorted(range(len(predicted)), key=lambda i: -predicted[i]):
+        for b, load in enumerate(loads):
+            if load + predicted[i] <= batch_time:
+                batches[b].append(i)
+                loads[b] += predicted[i]
+                break
+        else:
+            batches.append([i])
+            loads.append(predicted[i])
+    return batches, loads
+
+
+def max_workers(memories, ncores, max_memory=None):
+    """Reduce the number of workers so that the `ncores` largest memory
+    predictions fit into `max_memory`."""
+    if max_memory is None:
+        return ncores
+    largest = sorted(memories, reverse=True)
+    while ncores > 1 and sum(largest[:ncores]) > max_memory:
+        ncores -= 1
+    return ncores
+
+
+def run_job(ctlfile, command):
+    start = perf_counter()
+    returncode = subprocess.call(command + [ctlfile], stdout=subprocess.DEVNULL)
+    seconds = perf_counter() - start
+    complete = mlc_time_used(read_ctl(ctlfile)['outfile']) is not None
+    status = 'done' if returncode == 0 and complete else 'failed'
+    if status == 'failed':
+        logger.error('%s failed (exit code %d, complete mlc: %s)', ctlfile,
+                     returncode, complete)
+    return ctlfile, status, seconds
+
+
+def _run_batch(task):
+    ctlfiles, command = task
+    return [run_job(ctlfile, command) for ctlfile in ctlfiles]
+
+
+def run_batches(batches, command, ncores=1):
+    """Yield the results of each batch, as they finish (unordered)."""
+    tasks = [(batch, command) for batch in batches]
+    if ncores > 1 and len(tasks) > 1:
+        with mp.Pool(ncores) as pool:
+            yield from pool.imap_unordered(_run_batch, tasks, chunksize=1)
+    else:
+        for task in tasks:
+            yield _run_batch(task)
+
+
+def main(ctlfiles, fromfile=False, ncores=1, batch_time=3600., max_memory=None,
+         redo=False, dryrun=False, command=None):
+    if fromfile:
+        ctlfiles = [line.rstrip() for ctllist in ctlfiles
+                    for line in open(ctllist) if line.strip()
+                    and not line.startswith('#')]
+    command = ['bash', RUN_CODEML, '-q'] if command is None else shlex.split(command)
+
+    jobs = [CodemlJob(ctlfile) for ctlfile in ctlfiles]
+    seconds_per_cost = fit_seconds_per_cost(jobs)
+    todo = [job for job in jobs if redo or job.seconds is None]
+    logger.info('%d jobs to run, %d already complete. Predicted time: '
+                '%g s per nseq² x length.', len(todo), len(jobs) - len(todo),
+                seconds_per_cost)
+
+    predicted = [job.cost * seconds_per_cost for job in todo]
+    batches, loads = pack_batches(predicted, batch_time)
+    ncores = max_workers([job.memory for job in todo], ncores,
+                         None if max_memory is None else memory_bytes(max_memory))
+    logger.info('%d batches (predicted total %.0f s) on %d workers.',
+                len(batches), sum(loads), ncores)
+
+    print('\t'.join(REPORT_COLUMNS))
+    for job in jobs:
+        if not redo and job.seconds is not None:
+            print('%s\t\t%d\t%d\t%d\t\tcomplete\t%d' % (job.ctlfile, job.nseq,
+                  job.length, job.memory, job.seconds))
+
+    batch_of = {}
+    for b, batch in enumerate(batches):
+        for i in batch:
+            batch_of[todo[i].ctlfile] = (b, todo[i], predicted[i])
+
+    if dryrun:
+        for ctlfile, (b, job, pred) in batch_of.items():
+            print('%s\t%d\t%d\t%d\t%d\t%.0f\ttodo\t' % (ctlfile, b, job.nseq,
+                  job.length, job.memory, pred))
+        return
+
+    start = perf_counter()
+    done_jobs, done_load = 0, 0.
+    total_load = sum(loads) or 1.
+    failed = 0
+    ctlbatches = [[todo[i].ctlfile for i in batch] for batch in batches]
+    for done_batches, results in enumerate(run_batches(ctlbatches, command, ncores), start=1):
+        for ctlfile, status, seconds in results:
+            b, job, pred = batch_of[ctlfile]
+            done_jobs += 1
+            done_load += pred
+            failed += (status == 'failed')
+            print('%s\t%d\t%d\t%d\t%d\t%.0f\t%s\t%.1f' % (ctlfile, b, job.nseq,
+                  job.length, job.memory, pred, status, seconds), flush=True)
+        elapsed = perf_counter() - start
+        logger.info('[%d/%d batches, %d/%d jobs, %d failed] %.0f s elapsed, '
+                    '~%.0f s left', done_batches, len(batches), done_jobs,
+                    len(todo), failed, elapsed,
+                    elapsed * (total_load - done_load) / max(done_load, 1e-9))
+    return failed
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+    parser = ap.ArgumentParser(description=__doc__,
+                               formatter_class=ap.RawDescriptionHelpFormatter)
+    parser.add_argument('ctlfiles', nargs='+')
+    parser.add_argument('-f', '--fromfile', action='store_true',
+                        help='read the list of control files from the given files')
+    parser.add_argument('-j', '--ncores', type=int, default=1,
+                        help='number of workers [%(default)s]')
+    parser.add_argument('-t', '--batch-time', type=float, default=3600.,
+                        help='maximum predicted seconds per batch [%(default)s]')
+    parser.add_argument('-m', '--max-memory',
+                        help='total memory for the workers (e.g. 16G)')
+    parser.add_argument('-r', '--redo', action='store_true',
+                        help='also run the jobs with a complete .mlc')
+    parser.add_argument('-n', '--dryrun', action='store_true',
+                        help='only output the batches')
+    parser.add_argument('-c', '--command',
+                        help='command run with the .ctl as last argument '
+                             '[bash run_codeml_separatedir.sh -q]')
+
+    args = parser.parse_args()
+    sys.exit(1 if main(**vars(args)) else 0)
@@ -11,10 +11,15 @@ import ete3
 
 
 def iter_splitgenes_ancgenes(filename):
-    """Example file: ~/ws2/DUPLI_data85/split_genes_info-Rodentia-ancgenes.tsv"""
+    """Example file: ~/ws2/DUPLI_data85/split_genes_info-Rodentia-ancgenes.tsv
+
+    Columns: ancestral gene, descendant genes (space-separated), then the
+    descendant proteins, or the `.mlc` file (as output by
+    `find_non_overlapping_codeml_results.py --bulk`). Only the first two are
+    used."""
     with open(filename) as inf:
         for line in inf:
-            ancgene, desc_genes, desc_prot = line.rstrip().split('\t')
+            ancgene, desc_genes, _ = line.rstrip().split('\t')
             yield ancgene, desc_genes.split()
 
 
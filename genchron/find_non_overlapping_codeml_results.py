@@ -4,10 +4,17 @@
 """
 USAGE:
     ./find_non_overlapping_codeml_results.py <<<"mlcfile [mlcfile...]"
+    ./find_non_overlapping_codeml_results.py --bulk -j 8 mlclist.txt > split_genes.tsv
 
 Split genes can be detected in alignments when two or more gene from the same species in the same alignment do not overlap at all.
 
 It can be detected in the `.mlc` file from codeml in the Nei-Gojobori matrix, when the distance between two sequences is -1.0000.
+
+With `--bulk`, output one row per split gene: the ancestral gene (most recent
+common ancestor of the pieces, in the subtree `.nwk` of the `.mlc`), the
+pieces (space-separated) and the `.mlc` file, as read by
+`del_splitgenes_in_subtrees`/`del_splitgenes_in_al` (the third column, the
+`.mlc` file, replaces the protein names of the older tables and is not used).
 """
 
 import sys
@@ -15,7 +22,17 @@ import os
 import fileinput
 import re
 import os.path as op
+import mmap
+import multiprocessing as mp
+import argparse as ap
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
 from pamliped.codemlparser2 import parse_mlc
+from genomicustools.identify import convert_gene2species, ENSEMBL_VERSION
+from objectools import lazy_import
+ete3 = lazy_import('ete3')
 
 
 # space preceded by closing parenthesis
@@ -51,16 +68,189 @@ def list_nonoverlapping_NG(mlc):
     return nonoverlapping
 
 
+NG_HEADER = b'Nei & Gojobori 1986. dN/dS (dN, dS)'
+
+
+def read_NG_block(mlcfile):
+    """Return the rows of the Nei-Gojobori matrix (bytes), found without
+    reading the rest of the file."""
+    with open(mlcfile, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = mm.find(NG_HEADER)
+        if start < 0:
+            raise ValueError('No Nei & Gojobori matrix in %s' % mlcfile)
+        # The description ends with empty lines, and the matrix with one.
+        start = mm.find(b'\n\n', start)
+        while mm[start:start+1] == b'\n':
+            start += 1
+        end = mm.find(b'\n\n', start)
+        return mm[start:] if end < 0 else mm[start:end]
+
+
+def parse_NG_block(block):
+    """Return the sequence names, and the symmetric matrix of
+    (dN/dS, dN, dS), shape (n, n, 3), NaN on the diagonal."""
+    names, fields = [], []
+    for line in block.decode().splitlines():
+        name, _, values = line.strip().partition(' ')
+        names.append(name)
+        fields.append(values)
+    values = np.array(' '.join(fields).replace('(', ' ').replace(')', ' ').split(),
+                      dtype=float)
+    n = len(names)
+    if values.size != 3 * n*(n-1) // 2:
+        raise ValueError('Bad parsing of NG matrix: %d values for %d sequences'
+                         % (values.size, n))
+    matrix = np.full((n, n, 3), np.NaN)
+    rows, cols = np.tril_indices(n, -1)
+    matrix[rows, cols] = matrix[cols, rows] = values.reshape(-1, 3)
+    return names, matrix
+
+
+def nonoverlapping_mask(matrix):
+    """Pairs of sequences without any common position (all values = -1)"""
+    return (matrix == -1).all(axis=-1)
+
+
+def same_species_mask(names, get_species):
+    _, codes = np.unique([get_species(name) for name in names], return_inverse=True)
+    return codes[:, None] == codes[None, :]
+
+
+def group_pairs(pairs, n):
+    """Connected components (with more than one sequence) of the pairs"""
+    component = list(range(n))
+
+    def find(i):
+        while component[i] != i:
+            component[i] = component[component[i]]
+            i = component[i]
+        return i
+
+    for i, j in pairs:
+        component[find(i)] = find(j)
+    groups = {}
+    for i in sorted(set(i for pair in pairs for i in pair)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+MLC_SUFFIX = re.compile(r'_[^_/]*\.mlc$')
+
+
+def mlc2nwk(mlcfile):
+    """Subtree of the codeml run: '<subtree>_<model>.mlc' -> '<subtree>.nwk'"""
+    if MLC_SUFFIX.search(mlcfile):
+        return MLC_SUFFIX.sub('.nwk', mlcfile)
+
+
+def find_split_genes(mlcfile, ensembl_version=ENSEMBL_VERSION, get_species=None):
+    """Return the groups of same-species non-overlapping sequences, as
+    (ancestral gene, pieces). The ancestral gene is None if the subtree is
+    not found, or if its descendants are not only the pieces."""
+    if get_species is None:
+        def get_species(name):
+            return convert_gene2species(name, ensembl_version)
+    names, matrix = parse_NG_block(read_NG_block(mlcfile))
+    mask = nonoverlapping_mask(matrix) & same_species_mask(names, get_species)
+    pairs = np.argwhere(np.tril(mask, -1)).tolist()
+    if not pairs:
+        return []
+    groups = [[names[i] for i in group] for group in group_pairs(pairs, len(names))]
+
+    nwkfile = mlc2nwk(mlcfile)
+    if nwkfile is None or not op.exists(nwkfile):
+        logger.warning('No subtree for %s: ancestral genes unknown.', mlcfile)
+        return [(None, pieces) for pieces in groups]
+    tree = ete3.Tree(nwkfile, format=1)
+    split_genes = []
+    for pieces in groups:
+        ancestor = tree.get_common_ancestor(pieces) if len(tree) > 1 else tree
+        if set(ancestor.get_leaf_names()) != set(pieces):
+            logger.warning('%s: %s do not form a clade.', mlcfile, ' '.join(pieces))
+            split_genes.append((None, pieces))
+        else:
+            split_genes.append((ancestor.name, pieces))
+    return split_genes
+
+
+def _find_split_genes_task(args):
+    mlcfile, ensembl_version = args
+    try:
+        return mlcfile, find_split_genes(mlcfile, ensembl_version)
+    except BaseException as err:
+        if isinstance(err, KeyboardInterrupt):
+            raise
+        logger.error('At file %s: %s: %s', mlcfile, type(err).__name__, err)
+        return mlcfile, None
+
+
+def bulk_split_genes(mlcfiles, ensembl_version=ENSEMBL_VERSION, ncores=1):
+    """Yield (mlcfile, split genes) in the order of the input files (split
+    genes are None if the file could not be processed)."""
+    tasks = ((mlcfile, ensembl_version) for mlcfile in mlcfiles)
+    if ncores > 1:
+        with mp.Pool(ncores) as pool:
+            yield from pool.imap(_find_split_genes_task, tasks, chunksize=16)
+    else:
+        yield from map(_find_split_genes_task, tasks)
+
+
+def quickcheck_NG_file(mlcfile):
+    """Same as `quickcheck_NG(parse_mlc(mlcfile))`, reading only the matrix."""
+    names, matrix = parse_NG_block(read_NG_block(mlcfile))
+    pairs = np.argwhere(np.tril(nonoverlapping_mask(matrix), -1))
+    if pairs.size:
+        i, j = pairs[0]
+        return names[i], names[j]
+
+
 def main(mlcfiles):
     for mlcfile in mlcfiles:
-        r = quickcheck_NG(parse_mlc(mlcfile))
+        r = quickcheck_NG_file(mlcfile)
         if r:
             print('%s: %s - %s' % (op.basename(mlcfile), *r))
 
 
+def main_bulk(mlcfiles, ensembl_version=ENSEMBL_VERSION, ncores=1):
+    """Output the split genes table, see `find_split_genes`."""
+    failed = 0
+    unknown = 0
+    for mlcfile, split_genes in bulk_split_genes(mlcfiles, ensembl_version, ncores):
+        if split_genes is None:
+            failed += 1
+            continue
+        for ancgene, pieces in split_genes:
+            if ancgene is None:
+                unknown += 1
+                continue
+            print('%s\t%s\t%s' % (ancgene, ' '.join(pieces), mlcfile))
+    if failed or unknown:
+        logger.warning('%d files failed, %d split genes without ancestral gene.',
+                       failed, unknown)
+
+
 if __name__ == '__main__':
-    if len(sys.argv) == 1 and os.isatty(0):
+    logging.basicConfig(format='%(levelname)s:%(message)s')
+    parser = ap.ArgumentParser(description=__doc__,
+                               formatter_class=ap.RawDescriptionHelpFormatter)
+    parser.add_argument('mlclists', nargs='*',
+                        help='files listing the .mlc files (default: stdin)')
+    parser.add_argument('-b', '--bulk', action='store_true',
+                        help='output the table of split genes')
+    parser.add_argument('-e', '--ensembl-version', type=int,
+                        default=ENSEMBL_VERSION,
+                        help='to get the species of the gene names (--bulk) '
+                             '[%(default)s]')
+    parser.add_argument('-j', '--ncores', type=int, default=1,
+                        help='number of processes (--bulk) [%(default)s]')
+    args = parser.parse_args()
+    if not args.mlclists and os.isatty(0):
         print(__doc__, file=sys.stderr)
         sys.exit()
-    main((line.rstrip() for line in fileinput.input() if not line.startswith('#')))
-
+    mlcfiles = (line.rstrip() for line in fileinput.input(args.mlclists)
+                if line.strip() and not line.startswith('#'))
+    if args.bulk:
+        main_bulk(mlcfiles, args.ensembl_version, args.ncores)
+    else:
+        main(mlcfiles)
@@ -3,32 +3,106 @@
 #
 """Output all trees with one foreground branch marked ('#1') for codeml branch models.
 If there are internal node names, they are used as suffix of the output file.
+
+With `--multi`, all marked trees are written into a single file (one newick
+per line), along with a tab-separated index (label, byte offset, length).
+One tree is read back with `read_marked`. codeml (and `codeml_packer.py`)
+needs one tree file per control file: use the default output for codeml runs.
 """
 
 import os.path
+import re
 import ete3
 import argparse
 
 
-def mark_each(nwfile, format=1, outbase=None):
-    """iterate each branch and save a new tree with the marked branch"""
-    inbase, ext = os.path.splitext(nwfile)
-    if not outbase: outbase = inbase
+# Placeholder appended to the node names when writing the template.
+MARKER = re.compile(r'\0(\d+)\0')
 
-    tree = ete3.Tree(nwfile, format=format)
+
+def marked_template(tree, format=1):
+    """Serialise the tree once. Return the newick string and, for each
+    descendant (in `tree.iter_descendants()` order), the (label, offset, mark)
+    such that inserting `mark` at `offset` marks its branch."""
+    nodes = list(tree.iter_descendants())
+    oldnames = [node.name for node in nodes]
+    for i, node in enumerate(nodes):
+        node.name = '%s\0%d\0' % (node.name, i)
+    try:
+        pieces = MARKER.split(tree.write(format=format))
+    finally:
+        for node, oldname in zip(nodes, oldnames):
+            node.name = oldname
+
+    newick = ''.join(pieces[0::2])
+    offsets = [0] * len(nodes)
+    offset = 0
+    for text, i in zip(pieces[0::2], pieces[1::2]):
+        offset += len(text)
+        offsets[int(i)] = offset
+
+    sites = []
     node_nb = 0
-    for node in tree.iter_descendants():
-        oldname = node.name
+    for oldname, offset in zip(oldnames, offsets):
         if oldname:
-            node.name += ' #1'
-            outfile = outbase + '-' + oldname + ext
+            sites.append((oldname, offset, ' #1'))
         else:
-            node.name = '#1'
             node_nb += 1
-            outfile = outbase + '-%02d' % node_nb + ext
+            sites.append(('%02d' % node_nb, offset, '#1'))
+    return newick, sites
+
+
+def iter_marked(tree, format=1):
+    """Yield (label, newick) with each branch marked in turn."""
+    newick, sites = marked_template(tree, format)
+    for label, offset, mark in sites:
+        yield label, newick[:offset] + mark + newick[offset:]
+
+
+def write_multi(marked, outfile, indexfile=None):
+    """Write the marked trees one per line, and the index of their lines:
+    label, byte offset, length (without the newline)."""
+    if indexfile is None:
+        indexfile = outfile + '.index'
+    offset = 0
+    with open(outfile, 'wb') as out, open(indexfile, 'w') as index:
+        for label, newick in marked:
+            line = newick.encode()
+            out.write(line + b'\n')
+            index.write('%s\t%d\t%d\n' % (label, offset, len(line)))
+            offset += len(line) + 1
+
 
-        tree.write(outfile=outfile, format=1)
-        node.name = oldname
+def read_multi_index(indexfile):
+    """Return [(label, offset, length)] from the index of `write_multi`."""
+    with open(indexfile) as f:
+        return [(label, int(offset), int(length))
+                for label, offset, length in
+                (line.rstrip('\n').split('\t') for line in f if line.strip())]
+
+
+def read_marked(multifile, offset, length):
+    """Read one marked tree of a `write_multi` file."""
+    with open(multifile, 'rb') as f:
+        f.seek(offset)
+        return f.read(length).decode()
+
+
+def mark_each(nwfile, format=1, outbase=None, multi=False):
+    """iterate each branch and save a new tree with the marked branch"""
+    inbase, ext = os.path.splitext(nwfile)
+    if not outbase: outbase = inbase
+
+    tree = ete3.Tree(nwfile, format=format)
+    # The tree is written with format 1, like before.
+    marked = iter_marked(tree, format=1)
+    if multi:
+        write_multi(marked, outbase + '-marked' + ext)
+        return
+
+    for label, newick in marked:
+        with open(outbase + '-' + label + ext, 'w') as out:
+            out.write(newick)
 
 
 if __name__ == '__main__':
@@ -37,7 +111,9 @@ if __name__ == '__main__':
     parser.add_argument('-f', '--format', default=1, type=int,
                         help='newick subformat [%(default)s]')
     parser.add_argument('-o', '--outbase')
-    
+    parser.add_argument('-m', '--multi', action='store_true',
+                        help='write all trees into <outbase>-marked<ext> '
+                             '(and its index <outbase>-marked<ext>.index)')
+
     args = parser.parse_args()
     mark_each(**vars(args))
-
@@ -20,6 +20,8 @@ except ImportError:
     import argparse
 
 import logging
+logger = logging.getLogger(__name__)
+
 import multiprocessing as mp
 try:
     from multiprocessing_logging import install_mp_handler
@@ -30,16 +32,15 @@ except ImportError:
 
 from copy import copy
 
-import ete3
-import LibsDyogen.myPhylTree as PhylTree
+from objectools import lazy_import
+ete3 = lazy_import('ete3')
+PhylTree = lazy_import('LibsDyogen.myPhylTree')
 
 from dendro.parsers import read_multinewick, iter_from_ete3
 from genomicustools.identify import ultimate_seq2sp
 from dendro.bates import iter_distleaves
 from dendro.trimmer import thin_ete3 as thin
 
-logger = logging.getLogger(__name__)
-
 #stdoutlog = logging.getLogger(__name__ + '.stdout')
 #stdouth = logging.StreamHandler(stdout)
 #stdouth.setFormatter(logging.Formatter("%(message)s"))
@@ -10,12 +10,12 @@ import argparse
 import os.path as op
 from glob import glob
 import numpy as np
-from scipy.stats import skew
 
-from Bio import AlignIO
-import ete3
-
-import LibsDyogen.myPhylTree as PhylTree
+from objectools import lazy_import
+st = lazy_import('scipy.stats')
+AlignIO = lazy_import('Bio.AlignIO')
+ete3 = lazy_import('ete3')
+PhylTree = lazy_import('LibsDyogen.myPhylTree')
 
 from UItools.autoCLI import make_subparser_func
 from genomicustools.identify import SP2GENEID, \
@@ -25,9 +25,9 @@ from dendro.reconciled import get_taxon, \
                               infer_gene_event_taxa
 from dendro.bates import iter_distleaves
 from dendro.trimmer import fuse_single_child_nodes_ete3
-from seqtools import ungap, \
-                     algrep, \
-                     make_al_compo
+from seqtools.ungap import ungap
+from seqtools.seqname_grep import algrep
+from seqtools.compo_freq import make_al_compo
 from seqtools.plot_al_conservation import reorder_al, get_position_stats, parsimony_score
 from pamliped.codemlparser2 import parse_mlc
 from genchron.find_non_overlapping_codeml_results import list_nonoverlapping_NG
@@ -793,19 +793,19 @@ def get_codeml_stats(genetreelistfile, ancestor, phyltreefile, rootdir='.',
                          mean(br_lengths),    # brlen_mean
                          std(br_lengths),     # brlen_std
                          median(br_lengths),  # brlen_med
-                         skew(br_lengths),       # brlen_skew
+                         st.skew(br_lengths),       # brlen_skew
                          mean(br_omegas),
                          std(br_omegas),
                          median(br_omegas),
-                         skew(br_omegas),
+                         st.skew(br_omegas),
                          mean(dS_lengths),
                          std(dS_lengths),
                          median(dS_lengths),
-                         skew(dS_lengths),
+                         st.skew(dS_lengths),
                          mean(dN_lengths),
                          std(dN_lengths),
                          median(dN_lengths),
-                         skew(dN_lengths),
+                         st.skew(dN_lengths),
                          \
                          mean(t_root_to_tips),
                          std(t_root_to_tips),
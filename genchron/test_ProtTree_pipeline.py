@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import pytest
+from io import StringIO
+from LibsDyogen import myProteinTree
+from genchron.ProtTree_pipeline import parse_operations, edit_tree
+
+
+def make_tree(root=1):
+    """root -> (spe, dup10 -> (a, b)), (c, too long)"""
+    info = {root:   {'Duplication': 0, 'taxon_name': 'Ab'},
+            root+1: {'Duplication': 0, 'taxon_name': 'A'},
+            root+2: {'Duplication': 10, 'taxon_name': 'A'},
+            root+3: {'Duplication': 0, 'taxon_name': 'A', 'gene_name': 'a1'},
+            root+4: {'Duplication': 0, 'taxon_name': 'A', 'gene_name': 'a2'},
+            root+5: {'Duplication': 0, 'taxon_name': 'A', 'gene_name': 'a3'},
+            root+6: {'Duplication': 0, 'taxon_name': 'B', 'gene_name': 'b1'}}
+    data = {root:   [(root+1, 0.5), (root+6, 20000.)],
+            root+1: [(root+2, 0.1), (root+5, 0.2)],
+            root+2: [(root+3, 0.1), (root+4, 0.1)]}
+    return myProteinTree.ProteinTree(data, info, root)
+
+
+def test_edit_tree():
+    operations = parse_operations(['delsplit', 'toolong=10000'])
+    trees, counts = edit_tree(make_tree(), operations)
+    assert [tree.root for tree in trees] == [1, 7]
+    assert trees[0].data == {1: [(2, 0.5)], 2: [(6, 0.2)]}
+    assert set(trees[0].info) == {1, 2, 6}
+    assert counts['delsplit'] == {'splits': 1, 'split descendants': 3}
+    assert counts['toolong']['detached'] == 1
+
+    with pytest.raises(ValueError):
+        parse_operations(['prune'])
+    with pytest.raises(ValueError):
+        parse_operations(['unknown'])
+
+
+def test_edit_tree_fusetips():
+    """Heterocephalus glaber node -> (male, female), with the female first"""
+    info = {1: {'Duplication': 0, 'taxon_name': 'Rodentia'},
+            2: {'Duplication': 0, 'taxon_name': 'Heterocephalus glaber'},
+            3: {'Duplication': 0, 'taxon_name': 'Heterocephalus glaber female',
+                'gene_name': 'ENSHGLG00100000001'},
+            4: {'Duplication': 0, 'taxon_name': 'Heterocephalus glaber male',
+                'gene_name': 'ENSHGLG00000000001'},
+            5: {'Duplication': 0, 'taxon_name': 'Heterocephalus glaber'},
+            6: {'Duplication': 0, 'taxon_name': 'Heterocephalus glaber female',
+                'gene_name': 'ENSHGLG00100000002'},
+            7: {'Duplication': 0, 'taxon_name': 'Mus musculus',
+                'gene_name': 'ENSMUSG00000000001'}}
+    data = {1: [(2, 0.1), (5, 0.2), (7, 0.3)],
+            2: [(3, 0.), (4, 0.)],
+            5: [(6, 0.)]}
+    tree = myProteinTree.ProteinTree(data, info, 1)
+    trees, counts = edit_tree(tree, parse_operations(['fusetips']))
+    assert trees[0].data == {1: [(2, 0.1), (5, 0.2), (7, 0.3)]}
+    # The first sequence in the priority order is kept.
+    assert trees[0].info[2]['gene_name'] == 'ENSHGLG00000000001'
+    assert trees[0].info[5]['gene_name'] == 'ENSHGLG00100000002'
+    assert set(trees[0].info) == {1, 2, 5, 7}
+    assert counts['fusetips'] == {'fused': 2, '2ch': 1, '1ch': 1}
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+from genchron.codeml_packer import mlc_time_used, pack_batches, max_workers, \
+                                   CodemlJob, fit_seconds_per_cost, main
+
+
+FAKE_CODEML = ("""sh -c 'printf "lnL = -1\\nTime used:  1:05\\n" > "${1%.ctl}.mlc"' sh""")
+
+
+def make_job(tmp_path, name, nseq, length, mlc=None):
+    (tmp_path / (name + '.phy')).write_text('  %d  %d\n' % (nseq, length))
+    ctl = tmp_path / (name + '.ctl')
+    ctl.write_text('seqfile  = %s.phy\ntreefile = %s.nwk\noutfile  = %s.mlc\n'
+                   '\nnoisy = 0\n' % (name, name, name))
+    if mlc is not None:
+        (tmp_path / (name + '.mlc')).write_text(mlc)
+    return str(ctl)
+
+
+def test_mlc_time_used(tmp_path):
+    complete = tmp_path / 'complete.mlc'
+    complete.write_text('CODONML\nlnL = -10.5\n\nTime used:  1:02:03\n')
+    incomplete = tmp_path / 'incomplete.mlc'
+    incomplete.write_text('CODONML\nlnL = -10.5\n')
+    assert mlc_time_used(str(complete)) == 3723
+    assert mlc_time_used(str(incomplete)) is None
+    assert mlc_time_used(str(tmp_path / 'missing.mlc')) is None
+
+
+def test_pack_batches():
+    batches, loads = pack_batches([5, 1, 8, 3, 12, 2], 10)
+    assert batches == [[4], [2, 5], [0, 3, 1]]
+    assert loads == [12, 10, 9]
+    assert max_workers([10, 8, 5, 5], 4, 20) == 2
+    assert max_workers([10, 8, 5, 5], 4) == 4
+
+
+def test_main(tmp_path, capsys):
+    ctlfiles = [make_job(tmp_path, 'done', 10, 300, 'lnL\nTime used:  0:30\n'),
+                make_job(tmp_path, 'todo1', 20, 600),
+                make_job(tmp_path, 'todo2', 60, 900, 'interrupted run\n')]
+    jobs = [CodemlJob(ctl) for ctl in ctlfiles]
+    assert [job.seconds for job in jobs] == [30, None, None]
+    assert fit_seconds_per_cost(jobs) == 30 / (10**2 * 300)
+
+    failed = main(ctlfiles, ncores=2, batch_time=60, command=FAKE_CODEML)
+    assert not failed
+    rows = [line.split('\t') for line in capsys.readouterr().out.splitlines()]
+    status = {row[0]: row[6] for row in rows[1:]}
+    assert status == {ctlfiles[0]: 'complete', ctlfiles[1]: 'done',
+                      ctlfiles[2]: 'done'}
+    assert mlc_time_used(str(tmp_path / 'todo2.mlc')) == 65
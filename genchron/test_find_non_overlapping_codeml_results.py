@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import numpy as np
+from genchron.find_non_overlapping_codeml_results import read_NG_block, \
+        parse_NG_block, find_split_genes, quickcheck_NG_file, main_bulk
+from genchron.del_splitgenes_in_subtrees import iter_splitgenes_ancgenes
+
+
+NA = '-1.0000 (-1.0000 -1.0000)'
+
+MLC = """CODONML (in paml version 4.9e, March 2018)  seqfile.phy
+Model: One dN/dS ratio,
+Codon frequency model: F3x4
+ns =   4  ls = 300
+
+Codon usage in sequences
+--------------------------------------------------------------
+
+Nei & Gojobori 1986. dN/dS (dN, dS)
+(Pairwise deletion)
+(Note: This matrix is not used in later ML. analysis.
+Use runmode = -2 for ML pairwise comparison.)
+
+ENSMUSG00000000001
+ENSMUSG00000000002  %(NA)s
+ENSG00000000003      0.2500 (0.0100 0.0400) 0.5000 (0.0200 0.0400)
+ENSG00000000004     %(NA)s 0.3000 (0.0300 0.1000) 0.1000 (0.0010 0.0100)
+
+
+TREE #  1:  (((1, 2), 3), 4);   MP score: 120
+lnL(ntime:  5  np:  7):  -1000.000000      +0.000000
+
+Time used:  0:03
+""" % {'NA': NA}
+
+SUBTREE = '(((ENSMUSG00000000001,ENSMUSG00000000002)MusENSGT001.a,ENSG00000000003)EuarchontogliresENSGT001,ENSG00000000004)EuarchontogliresENSGT001.root;'
+
+
+def test_parse_NG_block(tmp_path):
+    mlcfile = tmp_path / 'EuarchontogliresENSGT001_m1w04.mlc'
+    mlcfile.write_text(MLC)
+    names, matrix = parse_NG_block(read_NG_block(str(mlcfile)))
+    assert names == ['ENSMUSG00000000001', 'ENSMUSG00000000002',
+                     'ENSG00000000003', 'ENSG00000000004']
+    assert matrix.shape == (4, 4, 3)
+    assert np.isnan(matrix[np.diag_indices(4)]).all()
+    np.testing.assert_array_equal(matrix[2, 1], [0.5, 0.02, 0.04])
+    np.testing.assert_array_equal(matrix[1, 2], [0.5, 0.02, 0.04])
+    np.testing.assert_array_equal(matrix[3, 0], [-1, -1, -1])
+    assert quickcheck_NG_file(str(mlcfile)) == ('ENSMUSG00000000002',
+                                                'ENSMUSG00000000001')
+
+
+def test_find_split_genes(tmp_path, capsys):
+    mlcfile = tmp_path / 'EuarchontogliresENSGT001_m1w04.mlc'
+    mlcfile.write_text(MLC)
+    # Without the subtree, the ancestral gene is unknown.
+    # ENSG00000000004 does not overlap ENSMUSG00000000001, but they are from
+    # different species.
+    assert find_split_genes(str(mlcfile), 93) == [
+            (None, ['ENSMUSG00000000001', 'ENSMUSG00000000002'])]
+
+    (tmp_path / 'EuarchontogliresENSGT001.nwk').write_text(SUBTREE)
+    assert find_split_genes(str(mlcfile), 93) == [
+            ('MusENSGT001.a', ['ENSMUSG00000000001', 'ENSMUSG00000000002'])]
+
+    main_bulk([str(mlcfile)] * 3, 93, ncores=2)
+    rows = capsys.readouterr().out.splitlines()
+    assert rows == ['MusENSGT001.a\tENSMUSG00000000001 ENSMUSG00000000002\t%s'
+                    % mlcfile] * 3
+
+    # Read back by the split genes deletion.
+    tablefile = tmp_path / 'split_genes.tsv'
+    tablefile.write_text('\n'.join(rows) + '\n')
+    assert list(iter_splitgenes_ancgenes(str(tablefile))) == [
+            ('MusENSGT001.a', ['ENSMUSG00000000001', 'ENSMUSG00000000002'])] * 3
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import ete3
+from genchron.mark_all_branches import iter_marked, mark_each, \
+                                       read_multi_index, read_marked
+
+
+NEWICK = '((a:1,b:2)ab:0.5,(c:1,d:1):2);'
+
+
+def test_iter_marked():
+    tree = ete3.Tree(NEWICK, format=1)
+    marked = dict(iter_marked(tree))
+    assert list(marked) == ['ab', '01', 'a', 'b', 'c', 'd']
+    assert marked['ab'] == '((a:1,b:2)ab #1:0.5,(c:1,d:1):2);'
+    assert marked['01'] == '((a:1,b:2)ab:0.5,(c:1,d:1)#1:2);'
+    assert marked['d'] == '((a:1,b:2)ab:0.5,(c:1,d #1:1):2);'
+    # The tree is left unchanged
+    assert tree.write(format=1) == NEWICK
+
+
+def test_mark_each_multi(tmp_path):
+    nwfile = tmp_path / 'tree.nwk'
+    nwfile.write_text(NEWICK)
+    mark_each(str(nwfile))
+    mark_each(str(nwfile), multi=True)
+    multifile = str(tmp_path / 'tree-marked.nwk')
+    index = read_multi_index(multifile + '.index')
+    assert [label for label, _, _ in index] == ['ab', '01', 'a', 'b', 'c', 'd']
+    for label, offset, length in index:
+        expected = (tmp_path / ('tree-%s.nwk' % label)).read_text()
+        assert read_marked(multifile, offset, length) == expected
@@ -15,8 +15,13 @@ Draw a gene tree inside a species tree.
 #                   reconciled with species tree.
 
 import sys
+import os
 import os.path as op
 import re
+import shutil
+import subprocess
+from math import ceil
+import multiprocessing as mp
 try:
     import argparse_custom as argparse # Less verbose help message
 except ImportError:
@@ -24,20 +29,19 @@ except ImportError:
 from itertools import zip_longest
 
 import numpy as np
-import matplotlib as mpl
-#mpl.use('Agg')
-if __name__=='__main__': mpl.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib import patches
-from matplotlib import lines
-from matplotlib import patheffects
+from objectools import lazy_import
+# Plotting and tree modules are imported at first use (fast `--help`).
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+patches = lazy_import('matplotlib.patches')
+lines = lazy_import('matplotlib.lines')
 #from matplotlib.transforms import Affine2D
-from matplotlib.backends.backend_pdf import PdfPages, FigureCanvas
-from matplotlib.path import Path
-MOVETO, CURVE3, LINETO = Path.MOVETO, Path.CURVE3, Path.LINETO
-import ete3
+backend_pdf = lazy_import('matplotlib.backends.backend_pdf')
+mpath = lazy_import('matplotlib.path')
+MOVETO, LINETO, CURVE3 = 1, 2, 3  # matplotlib.path.Path codes
+ete3 = lazy_import('ete3')
 
-import LibsDyogen.myPhylTree as PhylTree
+PhylTree = lazy_import('LibsDyogen.myPhylTree')
 #import LibsDyogen.myProteinTree as ProteinTree
 
 from dendro.bates import rev_dfw_descendants
@@ -62,29 +66,39 @@ basefontsize='medium'  #'x-small'
 
 ### Matplotlib graphical parameters ###
 grey10 = '#1a1a1a'
-mpl.rcParams['figure.figsize'] = (8.27, 11.7) # a4
-mpl.rcParams['lines.linewidth'] = 0.8
-mpl.rcParams['lines.markersize'] = 3
-mpl.rcParams['text.color'] = grey10
-mpl.rcParams['axes.edgecolor'] = grey10
-mpl.rcParams['axes.labelcolor'] = grey10
-mpl.rcParams['axes.spines.top'] = False
-mpl.rcParams['axes.spines.right'] = False
-mpl.rcParams['xtick.color'] = grey10
-mpl.rcParams['ytick.color'] = grey10
-mpl.rcParams['grid.color'] = grey10
-mpl.rcParams['patch.edgecolor'] = grey10
-mpl.rcParams['patch.linewidth'] = 0.8
-mpl.rcParams['boxplot.flierprops.markeredgecolor'] = grey10
-mpl.rcParams['boxplot.capprops.color'] = grey10
-mpl.rcParams['legend.facecolor'] = '#777777'
-mpl.rcParams['legend.framealpha'] = 0.2
-#mpl.rcParams['legend.edgecolor'] = grey10
-mpl.rcParams['savefig.facecolor'] = 'none'
-mpl.rcParams['savefig.frameon'] = False  #background frame transparent
-#mpl.rcParams['savefig.transparent'] = True # all background transparent
-                                            # (including ggplot2 style)
-#mpl.style.use('ggplot')
+_mpl_params_set = False
+
+def set_mpl_params():
+    """Apply the figure style (once)."""
+    global _mpl_params_set
+    if _mpl_params_set:
+        return
+    mpl.rcParams['figure.figsize'] = (8.27, 11.7) # a4
+    mpl.rcParams['lines.linewidth'] = 0.8
+    mpl.rcParams['lines.markersize'] = 3
+    mpl.rcParams['text.color'] = grey10
+    mpl.rcParams['axes.edgecolor'] = grey10
+    mpl.rcParams['axes.labelcolor'] = grey10
+    mpl.rcParams['axes.spines.top'] = False
+    mpl.rcParams['axes.spines.right'] = False
+    mpl.rcParams['xtick.color'] = grey10
+    mpl.rcParams['ytick.color'] = grey10
+    mpl.rcParams['grid.color'] = grey10
+    mpl.rcParams['patch.edgecolor'] = grey10
+    mpl.rcParams['patch.linewidth'] = 0.8
+    mpl.rcParams['boxplot.flierprops.markeredgecolor'] = grey10
+    mpl.rcParams['boxplot.capprops.color'] = grey10
+    mpl.rcParams['legend.facecolor'] = '#777777'
+    mpl.rcParams['legend.framealpha'] = 0.2
+    #mpl.rcParams['legend.edgecolor'] = grey10
+    mpl.rcParams['savefig.facecolor'] = 'none'
+    if 'savefig.frameon' in mpl.rcParams:  # removed in matplotlib 3.3
+        mpl.rcParams['savefig.frameon'] = False  #background frame transparent
+    #mpl.rcParams['savefig.transparent'] = True # all background transparent
+                                                # (including ggplot2 style)
+    #mpl.style.use('ggplot')
+    _mpl_params_set = True
+
 
 def get_common_name(phyltree, latin_name):
     """Get the common species name from the latin one"""
@@ -239,6 +253,150 @@ def iter_species_coords(phyltree, taxa, angle_style=0, ages=False):
 
 
 
+class ForkSifter(object):
+    """Count the crossings between gene lineages, and rotate the duplication
+    forks to reduce them.
+
+    A lineage goes from a speciation node to one of the next speciation or
+    leaf nodes ("slots"). As in `GenetreeDrawer.set_gene_coords`, the slots are
+    stacked in their species node in postorder: rotating a fork only permutes
+    the slots of its subtree, so only their ranks, and the crossings of the
+    lineages starting in the same species node, need to be updated.
+    """
+    def __init__(self, genetrees, node_taxa, node_events, species_coords):
+        self.nodes = []  # postorder
+        node_index = {}
+        node_first = []  # first descendant (postorder) of each node
+        slot_of = {}     # node index -> slot
+        slot_taxa = []
+        seg_lo, seg_hi = [], []  # slots of each subtree (positions in self.seq)
+        taxon_codes = {}
+        self.children = {}  # Forks that can be rotated.
+
+        for node in (n for genetree in genetrees
+                     for n in genetree.traverse('postorder')):
+            i = node_index[node] = len(self.nodes)
+            self.nodes.append(node)
+            children = [node_index[ch] for ch in node.children]
+            node_first.append(node_first[children[0]] if children else i)
+            seg_lo.append(seg_lo[children[0]] if children else len(slot_taxa))
+            if node_events[node] in ('spe', 'leaf'):
+                slot_of[i] = len(slot_taxa)
+                slot_taxa.append(taxon_codes.setdefault(node_taxa[node],
+                                                        len(taxon_codes)))
+            elif len(children) > 1:
+                self.children[i] = children
+            seg_hi.append(len(slot_taxa))
+
+        self.node_first = node_first
+        self.seg_lo = np.array(seg_lo)
+        self.seg_hi = np.array(seg_hi)
+        self.slot_taxon = np.array(slot_taxa, dtype=int)
+        self.seq = np.arange(len(slot_taxa))  # slots in current postorder
+        self.counts = np.bincount(self.slot_taxon, minlength=len(taxon_codes))
+        self.rank = np.empty(len(slot_taxa), dtype=int)
+        self._update_ranks(self.seq, np.zeros(len(taxon_codes), dtype=int))
+
+        taxa = sorted(taxon_codes, key=taxon_codes.get)
+        self.taxon_y = np.array([species_coords[t][1] for t in taxa], dtype=float)
+        self.taxon_width = np.array([species_coords[t][2] for t in taxa], dtype=float)
+
+        edges = []
+        for i, node in enumerate(self.nodes):
+            if node_events[node] == 'spe':
+                stack = list(node.children)
+                while stack:
+                    ch = stack.pop()
+                    if node_index[ch] in slot_of:
+                        edges.append((slot_of[i], slot_of[node_index[ch]]))
+                    else:
+                        stack.extend(ch.children)
+        self.edge_start, self.edge_end = np.array(edges, dtype=int).reshape(-1, 2).T
+        edge_group = self.slot_taxon[self.edge_start]
+        self.group_edges = {g: np.flatnonzero(edge_group == g)
+                            for g in np.unique(edge_group)}
+        self.group_crossings = {g: self.count_crossings(edges)
+                                for g, edges in self.group_edges.items()}
+        self.crossings = sum(self.group_crossings.values())
+
+    def _update_ranks(self, slots, base):
+        """Rank the slots within their taxon, in the order given, from `base`."""
+        taxa = self.slot_taxon[slots]
+        order = np.argsort(taxa, kind='stable')
+        sorted_taxa = taxa[order]
+        starts = np.flatnonzero(np.r_[True, sorted_taxa[1:] != sorted_taxa[:-1]])
+        sizes = np.diff(np.r_[starts, len(order)])
+        within = np.arange(len(order)) - np.repeat(starts, sizes)
+        self.rank[slots[order]] = base[sorted_taxa] + within
+
+    def slot_y(self, slots):
+        taxa = self.slot_taxon[slots]
+        return self.taxon_y[taxa] - self.taxon_width[taxa] * \
+                (self.rank[slots] + 1) / (self.counts[taxa] + 1)
+
+    def count_crossings(self, edges):
+        y_start = self.slot_y(self.edge_start[edges])
+        y_end = self.slot_y(self.edge_end[edges])
+        return int(((y_start[:, None] < y_start)
+                    & (y_end[:, None] > y_end)).sum())
+
+    def reorder(self, fork, new_children):
+        """Set the new order of children, and update the crossing count."""
+        lo = self.seg_lo[fork]
+        new_seq = []
+        pos = lo
+        for ch in new_children:
+            ch_lo, ch_hi = self.seg_lo[ch], self.seg_hi[ch]
+            new_seq.append(self.seq[ch_lo:ch_hi])
+            shift = pos - ch_lo
+            if shift:
+                subtree = np.arange(self.node_first[ch], ch + 1)
+                self.seg_lo[subtree] += shift
+                self.seg_hi[subtree] += shift
+            pos += ch_hi - ch_lo
+        self.children[fork] = list(new_children)
+        if pos == lo:
+            return
+        slots = np.concatenate(new_seq)
+        self.seq[lo:pos] = slots
+
+        # Same rank ranges per taxon in the subtree, only permuted.
+        base = np.full(len(self.counts), np.iinfo(int).max)
+        np.minimum.at(base, self.slot_taxon[slots], self.rank[slots])
+        self._update_ranks(slots, base)
+
+        touched = np.isin(self.edge_start, slots) | np.isin(self.edge_end, slots)
+        for g in np.unique(self.slot_taxon[self.edge_start[touched]]):
+            crossings = self.count_crossings(self.group_edges[g])
+            self.crossings += crossings - self.group_crossings[g]
+            self.group_crossings[g] = crossings
+
+    def sift(self, max_passes=3):
+        """Greedily move each child of each fork to its best position,
+        until no improvement."""
+        for _ in range(max_passes):
+            improved = False
+            for fork in self.children:
+                for ch in list(self.children[fork]):
+                    best, best_children = self.crossings, self.children[fork]
+                    others = [c for c in best_children if c != ch]
+                    for k in range(len(others) + 1):
+                        trial = others[:k] + [ch] + others[k:]
+                        if trial == self.children[fork]:
+                            continue
+                        self.reorder(fork, trial)
+                        if self.crossings < best:
+                            best, best_children = self.crossings, trial
+                            improved = True
+                    if self.children[fork] != best_children:
+                        self.reorder(fork, best_children)
+            if not improved:
+                break
+        for fork, children in self.children.items():
+            self.nodes[fork].children = [self.nodes[ch] for ch in children]
+        return self.crossings
+
+
 class GenetreeDrawer(object):
     """Draw a gene tree inside a species tree"""
 
@@ -247,7 +405,8 @@ class GenetreeDrawer(object):
     
     def __init__(self, phyltreefile=None, ensembl_version=None,
                  colorize_clades=None, commonname=False, latinname=False,
-                 angle_style=0, ages=False, internal=None, treebest=False, show_cov=False, debug=False):
+                 angle_style=0, ages=False, internal=None, treebest=False, show_cov=False,
+                 sift_forks=False, debug=False):
         """Options:
             - colorize_clades: grouping of species names to colorize
             - commonname: display the common english name of the species
@@ -257,6 +416,8 @@ class GenetreeDrawer(object):
                         D="Y"/"N" for duplication)
             - show_cov: add a grey gradient to distinguish species genomes with
                         good (>6X), medium (6X) or bad (2X) coverage.
+            - sift_forks: rotate duplication forks to minimize the number of
+                          crossing gene branches (see `ForkSifter`).
         """
         self.debug = debug
         if ensembl_version: self.ensembl_version = ensembl_version
@@ -266,8 +427,11 @@ class GenetreeDrawer(object):
         self.latinname = latinname
         self.angle_style = angle_style
         self.ages = ages
+        self.sift_forks = sift_forks
         self.drawn_count = 0
+        self.species_tree_count = 0
 
+        set_mpl_params()
         self.phyltree = PhylTree.PhylogeneticTree(self.phyltreefile.format(
                                                         self.ensembl_version))
         self.internal = set() if internal is None else internal
@@ -304,6 +468,11 @@ class GenetreeDrawer(object):
         self.taxa = set(self.phyltree.allNames)
         # Cleared and refilled if a genetree is given
         self.max_age = self.phyltree.ages[self.phyltree.root]
+        self.fig = None
+        # What the current figure background was drawn from (taxa, max_age)
+        self.species_tree_key = None
+        # (species_tree_key, subtree); the sentinel key never matches.
+        self._phylsubtree = (object(), None)
 
     def load_reconciled_genetree(self, filename, format=1, genetreename=None):
         """Load gene tree with all species nodes present.
@@ -416,6 +585,8 @@ class GenetreeDrawer(object):
         #rootwardgrowth = 0
 
         self.fig, ax0 = plt.subplots() #frameon=False) # set figsize later
+        self.species_tree_count += 1
+        self.species_tree_key = (frozenset(self.taxa), self.max_age)
         #ax0 = self.fig.add_axes([0.1,0.1,0.9,0.9]) #, adjustable='box-forced')
         #ax0 = self.fig.add_axes([0.1, 0.1, 0.9, 0.9])
         if not self.debug: ax0.axis('off')
@@ -574,25 +745,40 @@ class GenetreeDrawer(object):
         self.ax0 = ax0
         return self.fig
 
+    def clear_gene_tree(self):
+        """Remove the gene tree layer (the twin axes), keeping the species
+        tree background for the next gene tree."""
+        self.ax1.remove()
+        del self.ax1
 
     def minimize_gene_branch_crossing(self):
         """Reduce the number of gene branches crossing at speciation nodes, 
         by rotating duplication forks."""
 
-        _, phylsubtree = self.phyltree.getSubTree(self.taxa)
+        # Only depends on the species tree: reuse it for gene trees of the same taxa.
+        key, phylsubtree = self._phylsubtree
+        if key != self.species_tree_key:
+            _, phylsubtree = self.phyltree.getSubTree(self.taxa)
+            self._phylsubtree = (self.species_tree_key, phylsubtree)
 
         # Store for each node the number of species deletion going down or up.
         deletion_count = {} # +1 for deletion in high taxon, -1 in low taxon
         get_taxon_y = lambda taxon: self.species_coords[taxon][1]
         cached_taxa = {}
+        cached_events = {}
+        extreme_taxa = {}  # expected children taxa -> (lowest, highest)
 
         def orient_deletion(children_taxa, expected_children_taxa):
             """Tell if the deleted gene branch belong to a species branch going
             up (+1) or down (-1)"""
             assert expected_children_taxa, children_taxa
-            expected_children_taxa_ys = sorted(expected_children_taxa, key=get_taxon_y)
-            low_taxon = expected_children_taxa_ys[0]
-            high_taxon = expected_children_taxa_ys[-1]
+            expected_key = frozenset(expected_children_taxa)
+            try:
+                low_taxon, high_taxon = extreme_taxa[expected_key]
+            except KeyError:
+                low_taxon = min(expected_children_taxa, key=get_taxon_y)
+                high_taxon = max(expected_children_taxa, key=get_taxon_y)
+                extreme_taxa[expected_key] = (low_taxon, high_taxon)
 
             if low_taxon not in children_taxa:
                 return -1
@@ -631,7 +817,7 @@ class GenetreeDrawer(object):
             taxon = self.get_taxon(node, self.ancgene2sp, self.ensembl_version)
             cached_taxa[node] = taxon
             children_taxa = set(cached_taxa[ch] for ch in node.children)
-            event = infer_gene_event(node, taxon, children_taxa)
+            event = cached_events[node] = infer_gene_event(node, taxon, children_taxa)
 
             deletion_count[node] = sum(deletion_count[ch] for ch in node.children)
 
@@ -687,6 +873,14 @@ class GenetreeDrawer(object):
 
         self.genetrees = sorted(self.genetrees, key=deletion_count.get)
 
+        if self.sift_forks:
+            sifter = ForkSifter(self.genetrees, cached_taxa, cached_events,
+                                self.species_coords)
+            crossings_before = sifter.crossings
+            sifter.sift()
+            logger.info('Gene branch crossings: %d -> %d (%d rotatable forks)',
+                        crossings_before, sifter.crossings, len(sifter.children))
+
 
     def set_gene_coords(self, asymmetric=False, colorize_descent=None):
         """- asymmetric: whether to draw *asymmetric* divisions in the gene
@@ -699,6 +893,7 @@ class GenetreeDrawer(object):
         ###       consume vertical space.
         
         self.gene_coords = {} # {species: [gene list]}
+        self.gene_ranks = {}  # {nodeid: index in gene_coords[species]}
         #self.dup_branchings = [] # (nodeid/genename, x, x_child1, x_child2, y_child1, y_child2)
         #self.spe_branchings = []
         self.branchings = {} # {nodeid: [species, x, y, dup/spe,
@@ -749,6 +944,7 @@ class GenetreeDrawer(object):
                 taxon_gene_coords.append(nodeid)
                 node_y = len(taxon_gene_coords) - 1 # This list is being
                                                     # extended later on.
+                self.gene_ranks[nodeid] = node_y
                 interspecies_trees[nodeid] = {'taxon': taxon,
                                               'ndup': 0,
                                               'x': 1,
@@ -807,6 +1003,7 @@ class GenetreeDrawer(object):
                 if event == 'spe':
                     taxon_gene_coords.append(nodeid)
                     node_y = len(taxon_gene_coords) - 1
+                    self.gene_ranks[nodeid] = node_y
                     node_ndup = 0
                     node_x = 0
 
@@ -964,7 +1161,7 @@ class GenetreeDrawer(object):
                     color_cat = ch_ft.get('C', -1)
                     branch_color = cmap(color_cat) if color_cat<0 else cmap(color_cat % cmap.N)
                     u_fork_finger = patches.PathPatch(
-                                    Path(fork_coords, fork_instructions),
+                                    mpath.Path(fork_coords, fork_instructions),
                                     fill=False,
                                     edgecolor=('k' if int(ch_ft.get('A', -1))==0
                                                else branch_color),
@@ -975,7 +1172,7 @@ class GenetreeDrawer(object):
 
             else:  # event == 'spe' or 'leaf'
                 real_x, real_y, branch_width = self.species_coords[species]
-                pos = pos_list.index(nodeid) + 1
+                pos = self.gene_ranks[nodeid] + 1
                 real_y -= branch_width * pos/nranks
                 nodecolor = 'blue'
                 #nodecolor = 'none'
@@ -985,7 +1182,7 @@ class GenetreeDrawer(object):
                     linewidth = 4 if int(ch_ft.get('P', 0)) else 1
                     color_cat = ch_ft.get('C', -1)
                     v_fork_finger = patches.PathPatch(
-                                             Path([(real_x, real_y),
+                                             mpath.Path([(real_x, real_y),
                                                    (ch_real_x, ch_real_y)],
                                                   [MOVETO, LINETO]),
                                              edgecolor=(cmap(color_cat) if color_cat<0 else cmap(color_cat % cmap.N)),
@@ -1035,11 +1232,22 @@ class GenetreeDrawer(object):
 
     def draw(self, genetree, extratitle='',
              genenames=False, tags="", asymmetric=False,
-             colorize_descent=None):
+             colorize_descent=None, reuse_species_tree=False):
              #fork_style="curved"):
-        """Once phyltree is loaded, perform all drawing steps."""
+        """Once phyltree is loaded, perform all drawing steps.
+
+        reuse_species_tree: if the previous figure is still open and was drawn
+                            for the same taxa, only replace the gene tree layer.
+        """
         self.load_reconciled_genetree(genetree)
-        self.draw_species_tree()
+        if (reuse_species_tree and self.fig is not None
+                and plt.fignum_exists(self.fig.number)
+                and self.species_tree_key == (frozenset(self.taxa), self.max_age)):
+            self.clear_gene_tree()
+        else:
+            if reuse_species_tree and self.fig is not None:
+                plt.close(self.fig)
+            self.draw_species_tree()
         self.set_gene_coords(asymmetric, colorize_descent)
         self.draw_gene_tree(extratitle, genenames=genenames, tags=tags,
                             fork_style=("square" if asymmetric else "curved"))
@@ -1053,9 +1261,10 @@ class GenetreeDrawer(object):
 TESTTREE = "~/ws2/DUPLI_data85/alignments/ENSGT00850000132243/subtrees2/SimiiformesENSGT00850000132243.b.q.b.b.a.b.b.a.b.c.a.a.a.nwk"
 
 
-def run(genetrees, gene_params, outfile, genenames=False, tags="", asymmetric=False,
-        colorize_descent=None, **kwargs):
+def split_outfile_figsize(outfile):
+    """Parse the optional figsize suffix of outfile (ex: 'out.pdf:6x8').
 
+    Return (outfile, figsize, sizestr)."""
     figsize = PAPERSIZE['a4']
     match_figsize = FIGSIZE.search(outfile)
     sizestr = 'a4'
@@ -1068,6 +1277,13 @@ def run(genetrees, gene_params, outfile, genenames=False, tags="", asymmetric=Fa
         except KeyError:
             figsize = tuple(float(x) for x in match_figsize.groups())
     logger.debug('Will set output figsize to: %d x %d inches.', *figsize)
+    return outfile, figsize, sizestr
+
+
+def run(genetrees, gene_params, outfile, genenames=False, tags="", asymmetric=False,
+        colorize_descent=None, **kwargs):
+
+    outfile, figsize, sizestr = split_outfile_figsize(outfile)
     gd = GenetreeDrawer(**kwargs)
     display = lambda: plt.show() # Display function for shell or notebook usage
     if __name__=='__main__' and outfile == '-':
@@ -1081,10 +1297,10 @@ def run(genetrees, gene_params, outfile, genenames=False, tags="", asymmetric=Fa
         #mpl.use('Qt4Agg')
         #from importlib import reload; reload(plt)
     elif outfile.endswith('.pdf'):
-        pdf = PdfPages(outfile)
-        display = lambda: (pdf.savefig(bbox_inches='tight',
-                           papertype=(sizestr if sizestr in PAPERSIZE else 'a4')),
-                           plt.close())
+        pdf = backend_pdf.PdfPages(outfile)
+        # The paper size is given by figsize (savefig has no papertype since
+        # matplotlib 3.8, and it was ignored by the pdf backend).
+        display = lambda: (pdf.savefig(bbox_inches='tight'), plt.close())
     else:
         assert len(genetrees) <= 1, "multipage output only supported for pdf"
         display = lambda: (plt.savefig(outfile, bbox_inches='tight'),
@@ -1117,6 +1333,127 @@ def run(genetrees, gene_params, outfile, genenames=False, tags="", asymmetric=Fa
     return gd
 
 
+# Set in each worker by the Pool initializer, so that the PhylTree is loaded
+# once per process.
+_worker_drawer = None
+
+def _init_worker_drawer(drawer_kwargs):
+    global _worker_drawer
+    _worker_drawer = GenetreeDrawer(**drawer_kwargs)
+
+
+def render_chunk(job):
+    """Draw a contiguous chunk of gene trees with the worker's drawer.
+
+    The species tree figure is kept open between gene trees and chunks, and
+    only redrawn when the taxa change.
+    Return the list of written files: one pdf for the whole chunk, or one image
+    per gene tree."""
+    chunk_index, tasks, outbase, ext, figsize = job
+    gd = _worker_drawer
+    species_tree_count = gd.species_tree_count
+    outputs = []
+    pdf = None
+    if ext == '.pdf':
+        outputs.append('%s.part%05d.pdf' % (outbase, chunk_index))
+        pdf = backend_pdf.PdfPages(outputs[0])
+    try:
+        for index, genetree, gene_kwargs in tasks:
+            genetree, *extratitles = genetree.split(',')
+            extratitle = ', '.join(extratitles)
+            print('INPUT FILE:', genetree, '(%s)' % extratitle)
+            gd.draw(genetree, extratitle, reuse_species_tree=True, **gene_kwargs)
+            # Redo the layout at the final size: the figure may be reused.
+            gd.fig.set_size_inches(figsize)
+            gd.fig.tight_layout()
+            if pdf is not None:
+                pdf.savefig(gd.fig, bbox_inches='tight')
+            else:
+                outputs.append('%s.%05d%s' % (outbase, index, ext))
+                gd.fig.savefig(outputs[-1], bbox_inches='tight')
+    finally:
+        if pdf is not None:
+            pdf.close()
+    logger.info('Chunk %d: species tree drawn %d times for %d gene trees.',
+                chunk_index, gd.species_tree_count - species_tree_count,
+                len(tasks))
+    return outputs
+
+
+def merge_pdfs(inputs, outfile):
+    """Concatenate the pdf files in order. Return False if no tool is found
+    (pypdf, PyPDF2 or the `pdfunite` command)."""
+    if len(inputs) == 1:
+        os.replace(inputs[0], outfile)
+        return True
+    try:
+        from pypdf import PdfWriter as PdfMerger
+    except ImportError:
+        try:
+            from PyPDF2 import PdfMerger
+        except ImportError:
+            PdfMerger = None
+    if PdfMerger is not None:
+        merger = PdfMerger()
+        for inputfile in inputs:
+            merger.append(inputfile)
+        with open(outfile, 'wb') as out:
+            merger.write(out)
+        merger.close()
+    elif shutil.which('pdfunite'):
+        subprocess.run(['pdfunite'] + list(inputs) + [outfile], check=True)
+    else:
+        return False
+    for inputfile in inputs:
+        os.remove(inputfile)
+    return True
+
+
+def run_batch(genetrees, gene_params, outfile, jobs=2, chunksize=None,
+              genenames=False, tags="", asymmetric=False, colorize_descent=None,
+              **kwargs):
+    """Like `run`, but distribute the gene trees across a pool of `jobs`
+    processes. Each worker writes its own pages, which are merged in the input
+    order (pdf), or saved as `<outfile base>.<index><ext>` (other formats).
+    """
+    if not genetrees:
+        return run(genetrees, gene_params, outfile, **kwargs)
+    outfile, figsize, sizestr = split_outfile_figsize(outfile)
+    if outfile == '-':
+        raise ValueError("Batch mode needs an output file, not '-'.")
+
+    outbase, ext = op.splitext(outfile)
+    tasks = []
+    for index, (genetree, gene_kwargs) in enumerate(
+                    zip_longest(genetrees, gene_params, fillvalue={})):
+        gene_kwargs = {'genenames': genenames, 'tags': tags,
+                       'asymmetric': asymmetric, 'colorize_descent': colorize_descent,
+                       **gene_kwargs}
+        tasks.append((index, genetree, gene_kwargs))
+
+    # Contiguous chunks, so that consecutive trees of the same clade share
+    # the species tree drawing, and pages stay in order.
+    if chunksize is None:
+        chunksize = max(1, ceil(len(tasks) / (4 * jobs)))
+    chunks = [(i, tasks[start:start+chunksize], outbase, ext, figsize)
+              for i, start in enumerate(range(0, len(tasks), chunksize))]
+
+    with mp.Pool(jobs, initializer=_init_worker_drawer,
+                 initargs=(kwargs,)) as pool:
+        outputs = pool.map(render_chunk, chunks, chunksize=1)
+
+    outputs = [outputfile for chunk_outputs in outputs
+               for outputfile in chunk_outputs]
+    if ext == '.pdf':
+        if not merge_pdfs(outputs, outfile):
+            logger.warning('No pdf merging tool (pypdf, PyPDF2, pdfunite): '
+                           'leaving the %d parts as %s.partXXXXX.pdf',
+                           len(outputs), outbase)
+            return outputs
+        return [outfile]
+    return outputs
+
+
 if __name__ == '__main__':
 
     logging.basicConfig(format='%(levelname)s:%(name)s:l.%(lineno)d:%(funcName)s:%(message)s')
@@ -1174,6 +1511,8 @@ if __name__ == '__main__':
                         help='Show genome coverage information (grey shading)')
     parser.add_argument('-A', '--ages', action='store_true',
                         help='Place species nodes at their real age.')
+    parser.add_argument('-S', '--sift-forks', action='store_true',
+                        help='Rotate duplication forks to minimize gene branch crossings.')
     parser.add_argument('-d', '--debug', action='store_true',
                         help='More verbose output and graphical hints (axes tick values)')
     g_pars = parser.add_argument_group("Gene tree control",
@@ -1198,7 +1537,12 @@ if __name__ == '__main__':
                         
     #parser.add_argument('-m', '--multiple-pdfs', action='store_true',
     #                    help='output one pdf file per genetree. [NOT implemented]')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help=('Number of processes drawing in parallel. Pdf pages '
+                              'are merged in the input order; other formats '
+                              'output one file per genetree. [%(default)s]'))
     args = parser.parse_args()
+    mpl.use('Agg')
     dictargs = vars(args)
     #if not dictargs.get('genetrees'):
     #    dictargs['genetrees'] = [TESTTREE]
@@ -1229,5 +1573,9 @@ if __name__ == '__main__':
 
     logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
-    gd = run(genetrees, gene_params, **dictargs)
+    jobs = dictargs.pop('jobs')
+    if jobs > 1:
+        run_batch(genetrees, gene_params, jobs=jobs, **dictargs)
+    else:
+        gd = run(genetrees, gene_params, **dictargs)
 
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""Convert a LibsDyogen protein tree forest into a columnar node table.
+
+The forest is parsed once, in a streaming pass (the columns are written by
+chunks), and each column is saved as a NumPy `.npy` file in the output
+directory, so that it can be memory-mapped by `ForestTable.load` instead of
+reparsing the forest text.
+
+Nodes are stored in preorder within each tree (parents before children), so
+that the subtree of row `i` spans the rows `[i, end[i])`.
+
+USAGE:
+
+./forest_table.py <proteinTreeFile> <outdir>
+"""
+
+
+import os
+import os.path as op
+import json
+import argparse as ap
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+
+# Column name -> dtype (None: variable width bytes, decided at writing).
+COLUMNS = {'tree':        np.int32,   # index of the tree in the forest
+           'node_id':     np.int64,   # LibsDyogen node id
+           'parent':      np.int64,   # row of the parent node (-1 at roots)
+           'end':         np.int64,   # row after the last descendant
+           'dist':        np.float64, # branch length (NaN at roots)
+           'taxon':       np.int32,   # index in `taxa` (-1 if absent)
+           'duplication': np.int8,    # 'Duplication' info field (-1 if absent)
+           'gene_name':   None}       # gene_name (leaves) or family_name
+
+FORMAT_VERSION = 1
+
+
+def iter_prottree_rows(tree, root=None):
+    """Yield (node, parent, dist) in preorder, iteratively."""
+    if root is None:
+        root = tree.root
+    stack = [(root, None, np.NaN)]
+    while stack:
+        node, parent, dist = stack.pop()
+        yield node, parent, dist
+        stack.extend((child, node, chdist)
+                     for child, chdist in reversed(tree.data.get(node, [])))
+
+
+class ForestTableWriter(object):
+    """Write the rows of successive ProteinTrees into `outdir`.
+
+    Rows are buffered per tree, and appended to one raw file per column every
+    `chunk_rows` rows, so that memory does not grow with the forest. `close`
+    converts the raw files into `.npy` files, chunk by chunk.
+    """
+    def __init__(self, outdir, chunk_rows=1 << 20):
+        self.outdir = outdir
+        self.chunk_rows = chunk_rows
+        os.makedirs(outdir, exist_ok=True)
+        self.rawfiles = {col: open(self.rawpath(col), 'wb') for col in COLUMNS}
+        self.buffer = {col: [] for col in COLUMNS}
+        self.buffered = 0
+        self.name_width = 1
+        self.taxa = {}  # taxon name -> code
+        self.tree_names = []
+        self.nrows = 0
+
+    def rawpath(self, col):
+        return op.join(self.outdir, col + '.raw')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            for col, rawfile in self.rawfiles.items():
+                rawfile.close()
+                os.remove(self.rawpath(col))
+
+    def taxon_code(self, taxon):
+        if taxon is None:
+            return -1
+        return self.taxa.setdefault(taxon, len(self.taxa))
+
+    def add_tree(self, tree):
+        tree_index = len(self.tree_names)
+        rootinfo = tree.info[tree.root]
+        self.tree_names.append(rootinfo.get('tree_name',
+                                            rootinfo.get('family_name', '')))
+        start = self.nrows
+        rows = {}  # node -> row
+        node_ids, parents, dists, taxa, dups, names = [], [], [], [], [], []
+        for node, parent, dist in iter_prottree_rows(tree):
+            rows[node] = start + len(node_ids)
+            info = tree.info[node]
+            node_ids.append(node)
+            parents.append(-1 if parent is None else rows[parent])
+            dists.append(dist)
+            taxa.append(self.taxon_code(info.get('taxon_name')))
+            dups.append(info.get('Duplication', -1))
+            name = info.get('gene_name') if node not in tree.data else None
+            if name is None:
+                name = info.get('family_name', '')
+            names.append(name.encode())
+        nrows = len(node_ids)
+        self.nrows += nrows
+
+        # Subtree ends: propagate from the last rows to their parents.
+        parent = np.array(parents, dtype=COLUMNS['parent'])
+        end = np.arange(start + 1, self.nrows, dtype=COLUMNS['end'])
+        end = np.append(end, self.nrows)
+        local_parent = parent - start
+        for row in range(nrows - 1, 0, -1):
+            p = local_parent[row]
+            if end[row] > end[p]:
+                end[p] = end[row]
+
+        buf = self.buffer
+        buf['tree'].append(np.full(nrows, tree_index, dtype=COLUMNS['tree']))
+        buf['node_id'].append(np.array(node_ids, dtype=COLUMNS['node_id']))
+        buf['parent'].append(parent)
+        buf['end'].append(end)
+        buf['dist'].append(np.array(dists, dtype=COLUMNS['dist']))
+        buf['taxon'].append(np.array(taxa, dtype=COLUMNS['taxon']))
+        buf['duplication'].append(np.array(dups, dtype=COLUMNS['duplication']))
+        buf['gene_name'].extend(names)
+        self.name_width = max(self.name_width, max(len(n) for n in names))
+        self.buffered += nrows
+        if self.buffered >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        for col, values in self.buffer.items():
+            if col == 'gene_name':
+                # One name per line (the final width is not known yet).
+                self.rawfiles[col].write(b''.join(n + b'\n' for n in values))
+            else:
+                for array in values:
+                    array.tofile(self.rawfiles[col])
+            values.clear()
+        self.buffered = 0
+
+    def close(self):
+        """Convert the raw columns into .npy files, and write the metadata."""
+        self.flush()
+        for col, dtype in COLUMNS.items():
+            self.rawfiles[col].close()
+            if dtype is None:
+                dtype = np.dtype('S%d' % self.name_width)
+            out = np.lib.format.open_memmap(op.join(self.outdir, col + '.npy'),
+                                            mode='w+', dtype=dtype,
+                                            shape=(self.nrows,))
+            with open(self.rawpath(col), 'rb') as raw:
+                for i in range(0, self.nrows, self.chunk_rows):
+                    n = min(self.chunk_rows, self.nrows - i)
+                    if col == 'gene_name':
+                        out[i:i+n] = [raw.readline()[:-1] for _ in range(n)]
+                    else:
+                        out[i:i+n] = np.fromfile(raw, dtype=dtype, count=n)
+            out.flush()
+            del out
+            os.remove(self.rawpath(col))
+        taxa = sorted(self.taxa, key=self.taxa.get)
+        with open(op.join(self.outdir, 'meta.json'), 'w') as out:
+            json.dump({'version': FORMAT_VERSION,
+                       'nrows': self.nrows,
+                       'taxa': taxa,
+                       'tree_names': self.tree_names}, out)
+
+
+def write_forest_table(forestfile, outdir, chunk_rows=1 << 20):
+    """Parse the forest once and save its node table into `outdir`."""
+    from LibsDyogen import myProteinTree
+    with ForestTableWriter(outdir, chunk_rows) as writer:
+        for tree in myProteinTree.loadTree(forestfile):
+            writer.add_tree(tree)
+    logger.info('%d trees, %d nodes, %d taxa.', len(writer.tree_names),
+                writer.nrows, len(writer.taxa))
+    return writer
+
+
+class ForestTable(object):
+    """Memory-mapped node table of a protein tree forest.
+
+    Columns are accessible as attributes (ex: `table.taxon`)."""
+    def __init__(self, columns, taxa, tree_names):
+        self.columns = columns
+        self.taxa = taxa
+        self.taxon_codes = {taxon: i for i, taxon in enumerate(taxa)}
+        self.tree_names = tree_names
+
+    @classmethod
+    def load(cls, indir, mmap_mode='r'):
+        with open(op.join(indir, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['version'] != FORMAT_VERSION:
+            raise ValueError('Unsupported forest table version %s' % meta['version'])
+        columns = {col: np.load(op.join(indir, col + '.npy'), mmap_mode=mmap_mode)
+                   for col in COLUMNS}
+        return cls(columns, meta['taxa'], meta['tree_names'])
+
+    def __getattr__(self, col):
+        try:
+            return self.__dict__['columns'][col]
+        except KeyError:
+            raise AttributeError(col)
+
+    def __len__(self):
+        return len(self.columns['tree'])
+
+    @property
+    def ntrees(self):
+        return len(self.tree_names)
+
+    @property
+    def is_leaf(self):
+        return self.end == np.arange(1, len(self) + 1)
+
+    @property
+    def is_dup(self):
+        return self.duplication > 1
+
+    @property
+    def tree_starts(self):
+        """First row of each tree (the root)."""
+        return np.flatnonzero(self.parent < 0)
+
+    def taxon_mask(self, taxa):
+        """Boolean mask of the rows whose taxon is in `taxa`."""
+        codes = [self.taxon_codes[t] for t in taxa if t in self.taxon_codes]
+        return np.isin(self.taxon, codes)
+
+    def parent_taxon(self):
+        """Taxon code of the parent node (-1 at roots)."""
+        return np.where(self.parent >= 0, self.taxon[self.parent], -1)
+
+
+def main():
+    logging.basicConfig(format='%(levelname)s:%(funcName)s:%(message)s',
+                        level=logging.INFO)
+    parser = ap.ArgumentParser(description=__doc__,
+                               formatter_class=ap.RawDescriptionHelpFormatter)
+    parser.add_argument('forestfile')
+    parser.add_argument('outdir')
+    args = parser.parse_args()
+    write_forest_table(args.forestfile, args.outdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -466,6 +466,7 @@ class OnDemandData(object):
     def load(self):
         """Load or reload"""
         self.data = self.loader()
+        self.loaded = True
 
     def _load_on_error(method):
         """Tries first, or load data"""
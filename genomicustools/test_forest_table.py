@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import os
+import numpy as np
+import pytest
+myProteinTree = pytest.importorskip('LibsDyogen.myProteinTree')
+from genomicustools.forest_table import write_forest_table, ForestTable
+
+
+def make_forest():
+    """(((g3,g4)AB dup, g5)ABC ; (g11,g12)AB"""
+    tree1 = myProteinTree.ProteinTree(
+            {1: [(2, 0.5), (5, 1.5)], 2: [(3, 0.25), (4, 0.125)]},
+            {1: {'taxon_name': 'ABC', 'Duplication': 0, 'family_name': 'fam1',
+                 'tree_name': 'T1'},
+             2: {'taxon_name': 'AB', 'Duplication': 2, 'family_name': 'fam1.a'},
+             3: {'taxon_name': 'A', 'Duplication': 0, 'gene_name': 'g3'},
+             4: {'taxon_name': 'B', 'Duplication': 0, 'gene_name': 'gene4'},
+             5: {'taxon_name': 'C', 'Duplication': 0, 'gene_name': 'g5'}},
+            1)
+    tree2 = myProteinTree.ProteinTree(
+            {10: [(11, 1.), (12, 2.)]},
+            {10: {'taxon_name': 'AB', 'Duplication': 0, 'family_name': 'fam2',
+                  'tree_name': 'T2'},
+             11: {'taxon_name': 'A', 'Duplication': 0, 'gene_name': 'g11'},
+             12: {'taxon_name': 'B', 'Duplication': 0, 'gene_name': 'g12'}},
+            10)
+    return [tree1, tree2]
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 3, 1000])
+def test_write_and_load(tmp_path, chunk_rows):
+    forestfile = str(tmp_path / 'forest.txt')
+    with open(forestfile, 'w') as out:
+        for tree in make_forest():
+            tree.printTree(out)
+    outdir = str(tmp_path / 'table')
+    write_forest_table(forestfile, outdir, chunk_rows=chunk_rows)
+    assert sorted(os.listdir(outdir)) == sorted(
+            ['meta.json', 'tree.npy', 'node_id.npy', 'parent.npy', 'end.npy',
+             'dist.npy', 'taxon.npy', 'duplication.npy', 'gene_name.npy'])
+
+    table = ForestTable.load(outdir, mmap_mode='r')
+    assert isinstance(table.parent, np.memmap)
+    assert len(table) == 8 and table.ntrees == 2
+    assert table.tree_names == ['T1', 'T2']
+    assert table.node_id.tolist() == [1, 2, 3, 4, 5, 10, 11, 12]
+    assert table.parent.tolist() == [-1, 0, 1, 1, 0, -1, 5, 5]
+    assert table.end.tolist() == [5, 4, 3, 4, 5, 8, 7, 8]
+    assert table.tree.tolist() == [0, 0, 0, 0, 0, 1, 1, 1]
+    assert table.tree_starts.tolist() == [0, 5]
+    assert [table.taxa[t] for t in table.taxon] == \
+            ['ABC', 'AB', 'A', 'B', 'C', 'AB', 'A', 'B']
+    assert table.gene_name.tolist() == [b'fam1', b'fam1.a', b'g3', b'gene4',
+                                        b'g5', b'fam2', b'g11', b'g12']
+    assert table.dist[1:5].tolist() == [0.5, 0.25, 0.125, 1.5]
+    assert np.isnan(table.dist[[0, 5]]).all()
+    assert table.is_dup.tolist() == [False, True] + [False] * 6
+    assert table.is_leaf.tolist() == [False, False, True, True, True,
+                                      False, True, True]
@@ -2,9 +2,17 @@
 # -*- coding: utf-8 -*-
 
 
-"""Convenience classes such as namespaces"""
+"""Convenience classes such as namespaces, lazy imports, and an ordered
+parallel map (`imap_window`)"""
 
 
+import os
+import sys
+import importlib
+from types import ModuleType
+from collections import deque
+from itertools import islice
+
 #import itertools as it
 #from collections import OrderedDict
 #from collections import abc
@@ -21,6 +29,87 @@
 #    return newmethod
 
 
+# Set to 1 to import everything immediately (e.g. to check the dependencies).
+EAGER_IMPORTS = os.environ.get('ORGANON_EAGER_IMPORTS', '') not in ('', '0')
+
+
+class LazyModule(ModuleType):
+    """Placeholder for a module, imported at the first access to one of its
+    attributes. The ImportError of a missing optional dependency is raised at
+    this point too.
+
+    Attributes of the module are copied at the first access, so that next
+    accesses are as fast as for the module itself.
+    """
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return '<lazy module %r>' % self.__name__
+
+
+def lazy_import(name):
+    """To use instead of `import name` for heavy modules (ete3, Bio.*,
+    matplotlib.pyplot, scipy.stats, pandas...), accessed as `module.attr`:
+
+    >>> plt = lazy_import('matplotlib.pyplot')
+    """
+    if EAGER_IMPORTS or name in sys.modules:
+        return importlib.import_module(name)
+    return LazyModule(name)
+
+
+def lazy_exports(package, names):
+    """Module `__getattr__` (PEP 562) for a package `__init__`, importing the
+    given names from their submodule at first access:
+
+    >>> __getattr__ = lazy_exports(__name__, {'ungap': '.ungap'})
+    """
+    def __getattr__(name):
+        try:
+            submodule = names[name]
+        except KeyError:
+            raise AttributeError('module %r has no attribute %r' % (package, name))
+        value = getattr(importlib.import_module(submodule, package), name)
+        # Replaces the submodule of the same name, as `from .sub import name`.
+        setattr(sys.modules[package], name, value)
+        return value
+
+    if EAGER_IMPORTS:
+        for name in names:
+            __getattr__(name)
+    return __getattr__
+
+
+def _map_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
+
+def imap_window(func, iterable, ncores=1, window=None, initializer=None,
+                initargs=(), chunksize=1):
+    """Ordered `map` in a pool of processes, with at most `window` chunks of
+    `chunksize` items in flight (`Pool.imap` would consume the whole input)."""
+    if ncores <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        yield from map(func, iterable)
+        return
+    import multiprocessing as mp
+    if window is None:
+        window = 4 * ncores
+    iterator = iter(iterable)
+    with mp.Pool(ncores, initializer, initargs) as pool:
+        pending = deque()
+        for chunk in iter(lambda: list(islice(iterator, chunksize)), []):
+            pending.append(pool.apply_async(_map_chunk, (func, chunk)))
+            if len(pending) >= window:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
 class Args(object):
     """Object to hold unpacked arguments (*args, **kwargs).
     Iterate easily on all of its elements.
@@ -103,6 +103,15 @@ r'''^(This is a rooted tree. +Please check!)?
                         ParseUnit('Time used', r'^Time used:\s+(.*)$')])
 
 
+def time2seconds(time_str):
+    """Convert the 'Time used' value (ex: '1:02:03') into seconds."""
+    factors = [1, 60, 3600, 3600*24]
+    s = 0
+    for factor, n_units in zip(factors, reversed(time_str.split(':'))):
+        s += factor * int(n_units)
+    return s
+
+
 def moreprecise_dNdS(parsed_mlc):
     pass
 
@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 
 
-from .ungap import ungap
-from .seqname_grep import seqrecords_grep, algrep
-from .compo_freq import make_al_compo
-from .plot_al_conservation import reorder_al, get_position_stats
-
-
-
+# Imported at first access, so that the scripts of seqtools do not all load
+# plot_al_conservation (matplotlib, Bio).
+# NOTE: `ungap` is also a submodule: once `seqtools.ungap` is imported,
+# `from seqtools import ungap` gives the module. Prefer `from seqtools.ungap import ungap`.
+from objectools import lazy_exports
+
+__getattr__ = lazy_exports(__name__, {'ungap': '.ungap',
+                                      'seqrecords_grep': '.seqname_grep',
+                                      'algrep': '.seqname_grep',
+                                      'make_al_compo': '.compo_freq',
+                                      'reorder_al': '.plot_al_conservation',
+                                      'get_position_stats': '.plot_al_conservation'})
@@ -12,7 +12,8 @@ For the gap count to be meaningful, you should remove columns containing only ga
 from sys import stdin
 import numpy as np
 import argparse
-from Bio import AlignIO
+from objectools import lazy_import
+AlignIO = lazy_import('Bio.AlignIO')
 from collections import Counter
 from seqtools.IUPAC import gaps, nucleotides, unknown, ambiguous, stop_codons
 
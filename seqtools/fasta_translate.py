@@ -3,7 +3,12 @@
 
 import sys
 import argparse
-from Bio import SeqIO
+try:
+    from objectools import lazy_import
+except ImportError:  # Run as a standalone script
+    from Bio import SeqIO
+else:
+    SeqIO = lazy_import('Bio.SeqIO')
 
 
 def iter_translate(inputfile, format="fasta"):
@@ -14,18 +19,23 @@ def iter_translate(inputfile, format="fasta"):
         assert len(record.seq) > 0
         yield record
 
-def main(inputfile, outfile, format="fasta"):
-    SeqIO.write(iter_translate(inputfile), outfile, format)
+def fasta_translate(inputfile, outfile, format="fasta"):
+    SeqIO.write(iter_translate(inputfile, format), outfile, format)
 
 
-if __name__=='__main__':
+def make_parser():
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument('inputfile', nargs='?', default=sys.stdin)
     parser.add_argument('outfile', nargs='?', default=sys.stdout)
     parser.add_argument('-f', '--format', default="fasta", 
                         help='[%(default)s]')
-    
-    args = parser.parse_args()
-    main(**vars(args))
+    return parser
+
 
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    fasta_translate(**vars(args))
 
+
+if __name__=='__main__':
+    main()
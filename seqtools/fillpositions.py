@@ -4,7 +4,12 @@
 
 from sys import stdin, stdout
 import argparse as ap
-from Bio import SeqIO
+try:
+    from objectools import lazy_import
+except ImportError:  # Run as a standalone script
+    from Bio import SeqIO
+else:
+    SeqIO = lazy_import('Bio.SeqIO')
 import logging
 logger = logging.getLogger(__name__)
 
@@ -15,14 +15,6 @@ import re
 from itertools import product, combinations
 
 import numpy as np
-import matplotlib as mpl
-try:
-    mpl.use('Agg', warn=False)
-except TypeError:
-    # keyword warn disappeared in recent matplotlib
-    mpl.use('Agg')
-import matplotlib.pyplot as plt
-from Bio import AlignIO, Align, Alphabet
 try:
     import argparse_custom as argparse
 except ImportError:
@@ -31,30 +23,52 @@ except ImportError:
 from functools import reduce
 
 from seqtools.IUPAC import gaps, unknown, nucleotides, ambiguous
-from datasci.graphs import stackedbar, plottree
 from dendro.bates import rev_dfw_descendants
+from objectools import lazy_import
+# Plotting modules are only imported for plotting.
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+graphs = lazy_import('datasci.graphs')
+AlignIO = lazy_import('Bio.AlignIO')
+Align = lazy_import('Bio.Align')
+Alphabet = lazy_import('Bio.Alphabet')
 
 import logging
 logger = logging.getLogger(__name__)
 
-#try:
-#    mpl.style.use('softer')
-#except OSError:
-# From Seaborn
-mpl.rcParams['axes.prop_cycle'] = mpl.cycler('color',
-                ['4C72B0', '55A868', 'C44E52', '8172B2', 'CCB974', '64B5CD'])
-mpl.rcParams['grid.alpha'] = 0.5
-mpl.rcParams['grid.linestyle'] = '--'
-#    pass
-
-mpl.rcParams['axes.grid'] = True
-mpl.rcParams['axes.grid.axis'] = 'x'
 
-# Change all black to dark grey
 grey10 = '#1a1a1a'
-for param, paramval in mpl.rcParamsDefault.items():
-    if paramval == 'k':
-        mpl.rcParams[param] = grey10
+_mpl_ready = False
+
+def setup_matplotlib():
+    """Backend and style of the plots (only applied once)."""
+    global _mpl_ready
+    if _mpl_ready:
+        return
+    try:
+        mpl.use('Agg', warn=False)
+    except TypeError:
+        # keyword warn disappeared in recent matplotlib
+        mpl.use('Agg')
+
+    #try:
+    #    mpl.style.use('softer')
+    #except OSError:
+    # From Seaborn
+    mpl.rcParams['axes.prop_cycle'] = mpl.cycler('color',
+                    ['4C72B0', '55A868', 'C44E52', '8172B2', 'CCB974', '64B5CD'])
+    mpl.rcParams['grid.alpha'] = 0.5
+    mpl.rcParams['grid.linestyle'] = '--'
+    #    pass
+
+    mpl.rcParams['axes.grid'] = True
+    mpl.rcParams['axes.grid.axis'] = 'x'
+
+    # Change all black to dark grey
+    for param, paramval in mpl.rcParamsDefault.items():
+        if paramval == 'k':
+            mpl.rcParams[param] = grey10
+    _mpl_ready = True
 
 
 ext2fmt = {'.fa':    'fasta',
@@ -75,9 +89,19 @@ NUCL2INT = {symbol: i for i, symbol in enumerate(gaps[0] + nucleotides)}
 
 # Does not work...
 # Reading the alignment and issuing align[0][0] still yields a single nucleotide.
-codonalphabet = Alphabet.Alphabet()
-codonalphabet.letters = [NACODON] + CODONS + STOPS
-codonalphabet.size = 3
+def make_codonalphabet():
+    codonalphabet = Alphabet.Alphabet()
+    codonalphabet.letters = [NACODON] + CODONS + STOPS
+    codonalphabet.size = 3
+    return codonalphabet
+
+
+def __getattr__(name):
+    # Build `codonalphabet` on first access, to not import Bio at startup.
+    if name == 'codonalphabet':
+        globals()[name] = make_codonalphabet()
+        return globals()[name]
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
 
 
 # ~~> arrayal
@@ -555,6 +579,7 @@ def reorder_al(align, records=None, record_order=None):
 def plot_al_stats(gap_prop, al_entropy, alint, dist_array=None, seqlabels=None,
                   outfile=None):
     """DEPRECATED."""
+    setup_matplotlib()
     if outfile is None:
         #try:
         #    plt.switch_backend('Qt5Agg')
@@ -702,7 +727,7 @@ class AlignPlotter(object):
 
         default_step = ('step', {'where': 'mid', 'alpha': 0.65})
         default_bar = ('bar', {'width': 1})
-        default_stacked = (stackedbar, {'width': 1, 'edgecolor': 'none'})
+        default_stacked = (graphs.stackedbar, {'width': 1, 'edgecolor': 'none'})
 
         #from collections import namedtuple
         #funcArgs = namedtuple('funcArgs', 'func args')
@@ -723,7 +748,7 @@ class AlignPlotter(object):
                       'part_pars':   [default_stacked,
                                       (annotate_summary,),
                                       ('legend', {'bbox_to_anchor': (0,0,0.5,1)})],
-                      'tree':        [(plottree, {'get_items': get_items_biophylo,
+                      'tree':        [(graphs.plottree, {'get_items': get_items_biophylo,
                                                   'get_label': get_label_biophylo,
                                                   'label_params': {'fontsize': 'x-small'}}),
                                       ('tick_params', {'labelright': False}),
@@ -738,6 +763,7 @@ class AlignPlotter(object):
         - alint: alignment provided as a numpy 2D array of integers.
         - tree: tree in Bio.Phylo format.
         """
+        setup_matplotlib()
         self.plot_properties, self.plot_funcs = self.set_plots()
         self.alint = alint
         self.x = np.arange(self.alint.shape[1]) # X values for plotting
@@ -1206,6 +1232,7 @@ def main():
 
     outfile = args.outfile
     delattr(args, 'outfile')
+    setup_matplotlib()
     if not outfile:
         plt.switch_backend('TkAgg')
 
@@ -8,14 +8,20 @@
 """Print an alignment to stdout, with colors."""
 
 from sys import stdin
-import os.path
+import os
+import os.path as op
 import re
 import argparse
 import logging
 logging.basicConfig(format='%(levelname)s:%(funcName)s:%(message)s')
 
 
-from Bio import AlignIO
+try:
+    from objectools import lazy_import
+except ImportError:  # Run as a standalone script
+    from Bio import AlignIO
+else:
+    AlignIO = lazy_import('Bio.AlignIO')
 
 NORMAL       = ""
 RESET        = "\033[m"
@@ -188,7 +194,7 @@ ext2fmt = {'.fa':    'fasta',
 
 
 def filename2format(filename):
-    _, ext = os.path.splitext(filename)
+    _, ext = op.splitext(filename)
     return ext2fmt[ext]
 
 
@@ -233,22 +239,37 @@ def pos2tickmark(pos):
     pass
 
 
-def makeruler(length, base=1, stepwidth=1):
-    """Set stepwidth=3 for codons"""
+def makeruler(length, base=1, stepwidth=1, start=0, stop=None):
+    """Set stepwidth=3 for codons.
+
+    Only the characters [start:stop] of the ruler are built (so that a slice
+    of a huge alignment does not need the full ruler)."""
     nsteps = length // stepwidth
     minortick='.'
     majortick='|'
-    ticks = list(minortick + ' '*(stepwidth-1)) * nsteps
-    ticks[0] = str(base)
-    for i in range(5, nsteps, 5):
-        ticks[(i-base)*stepwidth] = majortick
-    for i in range(10, nsteps, 10):
+    stop = nsteps*stepwidth if stop is None else min(stop, nsteps*stepwidth)
+    start = min(max(start, 0), stop)
+    offset = start % stepwidth
+    ticks = list(((minortick + ' '*(stepwidth-1))
+                  * ((stop - start) // stepwidth + 2))[offset:offset + stop - start])
+    if start == 0 and stop > 0:
+        ticks[0] = str(base)
+    # Only the steps i falling in the window (numbers span a few chars to the left)
+    first = max(0, start // stepwidth + base - 1)
+    last = min(nsteps, stop // stepwidth + base + 20)
+    for i in range(max(5, first - first % 5), last, 5):
+        pos = (i-base)*stepwidth
+        if start <= pos < stop:
+            ticks[pos - start] = majortick
+    for i in range(max(10, first - first % 10), last, 10):
         # update the character at the tick, by taking into account the length
         # of the number.
         count = str(i)
         nchars = len(count)
         for char_i, char in enumerate(count):
-            ticks[(i-base)*stepwidth - (nchars-1-char_i)] = char
+            pos = (i-base)*stepwidth - (nchars-1-char_i)
+            if start <= pos < stop:
+                ticks[pos - start] = char
 
     return ''.join(ticks)
 
@@ -281,10 +302,188 @@ def colorizerecord(record, residu2col=CODON2COL, stepwidth=3):
 
     return colorized
 
+
+class ColorTable(dict):
+    """Colored string of each residue (or codon), computed at the first lookup.
+
+    Unknown residues get the `unknown` color, and are recorded."""
+    def __init__(self, residu2col, stepwidth=1, unknown=''):
+        self.residu2col = residu2col
+        self.stepwidth = stepwidth
+        self.unknown = unknown
+        self.unknown_residus = set()
+
+    def __missing__(self, residu):
+        try:
+            residucol = self.residu2col[residu.upper()]
+        except KeyError:
+            residucol = self.unknown
+            self.unknown_residus.add(residu)
+        colored = self[residu] = residucol + residu + RESET
+        return colored
+
+    def colorize(self, seq):
+        """Join the colored tokens of a sequence string"""
+        if self.stepwidth == 1:
+            return ''.join(map(self.__getitem__, seq))
+        assert len(seq) % self.stepwidth == 0
+        w = self.stepwidth
+        return ''.join([self[seq[i:i+w]] for i in range(0, len(seq), w)])
+
+
+class FastaIndex(object):
+    """Random access to the sequences of a fasta file, without loading it.
+
+    The index has the format of `samtools faidx` (.fai file: name, length,
+    offset, bases per line, bytes per line). It is reused if it is more
+    recent than the fasta file, otherwise it is rebuilt and saved if possible.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        faifile = filename + '.fai'
+        if op.exists(faifile) and op.getmtime(faifile) >= op.getmtime(filename):
+            self.load(faifile)
+        else:
+            self.build()
+            try:
+                self.save(faifile)
+            except OSError as err:
+                logging.info('Could not save the index: %s', err)
+        self.handle = open(filename, 'rb')
+
+    def load(self, faifile):
+        self.ids, self.index = [], []
+        with open(faifile) as f:
+            for line in f:
+                name, *fields = line.rstrip('\n').split('\t')
+                self.ids.append(name)
+                self.index.append(tuple(int(x) for x in fields[:4]))
+
+    def build(self):
+        """Scan the file once. Raise ValueError if the line lengths are irregular."""
+        import mmap
+        self.ids, self.index = [], []
+        if not op.getsize(self.filename):
+            return
+        with open(self.filename, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            pos = 0 if mm[:1] == b'>' else mm.find(b'\n>') + 1
+            while 0 < pos < size or (pos == 0 and mm[:1] == b'>'):
+                header_end = mm.find(b'\n', pos)
+                if header_end < 0:
+                    header_end = size
+                header = mm[pos+1:header_end].split()
+                next_header = mm.find(b'\n>', header_end)
+                end = size if next_header < 0 else next_header + 1
+                seqoffset = min(header_end + 1, size)
+                body = mm[seqoffset:end].rstrip(b'\r\n')
+
+                first_nl = body.find(b'\n')
+                if first_nl < 0:
+                    linebases = len(body)
+                    linewidth = linebases + (end - seqoffset - len(body) > 0)
+                    nlines = 0
+                else:
+                    linewidth = first_nl + 1
+                    linebases = len(body[:first_nl].rstrip(b'\r'))
+                    nlines = len(range(linewidth-1, len(body), linewidth))
+                    # All newlines are at the end of the full lines
+                    if body.count(b'\n') != nlines \
+                            or body[linewidth-1::linewidth] != b'\n' * nlines:
+                        raise ValueError('Irregular line lengths for %r'
+                                         % header[0].decode())
+                length = len(body) - nlines * (linewidth - linebases)
+                self.ids.append(header[0].decode() if header else '')
+                self.index.append((length, seqoffset, linebases, linewidth))
+                pos = end
+
+    def save(self, faifile):
+        with open(faifile, 'w') as out:
+            for name, fields in zip(self.ids, self.index):
+                out.write('%s\t%d\t%d\t%d\t%d\n' % ((name,) + tuple(fields)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_alignment_length(self):
+        return max((length for length, _, _, _ in self.index), default=0)
+
+    def fetch(self, i, start, stop):
+        """Sequence string of record i, positions [start, stop)"""
+        length, offset, linebases, linewidth = self.index[i]
+        stop = min(stop, length)
+        if stop <= start:
+            return ''
+        byte_start = offset + (start // linebases)*linewidth + start % linebases
+        byte_stop = offset + (stop // linebases)*linewidth + stop % linebases
+        self.handle.seek(byte_start)
+        return self.handle.read(byte_stop - byte_start).decode()\
+                   .replace('\n', '').replace('\r', '')
+
+    def close(self):
+        self.handle.close()
+
+
+class LoadedAlignment(object):
+    """Same interface as FastaIndex, for an alignment read by Bio.AlignIO"""
+    def __init__(self, infile, format):
+        align = AlignIO.read(infile, format=format)
+        self.ids = [record.id for record in align]
+        self.seqs = [str(record.seq) for record in align]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_alignment_length(self):
+        return max((len(seq) for seq in self.seqs), default=0)
+
+    def fetch(self, i, start, stop):
+        return self.seqs[i][start:stop]
+
+    def close(self):
+        pass
+
+
+def load_alignment(infile, format=None, lazy=True):
+    """Index the fasta file if possible, else read the whole alignment."""
+    filename = getattr(infile, 'name', infile)
+    format = format or filename2format(filename)
+    if lazy and format == 'fasta' and isinstance(filename, str) \
+            and op.isfile(filename):
+        try:
+            align = FastaIndex(filename)
+            if hasattr(infile, 'close'):
+                infile.close()
+            return align
+        except ValueError as err:
+            logging.warning('Cannot index %s (%s): loading it all.', filename, err)
+    return LoadedAlignment(infile, format)
+
+
+def parse_range(rangestr, length, base=1, stepwidth=1):
+    """'start:end' (end excluded) -> 0-based (start, end), multiplied by stepwidth"""
+    parts = rangestr.split(':')
+    if not parts[0]: parts[0] = base
+    if len(parts) < 2 or not parts[1]: parts[1] = length // stepwidth + base
+    return tuple(min((int(pos)-base)*stepwidth, length) for pos in parts[:2])
+
+
+def pager():
+    """Pipe the output into the pager (less by default)"""
+    from subprocess import Popen, PIPE
+    cmd = os.environ.get('PAGER', 'less -RS')
+    proc = Popen(cmd, shell=True, stdin=PIPE, universal_newlines=True)
+    return proc
+
+
 #def printblock(records, namefmt, pad):
 
 def printal(infile, wrap=False, format=None, slice=None, alphabet='codon',
-            start0=False):
+            start0=False, rows=None, lazy=True, page=False, out=None):
+    """rows: select records 'start:end' (1-based, end excluded, unless start0)
+    lazy: for a fasta file, only read the displayed part (see FastaIndex).
+    page: display through the $PAGER, as the blocks are built."""
     padlen = 4
     pad = padlen*' '
     #unit_delim = '.'
@@ -293,46 +492,44 @@ def printal(infile, wrap=False, format=None, slice=None, alphabet='codon',
     ruler_start_reg = re.compile(r'\d+')
 
     #with open(infile) as al:
-    align = AlignIO.read(infile, format=(format or filename2format(infile.name)))
+    align = load_alignment(infile, format, lazy)
 
     length = align.get_alignment_length()
-    name_len = max(len(record.id) for record in align)
+    start1 = int(not start0)
+    rowstart, rowend = parse_range(rows, len(align), start1) if rows \
+                       else (0, len(align))
+    records = range(rowstart, rowend)
+    if not records:
+        return
+    name_len = max(len(align.ids[i]) for i in records)
 
     if alphabet == 'codon':
         stepwidth = 3
-        colorize = colorizerecord
-        residu2col = CODON2COL
+        residu2col, unknown = CODON2COL, RED
     elif alphabet == 'aa3':
         stepwidth = 3
-        colorize = colorizerecord
-        residu2col = AA32COL
+        residu2col, unknown = AA32COL, RED
     elif alphabet == 'nucl':
         stepwidth = 1
-        colorize = fastcolorizerecord
-        residu2col = nucl2col
+        residu2col, unknown = nucl2col, ''
     elif alphabet == 'aa':
         stepwidth = 1
-        colorize = fastcolorizerecord
-        residu2col = AA2COL
+        residu2col, unknown = AA2COL, ''
+    colortable = ColorTable(residu2col, stepwidth, unknown)
 
-
-    start1 = int(not start0)
-    ruler = makeruler(length, base=start1, stepwidth=stepwidth)
-    
     namefmt = '%%%ds' % name_len
 
     if slice:
         # -1 because coords are taken in base 1
-        sliceparts = slice.split(':')
-        if not sliceparts[0]: sliceparts[0] = 0
-        if not sliceparts[1]: sliceparts[1] = length
-
-        slstart, slend = [(int(pos)-start1)*stepwidth for pos in sliceparts]
-
+        slstart, slend = parse_range(slice, length, start1, stepwidth)
         length = slend - slstart
     else:
         slstart, slend = 0, length
 
+    pager_proc = None
+    if page:
+        pager_proc = pager()
+        out = pager_proc.stdin
     try:
         if wrap:
             from subprocess import check_output
@@ -356,28 +553,32 @@ def printal(infile, wrap=False, format=None, slice=None, alphabet='codon',
             start += slstart
             stop = min(stop + slstart, slend)
 
-            blockruler = ruler[start:stop]
+            # Also the following characters, to see if the number continues.
+            ruler = makeruler(align.get_alignment_length(), base=start1,
+                              stepwidth=stepwidth, start=start, stop=stop + 20)
+            blockruler = ruler[:stop-start]
 
             # If the end of the previous column number was split, add it here
             rulerline = ' '*(name_len + padlen - len(prev_block_number)) \
                         + prev_block_number + blockruler
 
             end_match = ruler_end_reg.search(blockruler)
-            continue_match = ruler_start_reg.match(ruler[stop:])
+            continue_match = ruler_start_reg.match(ruler[stop-start:])
             if end_match and continue_match:
                 prev_block_number = end_match.group()
                 rulerline = rulerline.rstrip('0123456789')
             else:
                 prev_block_number = ''
 
-            print(rulerline)
+            lines = [rulerline]
             #print(blockruler.rjust(endcol))
             
-            for record in align:
-                print(namefmt % record.id + pad + \
-                        colorize(record[start:stop], residu2col) + RESET)
+            for i in records:
+                lines.append(namefmt % align.ids[i] + pad + \
+                        colortable.colorize(align.fetch(i, start, stop)) + RESET)
             if block < nblocks-1:
-                print('')
+                lines.append('')
+            print('\n'.join(lines), file=out)
 
 
         #else:
@@ -390,6 +591,17 @@ def printal(infile, wrap=False, format=None, slice=None, alphabet='codon',
         #with open(devnull, 'w') as dn:
         #    print(err, file=dn)
         pass
+    finally:
+        align.close()
+        if pager_proc is not None:
+            try:
+                pager_proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            pager_proc.wait()
+
+    if colortable.unknown_residus and stepwidth > 1:
+        logging.warning("Unknown codons: %s", ' '.join(colortable.unknown_residus))
 
 
 if __name__ == '__main__':
@@ -417,6 +629,13 @@ if __name__ == '__main__':
                         help='Colorize and index alignment by 3-letters amino-acids.')
     parser.add_argument('-0', '--start0', action='store_true',
                         help='Use 0-based coordinates.')
+    parser.add_argument('-r', '--rows',
+                        help='select records (start:end). 1-based, end excluded')
+    parser.add_argument('-E', '--eager', action='store_false', dest='lazy',
+                        help='Load the whole alignment instead of indexing '\
+                             'the fasta file (.fai)')
+    parser.add_argument('-p', '--page', action='store_true',
+                        help='Display through $PAGER (default: less -RS)')
     
     args = parser.parse_args()
     printal(**vars(args))
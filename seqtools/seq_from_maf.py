@@ -1,8 +1,19 @@
 #!/usr/bin/env python3
 
 
+"""Extract sequences from a MAF multiple alignment.
+
+With `-r/--region`, a block index of the reference sequence is built once
+(saved as '<maffile>.idx', bgzip-aware), then only the blocks overlapping the
+regions are read, and the aligned sequences are projected on the reference
+coordinates.
+"""
+
+
 import re
+import os.path as op
 import argparse
+import numpy as np
 import logging
 #logging.basicConfig(format="%(levelname)s:%(funcName)s:%(message)s")
 logger = logging.getLogger(__name__)
@@ -63,8 +74,8 @@ def process_maf(maffilename, select_pattern=''):
 def get_seq(maffilename, seqname_start, ignore_overlap=False):
     """Retrieve all sequences from a species (for eg), check if there are
     overlapping fragments on the reference genome, and concatenate sequences."""
-    sequence, prev_seqname, prev_start, prev_length, prev_line = \
-          '',         None,          0,           0,      None
+    sequences, prev_seqname, prev_start, prev_length, prev_line = \
+          [],         None,          0,           0,      None
     with open(maffilename) as maf:
         for lineno, line in enumerate(maf):
             if line.startswith('s ' + seqname_start):
@@ -97,13 +108,13 @@ def get_seq(maffilename, seqname_start, ignore_overlap=False):
                         raise AssertionError(msg)
 
                 #sp['seq'] += 'N'*gap_size + seq
-                sequence += seq
+                sequences.append(seq)
                 prev_seqname = seqname
                 prev_start = start
                 prev_length = length
                 prev_line = line.rstrip()
                 prev_lineno = lineno
-    return sequence
+    return ''.join(sequences)
 
                 #else:
                 #    sp['seq'] = seq
@@ -145,6 +156,175 @@ def get_seq2(maffilename, select_seq='', ref='hg19'):
 
 
 
+def is_bgzip(filename):
+    return filename.endswith('.gz') or filename.endswith('.bgz')
+
+
+def open_maf(maffilename):
+    """Open in binary mode, with seekable (virtual) offsets for bgzip files."""
+    if is_bgzip(maffilename):
+        from Bio import bgzf
+        try:
+            return bgzf.BgzfReader(maffilename, 'rb')
+        except ValueError as err:
+            err.args += ("%s must be compressed with bgzip, not gzip." % maffilename,)
+            raise
+    return open(maffilename, 'rb')
+
+
+class MafIndex(object):
+    """Coordinates of each alignment block on the reference sequence, and
+    (virtual) file offset of the block."""
+
+    def __init__(self, ref, blocks):
+        self.ref = ref
+        # chrom -> (sorted starts, ends, cumulative max of ends, offsets)
+        self.chroms = {}
+        bychrom = {}
+        for chrom, start, end, offset in blocks:
+            bychrom.setdefault(chrom, []).append((start, end, offset))
+        for chrom, chromblocks in bychrom.items():
+            chromblocks.sort()
+            starts, ends, offsets = (np.array(col, dtype=np.int64)
+                                     for col in zip(*chromblocks))
+            self.chroms[chrom] = (starts, ends, np.maximum.accumulate(ends),
+                                  offsets)
+
+    @classmethod
+    def build(cls, maffilename, ref='hg19'):
+        """Scan the MAF file once."""
+        blocks = []
+        refprefix = (ref + '.').encode()
+        with open_maf(maffilename) as maf:
+            offset = None
+            while True:
+                pos = maf.tell()
+                line = maf.readline()
+                if not line:
+                    break
+                if line.startswith(b'a'):
+                    offset = pos
+                elif offset is not None and line.startswith(b's ' + refprefix):
+                    _, src, start, size, strand, srcsize, _ = line.split()
+                    start, size = int(start), int(size)
+                    if strand == b'-':
+                        start = int(srcsize) - start - size
+                    blocks.append((src[len(refprefix):].decode(), start,
+                                   start + size, offset))
+                    offset = None  # Only the first reference row.
+        return cls(ref, blocks)
+
+    def save(self, indexfile):
+        with open(indexfile, 'w') as out:
+            out.write('#ref=%s\n' % self.ref)
+            for chrom, (starts, ends, _, offsets) in sorted(self.chroms.items()):
+                for row in zip(starts, ends, offsets):
+                    out.write('%s\t%d\t%d\t%d\n' % ((chrom,) + row))
+
+    @classmethod
+    def load(cls, indexfile):
+        with open(indexfile) as f:
+            ref = f.readline().rstrip()[len('#ref='):]
+            blocks = []
+            for line in f:
+                chrom, start, end, offset = line.split()
+                blocks.append((chrom, int(start), int(end), int(offset)))
+        return cls(ref, blocks)
+
+    @classmethod
+    def load_or_build(cls, maffilename, ref='hg19', indexfile=None):
+        if indexfile is None:
+            indexfile = maffilename + '.idx'
+        if op.exists(indexfile) and op.getmtime(indexfile) >= op.getmtime(maffilename):
+            index = cls.load(indexfile)
+            if index.ref == ref:
+                return index
+        logger.info('Indexing %s', maffilename)
+        index = cls.build(maffilename, ref)
+        index.save(indexfile)
+        return index
+
+    def overlapping(self, chrom, start, end):
+        """Offsets of the blocks overlapping [start, end) (0-based)."""
+        try:
+            starts, ends, maxends, offsets = self.chroms[chrom]
+        except KeyError:
+            return np.array([], dtype=np.int64)
+        first = np.searchsorted(maxends, start, side='right')
+        last = np.searchsorted(starts, end, side='left')
+        sel = np.arange(first, last)
+        return offsets[sel[ends[sel] > start]]
+
+
+def read_block(maf, offset):
+    """Return the 's' lines fields of the block at this offset."""
+    maf.seek(offset)
+    maf.readline()  # 'a' line.
+    rows = []
+    for line in iter(maf.readline, b''):
+        if not line.strip() or line.startswith(b'a'):
+            break
+        if line.startswith(b's'):
+            rows.append(line.split()[1:])
+    return rows
+
+
+def extract_regions(maffilename, regions, ref='hg19', select_pattern='',
+                    index=None, gap=b'-'):
+    """Sequences aligned to each region of the reference, projected on the
+    reference coordinates (columns with a gap in the reference are dropped).
+
+    - regions: list of (chrom, start, end), 0-based, end excluded.
+
+    Return a list (one per region) of dictionaries {species: sequence}.
+    """
+    if index is None:
+        index = MafIndex.load_or_build(maffilename, ref)
+    select_regex = re.compile(select_pattern)
+    refprefix = (ref + '.').encode()
+    results = []
+    with open_maf(maffilename) as maf:
+        for chrom, start, end in regions:
+            length = end - start
+            # species -> preallocated buffer
+            buffers = {}
+            for offset in index.overlapping(chrom, start, end):
+                rows = read_block(maf, offset)
+                refrows = [row for row in rows if row[0].startswith(refprefix)]
+                if not refrows:
+                    continue
+                _, bstart, _, strand, _, reftext = refrows[0]
+                if strand != b'+':
+                    logger.warning('Skip block at %d: reference on minus strand.', offset)
+                    continue
+                refcols = np.frombuffer(reftext, dtype='S1')
+                # Reference position of each non-gap column.
+                aligned = np.flatnonzero(refcols != b'-')
+                positions = int(bstart) + np.arange(len(aligned)) - start
+                inside = (positions >= 0) & (positions < length)
+                cols, positions = aligned[inside], positions[inside]
+
+                for src, _, _, _, _, text in rows:
+                    species = src.split(b'.', 1)[0].decode()
+                    if not select_regex.match(src.decode()):
+                        continue
+                    try:
+                        buf = buffers[species]
+                    except KeyError:
+                        buf = buffers[species] = np.full(length, gap, dtype='S1')
+                    buf[positions] = np.frombuffer(text, dtype='S1')[cols]
+            results.append({species: buf.tobytes().decode()
+                            for species, buf in buffers.items()})
+    return results
+
+
+def parse_region(region):
+    """'chr1:1001-2000' (1-based, inclusive) -> ('chr1', 1000, 2000)"""
+    chrom, coords = region.rsplit(':', 1)
+    start, end = coords.replace(',', '').split('-')
+    return chrom, int(start) - 1, int(end)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument('maffilename')
@@ -153,9 +333,27 @@ if __name__ == '__main__':
     parser.add_argument('--ignore-overlap', action='store_true', 
                         help='do not raise an error if two consecutive '\
                              'sequences overlap on the target genome.')
+    parser.add_argument('-r', '--region', action='append', type=parse_region,
+                        help=('Extract the alignment of this region of the '
+                              'reference (chrom:start-end, 1-based). Then '
+                              '`seqname_start` is a regex selecting the '
+                              'sequences, e.g "hg19|panTro". Repeatable.'))
+    parser.add_argument('--ref', default='hg19',
+                        help='reference assembly for --region [%(default)s]')
     
     args = parser.parse_args()
-    sequence = get_seq(**vars(args))
-    print('>%s from %s' % (args.seqname_start, args.maffilename))
-    print(sequence.replace('-', ''))
+    if args.region:
+        logging.basicConfig(format="%(levelname)s:%(funcName)s:%(message)s",
+                            level=logging.INFO)
+        all_sequences = extract_regions(args.maffilename, args.region,
+                                        args.ref, args.seqname_start)
+        for (chrom, start, end), sequences in zip(args.region, all_sequences):
+            for species, seq in sequences.items():
+                print('>%s %s:%d-%d' % (species, chrom, start+1, end))
+                print(seq)
+    else:
+        sequence = get_seq(args.maffilename, args.seqname_start,
+                           args.ignore_overlap)
+        print('>%s from %s' % (args.seqname_start, args.maffilename))
+        print(sequence.replace('-', ''))
 
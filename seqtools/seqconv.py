@@ -4,7 +4,12 @@
 
 from sys import stdin, stdout
 import argparse
-from Bio import AlignIO
+try:
+    from objectools import lazy_import
+except ImportError:  # Run as a standalone script
+    from Bio import AlignIO
+else:
+    AlignIO = lazy_import('Bio.AlignIO')
 
 
 def write_phylip_sequential_relaxed(al, outfile):
@@ -4,7 +4,15 @@
 from sys import stdout, stdin
 import re
 import argparse
-from Bio import SeqIO, Seq, AlignIO, Align
+try:
+    from objectools import lazy_import
+except ImportError:  # Run as a standalone script
+    from Bio import SeqIO, Seq, AlignIO, Align
+else:
+    SeqIO = lazy_import('Bio.SeqIO')
+    Seq = lazy_import('Bio.Seq')
+    AlignIO = lazy_import('Bio.AlignIO')
+    Align = lazy_import('Bio.Align')
 
 
 def seqrecords_grep(records_iterable, pattern, negate=False):
@@ -24,8 +24,9 @@ from sys import stdin, stdout
 import os.path as op
 import re
 import argparse
-from Bio import SeqIO
-from genomicustools.identify import ultimate_seq2sp, SP2GENEID
+from objectools import lazy_import
+SeqIO = lazy_import('Bio.SeqIO')
+from genomicustools.identify import ultimate_seq2sp, SP2GENEID, assembly2species
 
 
 ENSEMBL_VERSION = 87
@@ -184,7 +185,7 @@ def specify(inputfile, outfile, input_fmt=DEFAULT_IN_FMT,
     if file_fmt is None:
         ext = op.splitext(inputfile)[1]
         file_fmt = EXT2FMT[ext]
-    transforms = DEFAULT_TRANSFORMS
+    transforms = dict(DEFAULT_TRANSFORMS)
     if transform is not None:
         for arg in transform:
             key, val = arg.split('=', 1)
@@ -212,7 +213,13 @@ def specify(inputfile, outfile, input_fmt=DEFAULT_IN_FMT,
                     outfile, file_fmt)
 
 
-if __name__ == '__main__':
+def preload(args):
+    """Load the species conversion tables (for a persistent server, see cmdserver)"""
+    if not assembly2species.loaded:
+        assembly2species.load()
+
+
+def make_parser():
     parser = argparse.ArgumentParser(description=__doc__, epilog=EXAMPLES)
     parser.add_argument('inputfile', help='"-" for stdin (requires -f).')
     parser.add_argument('outfile', nargs='?', default=stdout)
@@ -226,6 +233,13 @@ if __name__ == '__main__':
                         help='[automatic detection of nwk/fasta/phylip unless using stdin]')
     parser.add_argument('-e', '--ensembl-version', type=int,
                         default=ENSEMBL_VERSION, help='[%(default)r]')
+    return parser
+
 
-    args = parser.parse_args()
+def main(argv=None):
+    args = make_parser().parse_args(argv)
     specify(**vars(args))
+
+
+if __name__ == '__main__':
+    main()
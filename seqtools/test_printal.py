@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import os
+from io import StringIO
+import pytest
+AlignIO = pytest.importorskip('Bio.AlignIO')
+from seqtools.printal import FastaIndex, makeruler, printal
+
+
+# Sequences wrapped at 10 characters (the last line being shorter).
+SEQS = [('s1', 'ATGGCCTAAG' 'CGTAGCTAGG' 'ATCG'),
+        ('seq2 description', 'ATG---AAAG' 'CGT--CTAGG' 'ATTG'),
+        ('s3', 'ATGGCCTTAG' 'CGTAGCTAGG' 'A-CG'),
+        ('s4', 'NTGGCCTAAG' 'CGTAGCTAGC' 'ATCG')]
+
+
+@pytest.fixture
+def fastafile(tmp_path):
+    path = tmp_path / 'al.fa'
+    with open(path, 'w') as out:
+        for name, seq in SEQS:
+            out.write('>%s\n' % name)
+            out.write(''.join(seq[i:i+10] + '\n' for i in range(0, len(seq), 10)))
+    return str(path)
+
+
+def test_index_built_then_reused(fastafile, monkeypatch):
+    index = FastaIndex(fastafile)
+    index.close()
+    with open(fastafile + '.fai') as f:
+        assert f.read().splitlines()[:2] == ['s1\t24\t4\t10\t11',
+                                             'seq2\t24\t49\t10\t11']
+
+    def fail(self):
+        raise AssertionError('Index rebuilt')
+    monkeypatch.setattr(FastaIndex, 'build', fail)
+    index = FastaIndex(fastafile)
+    assert index.ids == ['s1', 'seq2', 's3', 's4']
+    assert index.get_alignment_length() == 24
+    index.close()
+
+    # Outdated index
+    fai_mtime = os.stat(fastafile + '.fai').st_mtime_ns
+    os.utime(fastafile, ns=(fai_mtime + 10**9, fai_mtime + 10**9))
+    with pytest.raises(AssertionError, match='Index rebuilt'):
+        FastaIndex(fastafile)
+
+
+@pytest.mark.parametrize('start,stop', [(0, 24), (0, 10), (3, 17), (10, 20),
+                                        (9, 11), (19, 30), (12, 12), (23, 24)])
+def test_fetch_same_as_alignio(fastafile, start, stop):
+    align = AlignIO.read(fastafile, 'fasta')
+    index = FastaIndex(fastafile)
+    try:
+        for i, record in enumerate(align[1:3], start=1):
+            assert index.ids[i] == record.id
+            assert index.fetch(i, start, stop) == str(record.seq)[start:stop]
+    finally:
+        index.close()
+
+
+@pytest.mark.parametrize('length', [7, 30, 101, 1500])
+@pytest.mark.parametrize('base,stepwidth', [(1, 1), (0, 1), (1, 3)])
+def test_ruler_window(length, base, stepwidth):
+    full = makeruler(length, base, stepwidth)
+    for start in range(0, len(full) + 5, 7):
+        for stop in (start, start + 1, start + 13, start + 60, None):
+            assert makeruler(length, base, stepwidth, start, stop) == \
+                    full[start:stop], (start, stop)
+
+
+@pytest.mark.parametrize('options,names', [
+    (dict(), ['s1', 'seq2', 's3', 's4']),
+    (dict(rows='2:4'), ['seq2', 's3']),
+    (dict(rows='2:4', slice='2:7'), ['seq2', 's3']),
+    (dict(alphabet='nucl', rows='1:3', slice='11:'), ['s1', 'seq2'])])
+def test_lazy_same_as_eager(fastafile, options, names):
+    options = dict(dict(alphabet='codon'), **options)
+    outputs = []
+    for lazy in (True, False):
+        out = StringIO()
+        printal(fastafile, lazy=lazy, out=out, **options)
+        outputs.append(out.getvalue())
+    assert os.path.exists(fastafile + '.fai')  # The lazy mode used the index.
+    assert outputs[0] == outputs[1]
+    lines = outputs[0].splitlines()
+    assert [line.split()[0] for line in lines[1:]] == names
+
+
+def test_paged_same_as_eager(fastafile, monkeypatch, capfd):
+    monkeypatch.setenv('PAGER', 'cat')
+    out = StringIO()
+    printal(fastafile, rows='2:4', slice='2:7', lazy=False, out=out)
+    capfd.readouterr()
+    printal(fastafile, rows='2:4', slice='2:7', page=True)
+    assert capfd.readouterr().out == out.getvalue()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import pytest
+from seqtools.seq_from_maf import MafIndex, extract_regions, parse_region
+
+
+# 3 blocks on hg19.chr1: [10, 18), [18, 24) then [30, 36) (unaligned 24-30),
+# with gaps in the reference rows, and one block on chr2.
+MAF = """##maf version=1
+# comment
+
+a score=1
+s hg19.chr1     10 8 + 100 ACG--TACGT
+s panTro2.chr1  12 9 + 100 ACGTTTA-GT
+s mm9.chr4      40 7 + 200 A-GTT-ACG-
+
+a score=2
+s hg19.chr1     18 6 + 100 GGC-CAT
+s panTro2.chr1  21 6 + 100 GGCA-AT
+
+a score=3
+s hg19.chr2      0 5 + 50 TTTTT
+s panTro2.chr2   0 5 + 50 TTATT
+
+a score=4
+s hg19.chr1     30 6 + 100 CCGGAA
+s mm9.chr4      60 6 + 200 CCG-AA
+"""
+
+
+def linear_scan(maffile, chrom, start, end, ref='hg19'):
+    """Region extraction by reading all the blocks."""
+    length = end - start
+    sequences = {}
+    with open(maffile) as f:
+        blocks = f.read().split('\na ')
+    for block in blocks:
+        rows = [line.split()[1:] for line in block.splitlines()
+                if line.startswith('s ')]
+        if not rows or rows[0][0] != '%s.%s' % (ref, chrom):
+            continue
+        refpos = int(rows[0][1])
+        for col, char in enumerate(rows[0][5]):
+            if char == '-':
+                continue
+            if start <= refpos < end:
+                for src, *_, text in rows:
+                    seq = sequences.setdefault(src.split('.')[0], ['-']*length)
+                    seq[refpos - start] = text[col]
+            refpos += 1
+    return {sp: ''.join(seq) for sp, seq in sequences.items()}
+
+
+@pytest.fixture
+def maffile(tmp_path):
+    path = tmp_path / 'test.maf'
+    path.write_text(MAF)
+    return str(path)
+
+
+REGIONS = [('chr1', 10, 18),   # One whole block
+           ('chr1', 14, 21),   # Across a block boundary
+           ('chr1', 20, 33),   # Across an unaligned gap
+           ('chr1', 0, 100),   # All
+           ('chr1', 40, 50),   # Nothing
+           ('chr2', 1, 4),
+           ('chr3', 0, 10)]
+
+
+def test_extract_regions(maffile):
+    index = MafIndex.build(maffile)
+    assert sorted(index.chroms) == ['chr1', 'chr2']
+    results = extract_regions(maffile, REGIONS, index=index)
+    for (chrom, start, end), sequences in zip(REGIONS, results):
+        assert sequences == linear_scan(maffile, chrom, start, end)
+    assert results[1] == {'hg19': 'ACGTGGC', 'panTro2': 'A-GTGGC',
+                          'mm9': 'ACG----'}
+
+
+def test_index_persistence_and_bgzf(maffile, tmp_path):
+    index = MafIndex.load_or_build(maffile)
+    reloaded = MafIndex.load(maffile + '.idx')
+    assert reloaded.ref == 'hg19'
+    for chrom, arrays in index.chroms.items():
+        assert all((a == b).all() for a, b in zip(arrays, reloaded.chroms[chrom]))
+    # Another reference: rebuilt.
+    assert MafIndex.load_or_build(maffile, ref='panTro2').ref == 'panTro2'
+
+    bgzf = pytest.importorskip('Bio.bgzf')
+    gzfile = str(tmp_path / 'test.maf.gz')
+    with bgzf.BgzfWriter(gzfile, 'wb') as out:
+        out.write(MAF.encode())
+    assert extract_regions(gzfile, REGIONS) == extract_regions(maffile, REGIONS)
+
+
+def test_parse_region():
+    assert parse_region('chr1:1,001-2000') == ('chr1', 1000, 2000)
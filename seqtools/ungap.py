@@ -8,7 +8,12 @@
 from sys import stdin, stdout
 import argparse as ap
 from itertools import islice
-from Bio import AlignIO
+try:
+    from objectools import lazy_import
+except ImportError:  # Run as a standalone script
+    from Bio import AlignIO
+else:
+    AlignIO = lazy_import('Bio.AlignIO')
 import logging
 #logging.basicConfig(format="%(levelname)s:%(funcName)s:%(message)s",
 #                    level=logging.INFO)
@@ -9,6 +9,7 @@ import re
 from collections import defaultdict
 import ete3
 import argparse
+from dendro.bates import dfw_descendants_generalized
 import logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -43,12 +44,18 @@ def load_descent(nodesdmp, cut='subspecies'):
 
 
 def build_nodes_ete3(descent, id2names, node, ID, exclude=EXCLUDE):
-    children = descent.get(ID, set())
-    for child in children:
-        childname = id2names.get(child)
-        if not exclude or not re.search(exclude, childname):
-            nextnode = node.add_child(name=childname)
-            build_nodes_ete3(descent, id2names, nextnode, child, exclude)
+    """Add the descendants of ID below the ete3 node (iteratively, so that
+    deep taxonomies do not hit the recursion limit)."""
+    def get_children(descent, ID):
+        return [child for child in descent.get(ID, set())
+                if not exclude or not re.search(exclude, id2names.get(child))]
+
+    id2nodes = {ID: node}
+    for parentID, children in dfw_descendants_generalized(descent, get_children,
+                                                          queue=[ID]):
+        parentnode = id2nodes.pop(parentID)
+        for child in children:
+            id2nodes[child] = parentnode.add_child(name=id2names.get(child))
 
 def build_tree_ete3(descent, id2names, names2id, taxon, exclude=EXCLUDE):
     tree = ete3.Tree(name=taxon)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import os
+import sys
+import pytest
+from objectools import lazy_import, LazyModule
+from bench_imports import ENTRY_POINTS, interpreter_startup, \
+                          bench_entry_point, python_env
+
+# Wall-clock budgets depend on the machine and its load: only checked on
+# demand (otherwise, run ./bench_imports.py).
+CHECK_BUDGET = os.environ.get('ORGANON_BENCH_IMPORTS', '') not in ('', '0')
+
+
+def test_lazy_import():
+    sys.modules.pop('colorsys', None)
+    colorsys = lazy_import('colorsys')
+    assert isinstance(colorsys, LazyModule)
+    assert 'colorsys' not in sys.modules
+    assert colorsys.rgb_to_hsv(1, 0, 0) == (0, 1, 1)
+    assert 'colorsys' in sys.modules
+    # Already imported: return the module itself.
+    assert not isinstance(lazy_import('colorsys'), LazyModule)
+
+
+def test_lazy_exports():
+    import seqtools
+    assert seqtools.algrep.__module__ == 'seqtools.seqname_grep'
+    with pytest.raises(AttributeError):
+        seqtools.no_such_function
+
+
+@pytest.mark.parametrize('module', sorted(ENTRY_POINTS))
+def test_entry_point_startup(module):
+    env = python_env()
+    repeat = 3 if CHECK_BUDGET else 1
+    elapsed, heavy, error = bench_entry_point(module, repeat=repeat, env=env)
+    if error is not None:
+        pytest.skip('%s: %s' % (module, error))
+    assert not heavy, 'heavy modules imported at startup'
+    if CHECK_BUDGET:
+        assert elapsed - interpreter_startup(repeat, env) <= ENTRY_POINTS[module]
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import sys
+import os
+import os.path as op
+import time
+import subprocess
+import pytest
+import cmdserver
+from cmdserver import send_request, run_command, default_socket_path, STOP
+
+pytest.importorskip('Bio')
+
+FASTA = '>s1\nATGGCCTAA\n>s2\nATG---AAA\n'
+TRANSLATED = '>s1\nMA*\n>s2\nM-K\n'
+
+
+@pytest.fixture
+def server(tmp_path):
+    socket_path = str(tmp_path / 'run' / 'server.sock')  # Directory created
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    proc = subprocess.Popen([sys.executable, '-m', 'cmdserver', 'serve',
+                             '-s', socket_path], env=env,
+                            cwd=op.dirname(op.abspath(__file__)))
+    for _ in range(200):
+        if op.exists(socket_path) or proc.poll() is not None:
+            break
+        time.sleep(0.05)
+    if not op.exists(socket_path):
+        proc.kill()
+        pytest.skip('The server did not start.')
+    yield socket_path
+    send_request(STOP, socket_path=socket_path)
+    proc.wait(10)
+    assert not op.exists(socket_path)
+
+
+def test_server_request(server, tmp_path):
+    (tmp_path / 'in.fa').write_text(FASTA)
+    with open(tmp_path / 'out.txt', 'w') as out, \
+            open(tmp_path / 'err.txt', 'w') as err:
+        fds = (0, out.fileno(), err.fileno())
+        # Relative paths, in the client directory; then on the client stdout.
+        for argv in (['in.fa', 'out.fa'], ['in.fa']):
+            assert send_request('fasta_translate', argv, cwd=str(tmp_path),
+                                fds=fds, socket_path=server) == 0
+        assert send_request('fasta_translate', ['--bad'], cwd=str(tmp_path),
+                            fds=fds, socket_path=server) == 2
+        assert send_request('fasta_translate', ['missing.fa', 'out2.fa'],
+                            cwd=str(tmp_path), fds=fds, socket_path=server) == 1
+    assert (tmp_path / 'out.fa').read_text() == TRANSLATED
+    assert (tmp_path / 'out.txt').read_text() == TRANSLATED
+    errors = (tmp_path / 'err.txt').read_text()
+    assert 'unrecognized arguments: --bad' in errors
+    assert 'FileNotFoundError' in errors
+
+
+def test_run_command_without_server(tmp_path):
+    (tmp_path / 'in.fa').write_text(FASTA)
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        assert run_command('fasta_translate', ['in.fa', 'out.fa'],
+                           socket_path=str(tmp_path / 'none.sock')) == 0
+    finally:
+        os.chdir(cwd)
+    assert (tmp_path / 'out.fa').read_text() == TRANSLATED
+
+
+def test_private_socket_dir(server, monkeypatch):
+    assert os.stat(op.dirname(server)).st_mode & 0o777 == 0o700
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    assert default_socket_path() == '/tmp/organon-cmdserver-%d/server.sock' \
+                                    % os.getuid()
+
+
+def test_server_of_another_user(server, tmp_path, monkeypatch):
+    (tmp_path / 'in.fa').write_text(FASTA)
+    monkeypatch.setattr(cmdserver.os, 'getuid', lambda: os.geteuid() + 1)
+    with pytest.raises(PermissionError):
+        send_request('fasta_translate', ['in.fa', 'out.fa'], cwd=str(tmp_path),
+                     socket_path=server)
+    assert not (tmp_path / 'out.fa').exists()
+    monkeypatch.chdir(tmp_path)
+    assert run_command('fasta_translate', ['in.fa', 'out.fa'],
+                       socket_path=server) == 0  # Locally
+    assert (tmp_path / 'out.fa').read_text() == TRANSLATED
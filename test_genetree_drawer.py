@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import random
+from types import SimpleNamespace
+from collections import namedtuple
+import pytest
+ete3 = pytest.importorskip('ete3')
+import genetree_drawer
+from genetree_drawer import ForkSifter, GenetreeDrawer, run_batch
+
+
+# Species tree A -> (B, C), B -> (B1, B2): (x, y, width) of each taxon.
+SPECIES_CHILDREN = {'A': ['B', 'C'], 'B': ['B1', 'B2']}
+SPECIES_COORDS = {'A': (0, 5, 2.), 'B': (1, 7, 2.), 'C': (2, 2, 2.),
+                  'B1': (2, 8, 1.), 'B2': (2, 6, 1.)}
+
+
+def random_genetree(rng, taxon='A', depth=0):
+    """Return the root, and fill taxa and events of the nodes."""
+    node = ete3.TreeNode()
+    node.add_features(taxon=taxon)
+    if depth < 6 and rng.random() < 0.4:
+        node.add_features(event='dup')
+        for _ in range(rng.randint(2, 3)):
+            node.add_child(random_genetree(rng, taxon, depth+1))
+    elif taxon in SPECIES_CHILDREN:
+        node.add_features(event='spe')
+        for child_taxon in SPECIES_CHILDREN[taxon]:
+            if rng.random() < 0.9:  # Gene loss otherwise
+                node.add_child(random_genetree(rng, child_taxon, depth+1))
+    else:
+        node.add_features(event='leaf')
+    return node
+
+
+def brute_force_crossings(sifter, genetrees):
+    """Count from scratch, with the current children order of the sifter."""
+    index = {node: i for i, node in enumerate(sifter.nodes)}
+    def children(node):
+        i = index[node]
+        if i in sifter.children:
+            return [sifter.nodes[ch] for ch in sifter.children[i]]
+        return node.children
+
+    slots = []
+    def postorder(node):
+        for ch in children(node):
+            postorder(ch)
+        if node.event in ('spe', 'leaf'):
+            slots.append(node)
+    for genetree in genetrees:
+        postorder(genetree)
+
+    ranks, counts = {}, {}
+    for node in slots:
+        ranks[node] = counts.get(node.taxon, 0)
+        counts[node.taxon] = ranks[node] + 1
+    def y(node):
+        _, taxon_y, width = SPECIES_COORDS[node.taxon]
+        return taxon_y - width * (ranks[node] + 1) / (counts[node.taxon] + 1)
+
+    edges = {}  # start taxon -> [(y_start, y_end)]
+    for node in slots:
+        if node.event != 'spe':
+            continue
+        stack = list(node.children)
+        while stack:
+            ch = stack.pop()
+            if ch.event in ('spe', 'leaf'):
+                edges.setdefault(node.taxon, []).append((y(node), y(ch)))
+            else:
+                stack.extend(ch.children)
+    return sum(1 for group in edges.values() for a in group for b in group
+               if a[0] < b[0] and a[1] > b[1])
+
+
+def make_sifter(seed):
+    rng = random.Random(seed)
+    genetrees = [random_genetree(rng) for _ in range(3)]
+    nodes = [n for tree in genetrees for n in tree.traverse()]
+    sifter = ForkSifter(genetrees, {n: n.taxon for n in nodes},
+                        {n: n.event for n in nodes}, SPECIES_COORDS)
+    return rng, genetrees, sifter
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_incremental_crossings(seed):
+    rng, genetrees, sifter = make_sifter(seed)
+    assert sifter.crossings == brute_force_crossings(sifter, genetrees)
+    forks = sorted(sifter.children)
+    for _ in range(30):
+        if not forks:
+            break
+        fork = rng.choice(forks)
+        new_children = list(sifter.children[fork])
+        rng.shuffle(new_children)
+        sifter.reorder(fork, new_children)
+        assert sifter.crossings == brute_force_crossings(sifter, genetrees)
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_sift_does_not_increase_crossings(seed):
+    _, genetrees, sifter = make_sifter(seed)
+    before = sifter.crossings
+    after = sifter.sift()
+    assert after <= before
+    # The nodes now have the sifted children order.
+    assert after == brute_force_crossings(sifter, genetrees)
+    sifter.children.clear()
+    assert after == brute_force_crossings(sifter, genetrees)
+
+
+PhylNode = namedtuple('PhylNode', 'name distance')
+
+
+def make_phyltree():
+    """Stand-in for LibsDyogen's PhylogeneticTree, with the SPECIES_CHILDREN
+    topology."""
+    items = {parent: [(child, 1.) for child in children]
+             for parent, children in SPECIES_CHILDREN.items()}
+    parent = {child: PhylNode(p, 1.) for p, children in SPECIES_CHILDREN.items()
+              for child in children}
+    ages = {'A': 2., 'B': 1., 'C': 0., 'B1': 0., 'B2': 0.}
+    allDescendants = {}
+    for taxon in ('B1', 'B2', 'C', 'B', 'A'):
+        allDescendants[taxon] = {taxon}.union(
+                *(allDescendants[ch] for ch in SPECIES_CHILDREN.get(taxon, [])))
+    def ancestors(taxon):
+        yield taxon
+        while taxon in parent:
+            taxon = parent[taxon].name
+            yield taxon
+    def lastCommonAncestor(taxa):
+        common = set.intersection(*(set(ancestors(t)) for t in taxa))
+        return min(common, key=ages.get)
+    def getSubTree(taxa):
+        return lastCommonAncestor(taxa), {
+                p: [ch for ch in children if ch in taxa]
+                for p, children in SPECIES_CHILDREN.items() if p in taxa}
+    return SimpleNamespace(
+            root='A', items=items, parent=parent, ages=ages,
+            allNames=list(ages), listSpecies=['B1', 'B2', 'C'],
+            listAncestr=['A', 'B'], allDescendants=allDescendants,
+            species={t: allDescendants[t] & {'B1', 'B2', 'C'} for t in ages},
+            commonNames={t: [t] for t in ages},
+            lastCommonAncestor=lastCommonAncestor, getSubTree=getSubTree)
+
+
+# TreeBest formatted gene trees: 2 rooted at A, 1 rooted at B.
+GENETREES = {
+    'famA1': '((a1[&&NHX:S=B1],a2[&&NHX:S=B2])x[&&NHX:S=B:D=N],'
+             'a3[&&NHX:S=C])y[&&NHX:S=A:D=N];',
+    'famA2': '(((b1[&&NHX:S=B1],b2[&&NHX:S=B1])x[&&NHX:S=B1:D=Y],'
+             'b3[&&NHX:S=B2])y[&&NHX:S=B:D=N],b4[&&NHX:S=C])z[&&NHX:S=A:D=N];',
+    'famB': '(c1[&&NHX:S=B1],c2[&&NHX:S=B2])x[&&NHX:S=B:D=N];'}
+
+
+@pytest.fixture
+def genetree_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(genetree_drawer, 'PhylTree', SimpleNamespace(
+                        PhylogeneticTree=lambda filename: make_phyltree()))
+    files = {}
+    for name, newick in GENETREES.items():
+        files[name] = str(tmp_path / (name + '.nwk'))
+        with open(files[name], 'w') as out:
+            out.write(newick + '\n')
+    yield files
+    genetree_drawer.plt.close('all')
+
+
+def test_draw_reuses_species_tree(genetree_files):
+    gd = GenetreeDrawer(treebest=True)
+    fig = gd.draw(genetree_files['famA1'], reuse_species_tree=True)
+    assert gd.species_tree_count == 1
+    assert gd.draw(genetree_files['famA2'], reuse_species_tree=True) is fig
+    assert gd.species_tree_count == 1
+    # Different taxa
+    assert gd.draw(genetree_files['famB'], reuse_species_tree=True) is not fig
+    assert gd.species_tree_count == 2
+    # No reuse requested
+    gd.draw(genetree_files['famB'])
+    assert gd.species_tree_count == 3
+
+
+def test_run_batch_merges_pages_in_order(genetree_files, tmp_path):
+    pypdf = pytest.importorskip('pypdf')
+    order = ['famA1', 'famB', 'famA2', 'famA1']
+    outfile = str(tmp_path / 'out.pdf')
+    outputs = run_batch([genetree_files[name] for name in order], [], outfile,
+                        jobs=2, chunksize=1, treebest=True)
+    assert outputs == [outfile]
+    assert not list(tmp_path.glob('out.part*.pdf'))
+    pages = pypdf.PdfReader(outfile).pages
+    assert len(pages) == len(order)
+    for page, name in zip(pages, order):
+        assert name in page.extract_text()
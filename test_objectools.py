@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+import pytest
+from objectools import imap_window
+
+
+@pytest.mark.parametrize('ncores,chunksize', [(1, 1), (3, 1), (3, 7), (2, 100)])
+def test_imap_window_ordered(ncores, chunksize):
+    assert list(imap_window(abs, range(-50, 0), ncores, window=4,
+                            chunksize=chunksize)) == list(range(50, 0, -1))
+
+
+def test_imap_window_reads_within_window():
+    consumed = []
+    def items():
+        for i in range(100):
+            consumed.append(i)
+            yield i
+
+    results = imap_window(abs, items(), ncores=2, window=2, chunksize=3)
+    assert next(results) == 0
+    assert len(consumed) == 2 * 3
+    assert list(results) == list(range(1, 100))